@@ -1,20 +1,37 @@
 import streamlit as st
 import sys
 import queue
-import sounddevice as sd
-import vosk
 import json
 import os
 import time
 import threading
-from datetime import datetime
+import hashlib
 
 # Import direct de votre fonction
-from rag_generation import generate_answer_ollama, check_ollama
+from rag_generation import (generate_answer_ollama, check_ollama, answer_with_passages, retrieve_passages,
+                            FAQ_TABLE, QUERY_LOG)
+from job_queue import JobQueue, QueueFullError, RateLimitError, CANCELLED, FAILED
+from recording import RecordingController
+from partitions import load_corpora
+from conversation_store import ConversationStore, PAGE_SIZE, session_from_token, session_token
+from query_log import warm_up
+from profiling import PROFILING, profiled, start_sampling
+from conversation_memory import ConversationMemory
 
 # Configuration
 MODEL_PATH = "models\\fr\\vosk-model-small-fr-0.22"
 
+# Intervalle de rafraîchissement du widget de transcription en direct (s)
+LIVE_REFRESH_INTERVAL = 0.5
+
+# Mode texte seul : CHATBOT_TEXT_ONLY=1 (aucune bibliothèque audio importée,
+# interface vocale masquée). Sinon Vosk et sounddevice sont chargés au premier
+# usage de la voix, pas au démarrage.
+TEXT_ONLY = os.environ.get("CHATBOT_TEXT_ONLY") == "1"
+
+# Mesure du coût de chaque rerun (complet ou fragment) : CHATBOT_RERUN_TIMING=1
+RERUN_TIMING = os.environ.get("CHATBOT_RERUN_TIMING") == "1"
+
 # Configuration de la page
 st.set_page_config(
     page_title="Chatbot Juridique Sénégalais", 
@@ -118,20 +135,29 @@ st.markdown("""
 # Classe STT simplifiée - version thread-safe
 class StreamlitSTT:
     def __init__(self):
-        self.model = None
-        self.is_available = False
-        
-        try:
-            if os.path.exists(MODEL_PATH):
-                self.model = vosk.Model(MODEL_PATH)
-                self.is_available = True
+        self._model = None
+        # Le modèle n'est chargé qu'au premier enregistrement
+        self.is_available = not TEXT_ONLY and os.path.exists(MODEL_PATH)
+
+    @property
+    def model(self):
+        """Modèle Vosk partagé avec la transcription des fichiers envoyés, chargé au premier appel"""
+        if self._model is None and self.is_available:
+            try:
+                from audio_transcription import get_vosk_model
+                self._model = get_vosk_model(MODEL_PATH)
                 print("Modèle STT chargé avec succès")
-        except Exception as e:
-            print(f"Erreur chargement modèle STT: {e}")
+            except Exception as e:
+                print(f"Erreur chargement modèle STT: {e}")
+                self.is_available = False
+        return self._model
     
-    def transcribe_audio_continuous(self):
+    def transcribe_audio_continuous(self, controller):
         """Enregistrer et transcrire l'audio - durée illimitée avec arrêt manuel"""
-        if not self.is_available:
+        import sounddevice as sd
+        import vosk
+
+        if self.model is None:
             return "Modèle STT non disponible"
         
         # Créer un nouveau recognizer pour ce thread
@@ -159,8 +185,8 @@ class StreamlitSTT:
                 transcription = ""
                 final_result = ""
                 
-                # Enregistrer jusqu'à ce que le fichier stop soit créé
-                while not os.path.exists("stop_recording.txt"):
+                # Enregistrer jusqu'au signal d'arrêt du contrôleur
+                while not controller.should_stop():
                     try:
                         data = q.get(timeout=0.1)
                         
@@ -173,9 +199,8 @@ class StreamlitSTT:
                             partial = json.loads(rec.PartialResult())
                             if partial.get("partial"):
                                 transcription = partial["partial"]
-                                # Écrire la transcription partielle dans un fichier
-                                with open("partial_transcription.txt", "w", encoding="utf-8") as f:
-                                    f.write(transcription)
+                                # Publier la transcription partielle (en mémoire)
+                                controller.set_partial(transcription)
                     
                     except queue.Empty:
                         continue
@@ -183,12 +208,6 @@ class StreamlitSTT:
                         print(f"Erreur traitement audio: {e}")
                         break
                 
-                # Supprimer le fichier stop
-                try:
-                    os.remove("stop_recording.txt")
-                except:
-                    pass
-                
                 result_text = final_result if final_result else transcription
                 print(f"Transcription terminée: '{result_text}'")
                 return result_text.strip() if result_text else "Aucune parole détectée"
@@ -199,89 +218,220 @@ class StreamlitSTT:
 
 # Variables globales pour éviter les problèmes de threading
 STT_INSTANCE = StreamlitSTT()
-TRANSCRIPTION_FILE = "temp_transcription.txt"
+
+# File de jobs partagée entre toutes les sessions
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+JOB_QUEUE = get_job_queue()
+
+# Profileur par échantillonnage du processus (CHATBOT_SAMPLING=1, sinon rien)
+@st.cache_resource
+def get_sampler():
+    return start_sampling()
+
+get_sampler()
+
+# Au démarrage, avant la première réponse : les questions les plus fréquentes
+# du journal (CHATBOT_QUERY_LOG=1) sont rejouées (chargement de l'encodeur, de la collection Milvus
+# et des pages du chunk store)
+@st.cache_resource(show_spinner="Préchauffage des caches...")
+def warm_caches():
+    return warm_up(retrieve_passages)
+
+warm_caches()
+
+# Au démarrage : recalcul des réponses FAQ périmées dans la file, après les
+# questions des utilisateurs (relancé par FAQ_TABLE si le corpus change)
+@st.cache_resource
+def start_faq_refresh():
+    return FAQ_TABLE.refresh_stale_async(answer_with_passages, JOB_QUEUE)
+
+start_faq_refresh()
+
+# Historique persistant (SQLite) partagé entre les sessions
+@st.cache_resource
+def get_conversation_store():
+    return ConversationStore()
+
+CONVERSATIONS = get_conversation_store()
 
 # Initialisation du session state
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+if "session_id" not in st.session_state:
+    # Jeton signé gardé dans l'URL pour retrouver l'historique après redémarrage
+    # (un identifiant non signé ou modifié ouvre une nouvelle session)
+    session_id = session_from_token(st.query_params.get("sid"))
+    st.query_params["sid"] = session_token(session_id)
+    st.session_state.session_id = session_id
 
-if "current_conversation_index" not in st.session_state:
-    st.session_state.current_conversation_index = None
+if "current_conversation_id" not in st.session_state:
+    st.session_state.current_conversation_id = None
+
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
 
 if "check_transcription" not in st.session_state:
     st.session_state.check_transcription = 0
 
-if "is_recording" not in st.session_state:
-    st.session_state.is_recording = False
+if "recorder" not in st.session_state:
+    st.session_state.recorder = RecordingController()
+
+# Mémoire de la discussion en cours (questions de suivi, résumé borné)
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+
+def log_run_cost(label, start):
+    """Afficher la durée d'exécution d'un rerun si la mesure est activée"""
+    if RERUN_TIMING:
+        print(f"[rerun] {label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+@st.cache_data(ttl=30, show_spinner=False)
+def ollama_status():
+    """Statut Ollama mis en cache pour ne pas refaire l'appel HTTP à chaque rerun"""
+    return check_ollama()
 
 # Fonction de transcription avec arrêt manuel
 def record_audio_background():
     """Enregistrer l'audio en arrière-plan avec arrêt manuel"""
-    def record_thread():
+    if st.session_state.recorder.start(STT_INSTANCE.transcribe_audio_continuous):
         print("Thread d'enregistrement démarré")
-        
-        # Créer fichier de statut
-        with open("recording_status.txt", "w") as f:
-            f.write("recording")
-        
-        try:
-            result = STT_INSTANCE.transcribe_audio_continuous()
-            print(f"Transcription thread terminée: {result}")
-            
-            # Écrire le résultat dans un fichier
-            with open(TRANSCRIPTION_FILE, "w", encoding="utf-8") as f:
-                f.write(result if result else "Aucune transcription")
-                
-        except Exception as e:
-            print(f"Erreur dans thread: {e}")
-            with open(TRANSCRIPTION_FILE, "w", encoding="utf-8") as f:
-                f.write(f"Erreur: {str(e)[:50]}")
-        finally:
-            # Supprimer le fichier de statut
-            try:
-                os.remove("recording_status.txt")
-            except:
-                pass
-
-    if not os.path.exists("recording_status.txt"):
-        thread = threading.Thread(target=record_thread)
-        thread.daemon = True
-        thread.start()
 
 def stop_recording():
-    """Arrêter l'enregistrement en créant un fichier signal"""
-    with open("stop_recording.txt", "w") as f:
-        f.write("stop")
+    """Arrêter l'enregistrement via le signal du contrôleur"""
+    st.session_state.recorder.stop(timeout=1.0)
     print("Signal d'arrêt envoyé")
 
 def get_partial_transcription():
     """Récupérer la transcription partielle en cours"""
-    if os.path.exists("partial_transcription.txt"):
-        try:
-            with open("partial_transcription.txt", "r", encoding="utf-8") as f:
-                return f.read().strip()
-        except:
-            return None
-    return None
+    partial, _ = st.session_state.recorder.get_partial()
+    return partial or None
 
 def get_transcription_result():
     """Vérifier s'il y a une nouvelle transcription"""
-    if os.path.exists(TRANSCRIPTION_FILE):
+    return st.session_state.recorder.pop_result()
+
+def transcribe_uploaded_audio():
+    """Transcription côté serveur d'un audio envoyé par le navigateur"""
+    if hasattr(st, "audio_input"):
+        audio = st.audio_input("Ou enregistrez votre question", key="audio_upload")
+    else:
+        audio = st.file_uploader("Ou envoyez un fichier audio", type=["wav", "webm", "ogg", "mp3", "m4a"],
+                                 key="audio_upload")
+    if audio is None:
+        return None
+
+    data = audio.getvalue()
+    digest = hashlib.sha1(data).hexdigest()
+    # Ne pas retranscrire le même audio à chaque rerun
+    if st.session_state.get("last_audio_digest") == digest:
+        return None
+    st.session_state.last_audio_digest = digest
+
+    with st.spinner("Transcription de l'audio..."):
         try:
-            with open(TRANSCRIPTION_FILE, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-            os.remove(TRANSCRIPTION_FILE)  # Supprimer après lecture
-            return content
-        except:
-            return None
-    return None
+            from audio_transcription import transcribe_audio_bytes
+            return transcribe_audio_bytes(data) or "Aucune parole détectée"
+        except Exception as e:
+            return f"Erreur transcription: {str(e)[:50]}"
 
 def is_recording():
     """Vérifier si l'enregistrement est en cours"""
-    return os.path.exists("recording_status.txt")
+    return st.session_state.recorder.is_recording()
+
+@st.fragment(run_every=LIVE_REFRESH_INTERVAL)
+def live_transcription_panel():
+    """Widget de transcription en direct, rafraîchi seul sans relancer tout le script"""
+    start = time.perf_counter()
+    try:
+        if not is_recording():
+            # Enregistrement terminé : un rerun complet affiche le résultat final
+            st.rerun()
+
+        # Afficher transcription partielle en temps réel si disponible
+        partial = get_partial_transcription()
+        if partial:
+            st.markdown(f"""
+            <div style="background-color: #744210; color: #faf089; border: 2px solid #d69e2e; 
+                       padding: 0.5rem; border-radius: 8px; margin-bottom: 0.5rem; font-size: 12px;">
+                {partial}
+            </div>
+            """, unsafe_allow_html=True)
+        
+        # Indicateur d'enregistrement avec bouton stop
+        st.markdown("""
+        <div style="background-color: #744210; color: #faf089; border: 2px solid #d69e2e; 
+                   padding: 1rem; border-radius: 8px; text-align: center; font-weight: bold;
+                   animation: pulse 1.5s infinite;">
+            ENREGISTREMENT...<br>
+            PARLEZ MAINTENANT
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Bouton arrêter
+        if st.button("Arrêter", key="stop_rec"):
+            stop_recording()  # attend la fin du thread (1 s max)
+            st.rerun()
+    finally:
+        log_run_cost("fragment transcription", start)
+
+def run_in_queue(question, sources=None):
+    """Soumettre la question à la file partagée et attendre le résultat.
+
+    Retourne (réponse, None) en cas de succès, (None, message) en cas d'erreur
+    de génération, et (None, None) si la demande a été refusée par la file.
+    """
+    session_id = st.session_state.session_id
+    memory = st.session_state.memory
+
+    # Question fréquente précalculée : réponse immédiate, sans passer par la file
+    # (pas pour une question de suivi, qui dépend des échanges précédents)
+    if sources is None and not memory.is_follow_up(question):
+        start = time.perf_counter()
+        cached = FAQ_TABLE.lookup(question)
+        if cached is not None:
+            if QUERY_LOG is not None:
+                elapsed = time.perf_counter() - start
+                QUERY_LOG.record(question, {"faq": elapsed, "total": elapsed}, answer=cached)
+            memory.add_turn(question, question, cached)
+            return cached, None
+
+    # Profil cProfile de cette requête : ?profile=1 dans l'URL, si CHATBOT_PROFILING=1
+    answer_fn = generate_answer_ollama
+    if PROFILING and st.query_params.get("profile") == "1":
+        answer_fn = profiled(generate_answer_ollama, f"{session_id[:8]}-{question[:30]}")
+
+    try:
+        job = JOB_QUEUE.submit(session_id, answer_fn, question, sources=sources, memory=memory)
+    except RateLimitError as e:
+        st.warning(str(e))
+        return None, None
+    except QueueFullError as e:
+        st.warning(str(e))
+        return None, None
+
+    status_box = st.empty()
+    with st.spinner("Génération de la réponse en cours..."):
+        while not job.wait(timeout=0.5):
+            # Signe de vie : si la session est fermée, le job sera annulé
+            JOB_QUEUE.touch(session_id)
+            position = JOB_QUEUE.position(job)
+            if position > 0:
+                status_box.info(f"Votre question est en file d'attente (position {position})")
+            else:
+                status_box.info("Votre question est en cours de traitement...")
+    status_box.empty()
+
+    if job.status == CANCELLED:
+        return None, "Demande annulée (temps d'attente dépassé)"
+    if job.status == FAILED:
+        return None, f"Erreur lors de la génération: {str(job.error)}"
+    return job.result, None
 
 # Interface principale
 def main():
+    JOB_QUEUE.touch(st.session_state.session_id)
+
     # En-tête
     st.markdown("""
     <div class="main-header">
@@ -295,38 +445,54 @@ def main():
         # HISTORIQUE DES DISCUSSIONS
         st.subheader("Historique des discussions")
         
-        if st.session_state.chat_history:
-            for i, conversation in enumerate(st.session_state.chat_history):
-                # Titre de la conversation basé sur la question
-                conv_title = conversation['question'][:40] + "..." if len(conversation['question']) > 40 else conversation['question']
-                
+        session_id = st.session_state.session_id
+        total = CONVERSATIONS.count(session_id)
+        
+        if total:
+            # Seule la page courante est lue depuis la base
+            last_page = (total - 1) // PAGE_SIZE
+            page = min(st.session_state.history_page, last_page)
+            for conversation in CONVERSATIONS.page(session_id, page):
                 # Bouton pour afficher cette conversation
                 if st.button(
-                    f"{conv_title}",
-                    key=f"conv_{i}",
+                    f"{conversation['title']}",
+                    key=f"conv_{conversation['id']}",
                     help=f"Cliquez pour afficher cette discussion"
                 ):
-                    st.session_state.current_conversation_index = i
+                    st.session_state.current_conversation_id = conversation["id"]
                     st.rerun()
             
+            # Pagination
+            if last_page > 0:
+                col_prev, col_page, col_next = st.columns([1, 2, 1])
+                with col_prev:
+                    if st.button("◀", disabled=page == 0, key="history_prev"):
+                        st.session_state.history_page = page - 1
+                        st.rerun()
+                with col_page:
+                    st.caption(f"Page {page + 1}/{last_page + 1} ({total})")
+                with col_next:
+                    if st.button("▶", disabled=page == last_page, key="history_next"):
+                        st.session_state.history_page = page + 1
+                        st.rerun()
+            
             st.divider()
             
             # Bouton nouvelle discussion
             if st.button("Nouvelle discussion"):
-                st.session_state.current_conversation_index = None
+                st.session_state.current_conversation_id = None
+                # Les questions suivantes ne sont plus des suites de la discussion
+                st.session_state.memory.reset()
                 st.rerun()
             
             # Bouton effacer tout
             if st.button("Effacer tout l'historique"):
-                st.session_state.chat_history = []
-                st.session_state.current_conversation_index = None
-                # Nettoyer les fichiers temporaires
-                for file in ["temp_transcription.txt", "recording_status.txt"]:
-                    try:
-                        if os.path.exists(file):
-                            os.remove(file)
-                    except:
-                        pass
+                CONVERSATIONS.clear(session_id)
+                st.session_state.current_conversation_id = None
+                st.session_state.history_page = 0
+                st.session_state.memory.reset()
+                # Arrêter l'enregistrement éventuel et vider les transcriptions
+                st.session_state.recorder.reset()
                 st.rerun()
         else:
             st.info("Aucune discussion pour le moment")
@@ -336,14 +502,21 @@ def main():
         st.header("Informations système")
         
         # Statut Ollama
-        if check_ollama():
+        if ollama_status():
             st.success("Ollama connecté")
         else:
             st.error("Ollama déconnecté")
             st.warning("Démarrez Ollama avec: ollama serve")
         
+        # Charge de la file partagée
+        queue_state = JOB_QUEUE.snapshot()
+        st.caption(f"File : {queue_state['pending']} en attente, "
+                   f"{queue_state['running']}/{queue_state['workers']} en cours")
+        
         # Statut STT
-        if STT_INSTANCE.is_available:
+        if TEXT_ONLY:
+            st.info("Mode texte seul (voix désactivée)")
+        elif STT_INSTANCE.is_available:
             st.success("STT Vosk prêt")
         else:
             st.error("Modèle STT manquant")
@@ -354,9 +527,23 @@ def main():
         # Options
         st.subheader("Options")
         
+        # Corpus interrogés : seules les partitions choisies sont parcourues
+        # (relu à chaque rendu : un document ajouté à data/documents.json apparaît sans redémarrage)
+        corpora = load_corpora()
+        selected_corpora = st.multiselect(
+            "Corpus à interroger",
+            options=list(corpora),
+            default=list(corpora),
+            format_func=lambda source: corpora.get(source, source),
+            key="selected_corpora"
+        )
+        
         # Test de transcription simplifié
-        if st.button("Test Transcription (3s)"):
-            if STT_INSTANCE.is_available:
+        if not TEXT_ONLY and st.button("Test Transcription (3s)"):
+            if STT_INSTANCE.model is not None:
+                import sounddevice as sd
+                import vosk
+
                 st.info("Test de 3 secondes - parlez maintenant...")
                 # Créer un test rapide avec durée fixe
                 rec = vosk.KaldiRecognizer(STT_INSTANCE.model, 16000)
@@ -383,12 +570,13 @@ def main():
             else:
                 st.error("STT non disponible")
     
-    # Interface de saisie - VERSION AVEC FICHIER TEMPORAIRE
+    # Interface de saisie
     col1, col2 = st.columns([5, 1])
     
     with col1:
-        # Vérifier s'il y a une nouvelle transcription
-        transcription_result = get_transcription_result()
+        # Vérifier s'il y a une nouvelle transcription (micro serveur ou audio envoyé)
+        uploaded_transcription = None if TEXT_ONLY else transcribe_uploaded_audio()
+        transcription_result = get_transcription_result() or uploaded_transcription
         
         if transcription_result:
             st.markdown(f"""
@@ -408,7 +596,7 @@ def main():
             "Votre question juridique:",
             height=100,
             placeholder="Ex: Quels sont les droits du travailleur malade ?",
-            help="Utilisez le bouton micro puis copiez la transcription qui apparaît ci-dessus",
+            help=None if TEXT_ONLY else "Utilisez le bouton micro puis copiez la transcription qui apparaît ci-dessus",
             key=f"question_area_{st.session_state.check_transcription}"
         )
     
@@ -418,85 +606,58 @@ def main():
         # Bouton micro avec gestion d'état - Version manuelle start/stop
         currently_recording = is_recording()
         
-        if not currently_recording:
+        if TEXT_ONLY:
+            # Pas de micro en mode texte seul
+            pass
+        elif not currently_recording:
             if st.button("🎤 Démarrer", disabled=not STT_INSTANCE.is_available, key="start_rec"):
                 record_audio_background()
                 st.rerun()
         else:
-            # Afficher transcription partielle en temps réel si disponible
-            partial = get_partial_transcription()
-            if partial:
-                st.markdown(f"""
-                <div style="background-color: #744210; color: #faf089; border: 2px solid #d69e2e; 
-                           padding: 0.5rem; border-radius: 8px; margin-bottom: 0.5rem; font-size: 12px;">
-                    {partial}
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # Indicateur d'enregistrement avec bouton stop
-            st.markdown("""
-            <div style="background-color: #744210; color: #faf089; border: 2px solid #d69e2e; 
-                       padding: 1rem; border-radius: 8px; text-align: center; font-weight: bold;
-                       animation: pulse 1.5s infinite;">
-                ENREGISTREMENT...<br>
-                PARLEZ MAINTENANT
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Bouton arrêter
-            if st.button("Arrêter", key="stop_rec"):
-                stop_recording()
-                time.sleep(1)  # Laisser le temps au thread de finir
-                st.rerun()
-            
-            # Auto-refresh pour afficher transcription partielle
-            time.sleep(0.5)
-            st.rerun()
+            # Seul ce fragment est rafraîchi pendant l'enregistrement
+            live_transcription_panel()
     
     # Bouton d'envoi
     col_send1, col_send2, col_send3 = st.columns([1, 2, 1])
     with col_send2:
         if st.button("Envoyer la question", disabled=not bool(question_input.strip())):
             if question_input.strip():
-                # Générer la réponse
-                with st.spinner("Génération de la réponse en cours..."):
-                    try:
-                        # Utilisation directe de votre fonction
-                        answer = generate_answer_ollama(question_input.strip())
-                        
-                        # Ajouter la conversation (question + réponse ensemble)
-                        st.session_state.chat_history.append({
-                            "question": question_input.strip(),
-                            "answer": answer,
-                            "timestamp": datetime.now()
-                        })
-                        
-                        # Afficher cette nouvelle conversation
-                        st.session_state.current_conversation_index = len(st.session_state.chat_history) - 1
-                        st.success("Réponse générée!")
-                        
-                    except Exception as e:
-                        error_msg = f"Erreur lors de la génération: {str(e)}"
-                        
-                        # Ajouter quand même avec erreur
-                        st.session_state.chat_history.append({
-                            "question": question_input.strip(),
-                            "answer": error_msg,
-                            "error": True,
-                            "timestamp": datetime.now()
-                        })
-                        
-                        st.session_state.current_conversation_index = len(st.session_state.chat_history) - 1
-                        st.error(error_msg)
-                
+                # Générer la réponse via la file partagée
+                # Tous les corpus cochés (ou aucun) = pas de filtre
+                sources = st.session_state.selected_corpora
+                if not sources or set(sources) >= set(load_corpora()):
+                    sources = None
+                answer, error_msg = run_in_queue(question_input.strip(), sources=sources)
+
+                if answer is not None:
+                    # Enregistrer la conversation (question + réponse ensemble)
+                    conversation_id = CONVERSATIONS.add(
+                        st.session_state.session_id, question_input.strip(), answer)
+
+                    # Afficher cette nouvelle conversation
+                    st.session_state.current_conversation_id = conversation_id
+                    st.session_state.history_page = 0
+                    st.success("Réponse générée!")
+                elif error_msg is not None:
+                    # Enregistrer quand même avec erreur
+                    conversation_id = CONVERSATIONS.add(
+                        st.session_state.session_id, question_input.strip(), error_msg, error=True)
+
+                    st.session_state.current_conversation_id = conversation_id
+                    st.session_state.history_page = 0
+                    st.error(error_msg)
+
                 st.rerun()
     
     # Affichage de la conversation sélectionnée
     st.subheader("Conversation")
     
-    if st.session_state.current_conversation_index is not None:
+    conv = None
+    if st.session_state.current_conversation_id is not None:
+        conv = CONVERSATIONS.get(st.session_state.current_conversation_id, st.session_state.session_id)
+    
+    if conv is not None:
         # Afficher la conversation sélectionnée
-        conv = st.session_state.chat_history[st.session_state.current_conversation_index]
         
         # Bloc unique contenant question ET réponse
         is_error = conv.get("error", False)
@@ -525,4 +686,8 @@ def main():
         st.info("Posez une question pour démarrer une conversation!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_start = time.perf_counter()
+    try:
+        main()
+    finally:
+        log_run_cost("script complet", run_start)
\ No newline at end of file
@@ -0,0 +1,230 @@
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+# ==============================
+# 1. Configuration
+# ==============================
+INDEX_PATH = Path("data") / "article_index.json"
+
+# Au-delà de ce nombre de chunks définissant le même article (ex: "Article 2",
+# présent dans chaque décret du Manuel), la référence est jugée ambiguë et la
+# question repart vers la recherche hybride
+MAX_DEFINITIONS = 3
+
+# ==============================
+# 2. Normalisation des identifiants d'article
+# ==============================
+# En-tête d'article dans le corpus : "Article L.56." / "Article L.2 :" / "Article 5 :"
+DEFINITION_PATTERN = re.compile(
+    r"\bArticle\s+(?:(?P<prefix>[LRD])\s*\.?\s*)?(?P<num>\d+|premier|1er)\s*[.:]"
+)
+# Mention quelconque d'un article dans le texte ("l'article L.67", "articles L. 7 à L.9")
+MENTION_PATTERN = re.compile(
+    r"\b[Aa]rticles?\s+(?:(?P<prefix>[LRD])\s*\.?\s*)?(?P<num>\d+|premier|1er)\b"
+)
+
+# Motifs de détection dans les questions des utilisateurs
+QUERY_PATTERNS = [
+    # "article L.56", "art. L 56", "l'article R.12"
+    re.compile(r"\b(?:articles?|art\.?)\s*(?P<prefix>[lrd])\s*\.?\s*(?P<num>\d+)\b", re.IGNORECASE),
+    # "L.56" seul
+    re.compile(r"(?<![\w.])(?P<prefix>[LRD])\s*\.\s*(?P<num>\d+)\b"),
+    # "article 69", "article premier"
+    re.compile(r"\b(?:articles?|art\.?)\s*(?P<num>\d+|premier|1er)\b", re.IGNORECASE),
+]
+CODE_PATTERN = re.compile(r"code\s+du\s+travail", re.IGNORECASE)
+
+
+def normalize_article_id(prefix, num):
+    """("l", "056") -> "L.56" ; (None, "premier") -> "1" """
+    num = "1" if num.lower() in ("premier", "1er") else str(int(num))
+    return f"{prefix.upper()}.{num}" if prefix else num
+
+
+def find_articles(text):
+    """Liste des (identifiant, offset, kind) des articles présents dans un texte"""
+    found = []
+    defined = set()
+    for m in DEFINITION_PATTERN.finditer(text):
+        found.append((normalize_article_id(m.group("prefix"), m.group("num")), m.start(), "definition"))
+        defined.add(m.start())
+    for m in MENTION_PATTERN.finditer(text):
+        if m.start() not in defined:
+            found.append((normalize_article_id(m.group("prefix"), m.group("num")), m.start(), "mention"))
+    return found
+
+# ==============================
+# 3. Construction de l'index (au moment du chunking)
+# ==============================
+def build_article_index(chunks):
+    """Index {article: [{id, source, chunk_index, offset, end, kind}]}"""
+    index = {}
+    for chunk in chunks:
+        text = chunk["text"]
+        articles = sorted(find_articles(text), key=lambda a: a[1])
+        starts = [offset for _, offset, kind in articles if kind == "definition"]
+        for article_id, offset, kind in articles:
+            # Fin de l'article = début de la définition suivante dans le même chunk
+            end = next((s for s in starts if s > offset), len(text)) if kind == "definition" else None
+            entry = {
+                "id": chunk["id"],
+                "source": chunk["source"],
+                "chunk_index": chunk["chunk_index"],
+                "offset": offset,
+                "end": end,
+                "kind": kind,
+            }
+            index.setdefault(article_id, []).append(entry)
+
+    # Avec l'overlap entre chunks, une même définition apparaît à la fin d'un
+    # chunk et au début du suivant : on garde la version au corps le plus long
+    for article_id, entries in index.items():
+        kept = []
+        last_definition = None
+        for entry in entries:
+            if (entry["kind"] == "definition" and last_definition is not None
+                    and last_definition["source"] == entry["source"]
+                    and entry["chunk_index"] - last_definition["chunk_index"] == 1):
+                if entry["end"] - entry["offset"] > last_definition["end"] - last_definition["offset"]:
+                    kept[kept.index(last_definition)] = entry
+                    last_definition = entry
+                continue
+            kept.append(entry)
+            if entry["kind"] == "definition":
+                last_definition = entry
+        index[article_id] = kept
+    return index
+
+
+def build_article_index_file(chunk_files, output_path=INDEX_PATH):
+    chunks = []
+    for file in chunk_files:
+        with open(file, "r", encoding="utf-8") as f:
+            chunks.extend(json.load(f))
+
+    index = build_article_index(chunks)
+    payload = {"chunk_files": [str(f) for f in chunk_files], "articles": index}
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+    n_def = sum(1 for entries in index.values() for e in entries if e["kind"] == "definition")
+    print(f"Index des articles: {len(index)} articles, {n_def} définitions → {output_path}")
+    return index
+
+# ==============================
+# 4. Pré-routeur des questions
+# ==============================
+def detect_article_references(question):
+    """Identifiants d'articles cités dans une question (ordre d'apparition)"""
+    refs = []
+    covered = []
+    mentions_code = bool(CODE_PATTERN.search(question))
+    for pattern in QUERY_PATTERNS:
+        for m in pattern.finditer(question):
+            if any(s <= m.start() < e for s, e in covered):
+                continue
+            covered.append(m.span())
+            prefix = m.groupdict().get("prefix")
+            # "article 69 du Code du travail" : les articles du Code sont numérotés L.x
+            if prefix is None and mentions_code:
+                prefix = "L"
+            refs.append((m.start(), normalize_article_id(prefix, m.group("num"))))
+    seen = []
+    for _, ref in sorted(refs):
+        if ref not in seen:
+            seen.append(ref)
+    return seen
+
+
+class ArticleRouter:
+    """Répond aux questions citant un article directement depuis l'index.
+
+    route() retourne des passages au même format que hybrid_search, ou None
+    quand la question doit passer par la recherche hybride.
+    """
+
+    def __init__(self, index_path=INDEX_PATH, max_definitions=MAX_DEFINITIONS):
+        self.index_path = Path(index_path)
+        self.max_definitions = max_definitions
+        self.index = None
+        self.texts = {}
+        self.stats = {"queries": 0, "detected": 0, "hits": 0,
+                      "ambiguous": 0, "missing": 0, "route_seconds": 0.0}
+
+    def load(self):
+        if self.index is not None:
+            return self.index is not False
+        if not self.index_path.exists():
+            print(f"Index des articles absent ({self.index_path}), routage désactivé")
+            self.index = False
+            return False
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        for file in payload["chunk_files"]:
+            with open(file, "r", encoding="utf-8") as f:
+                for chunk in json.load(f):
+                    self.texts[chunk["id"]] = chunk["text"]
+        self.index = payload["articles"]
+        return True
+
+    def route(self, question, top_k=3, sources=None):
+        if not self.load():
+            return None
+        start = time.perf_counter()
+        self.stats["queries"] += 1
+        try:
+            refs = detect_article_references(question)
+            if not refs:
+                return None
+            self.stats["detected"] += 1
+
+            passages = []
+            for ref in refs:
+                definitions = [e for e in self.index.get(ref, []) if e["kind"] == "definition"
+                               and (sources is None or e["source"] in sources)]
+                if not definitions:
+                    self.stats["missing"] += 1
+                    return None
+                if len(definitions) > self.max_definitions:
+                    self.stats["ambiguous"] += 1
+                    return None
+                for entry in definitions:
+                    text = self.texts[entry["id"]]
+                    passages.append({
+                        "source": entry["source"],
+                        "chunk_index": entry["chunk_index"],
+                        "text": text[entry["offset"]:entry["end"]],
+                        "score": 1.0,
+                        "article": ref,
+                    })
+            self.stats["hits"] += 1
+            return passages[:top_k]
+        finally:
+            self.stats["route_seconds"] += time.perf_counter() - start
+
+    def report(self):
+        n = max(self.stats["queries"], 1)
+        return (f"Routeur articles: {self.stats['hits']}/{self.stats['queries']} questions servies par l'index "
+                f"({100 * self.stats['hits'] / n:.0f} %), {self.stats['detected']} références détectées, "
+                f"{self.stats['ambiguous']} ambiguës, {self.stats['missing']} introuvables, "
+                f"{1e6 * self.stats['route_seconds'] / n:.1f} µs/question")
+
+
+if __name__ == "__main__":
+    router = ArticleRouter()
+    questions = sys.argv[1:] or [
+        "Que dit l'article L.56 ?",
+        "article 69 du Code du travail",
+        "Que dit l'article 2 ?",
+        "Quels sont les droits du travailleur malade ?",
+    ]
+    for q in questions:
+        passages = router.route(q)
+        if passages:
+            print(f"{q} → " + ", ".join(f"{p['article']} ({p['source']} chunk {p['chunk_index']})" for p in passages))
+        else:
+            print(f"{q} → recherche hybride")
+    print(router.report())
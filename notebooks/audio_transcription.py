@@ -0,0 +1,301 @@
+import io
+import json
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+# ==============================
+# 1. Configuration
+# ==============================
+MODEL_PATH = "models\\fr\\vosk-model-small-fr-0.22"
+SAMPLE_RATE = 16000
+BLOCK_FRAMES = 8000          # même taille de bloc que la capture micro
+POOL_SIZE = 4                # recognizers réutilisables gardés en réserve
+
+# ==============================
+# 2. Modèle Vosk partagé
+# ==============================
+_model = None
+_model_lock = threading.Lock()
+
+def get_vosk_model(model_path=MODEL_PATH):
+    """Charge le modèle Vosk une seule fois pour tout le processus"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import vosk  # chargé au premier usage de la voix seulement
+                _model = vosk.Model(model_path)
+                print("Modèle Vosk chargé")
+    return _model
+
+
+class RecognizerPool:
+    """Réserve de KaldiRecognizer réinitialisés entre deux utilisations.
+
+    Créer un recognizer coûte cher (graphe de décodage) ; on les recycle
+    au lieu d'en créer un par requête.
+    """
+
+    def __init__(self, size=POOL_SIZE, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._free = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            import vosk
+            return vosk.KaldiRecognizer(get_vosk_model(), self.sample_rate)
+
+    def release(self, rec):
+        rec.Reset()
+        try:
+            self._free.put_nowait(rec)
+        except queue.Full:
+            pass
+
+
+_pool = None
+
+def get_recognizer_pool():
+    global _pool
+    if _pool is None:
+        with _model_lock:
+            if _pool is None:
+                _pool = RecognizerPool()
+    return _pool
+
+# ==============================
+# 3. Décodage et rééchantillonnage
+# ==============================
+def _to_mono_float(pcm, channels, sample_width):
+    """PCM linéaire (trames complètes) -> échantillons mono float32 à l'échelle int16"""
+    if sample_width == 1:
+        samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128.0) * 256.0
+    elif sample_width == 2:
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+    elif sample_width == 4:
+        samples = np.frombuffer(pcm, dtype="<i4").astype(np.float32) / 65536.0
+    else:
+        raise ValueError(f"Largeur d'échantillon non supportée: {sample_width}")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+class PcmConverter:
+    """Conversion incrémentale en int16 mono 16 kHz pour un flux découpé en chunks.
+
+    L'état est gardé d'un chunk à l'autre : octets d'une trame incomplète
+    (chunk de longueur impaire en 16 bits), dernier échantillon et phase du
+    rééchantillonnage linéaire. Le flux converti par morceaux est ainsi
+    identique au fichier converti d'un bloc, sans discontinuité aux jointures.
+    """
+
+    def __init__(self, sample_rate, channels=1, sample_width=2):
+        if sample_width not in (1, 2, 4):
+            raise ValueError(f"Largeur d'échantillon non supportée: {sample_width}")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.step = sample_rate / SAMPLE_RATE    # pas entre deux sorties, en échantillons d'entrée
+        self._pending = b""                      # trame incomplète du chunk précédent
+        self._last = None                        # dernier échantillon du chunk précédent
+        self._pos = 0.0                          # position de la prochaine sortie (0 = _last)
+
+    def convert(self, chunk):
+        data = self._pending + chunk
+        frame = self.sample_width * self.channels
+        usable = len(data) - len(data) % frame
+        self._pending = data[usable:]
+        samples = _to_mono_float(data[:usable], self.channels, self.sample_width)
+
+        if self.sample_rate != SAMPLE_RATE and len(samples):
+            if self._last is not None:
+                samples = np.concatenate(([self._last], samples))
+            end = len(samples) - 1
+            positions = np.arange(self._pos, end + 1e-9, self.step) if end >= self._pos else np.empty(0)
+            self._last = samples[-1]
+            self._pos = (positions[-1] + self.step if len(positions) else self._pos) - end
+            samples = np.interp(positions, np.arange(len(samples)), samples)
+
+        return np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+
+
+def pcm_to_mono16k(pcm, sample_rate, channels=1, sample_width=2):
+    """Convertit du PCM linéaire en int16 mono 16 kHz (bytes)"""
+    return PcmConverter(sample_rate, channels, sample_width).convert(pcm)
+
+def decode_with_ffmpeg(data):
+    """Décode un enregistrement navigateur (webm/ogg/mp3...) via ffmpeg"""
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg est requis pour décoder ce format audio")
+    proc = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+        input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Erreur ffmpeg: {proc.stderr.decode(errors='ignore')[:200]}")
+    return proc.stdout
+
+def decode_audio(data, sample_rate=None):
+    """Convertit un fichier audio (WAV, PCM brut ou autre format) en PCM 16 kHz mono.
+
+    Le PCM brut est supposé int16 mono ; sample_rate indique sa fréquence.
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        with wave.open(io.BytesIO(data), "rb") as wf:
+            pcm = wf.readframes(wf.getnframes())
+            return pcm_to_mono16k(pcm, wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+    if sample_rate is not None:
+        return pcm_to_mono16k(data, sample_rate)
+    return decode_with_ffmpeg(data)
+
+# ==============================
+# 4. Transcription incrémentale
+# ==============================
+class StreamingTranscriber:
+    """Alimente un KaldiRecognizer morceau par morceau.
+
+    Usage : feed() pour chaque chunk reçu (retourne la transcription
+    partielle), puis finish() pour obtenir le texte final.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, pool=None):
+        self.sample_rate = sample_rate
+        self.pool = pool or get_recognizer_pool()
+        self.rec = self.pool.acquire()
+        self.segments = []
+        self.partial = ""
+        self.audio_seconds = 0.0
+        self._converter = None
+
+    def _accept(self, pcm16k):
+        self.audio_seconds += len(pcm16k) / 2 / SAMPLE_RATE
+        step = BLOCK_FRAMES * 2
+        for i in range(0, len(pcm16k), step):
+            if self.rec.AcceptWaveform(pcm16k[i:i + step]):
+                text = json.loads(self.rec.Result()).get("text", "")
+                if text:
+                    self.segments.append(text)
+                self.partial = ""
+            else:
+                self.partial = json.loads(self.rec.PartialResult()).get("partial", "")
+
+    def feed(self, chunk, sample_rate=None, channels=1, sample_width=2):
+        """Ajoute un chunk PCM et retourne le texte reconnu jusqu'ici"""
+        rate = sample_rate or self.sample_rate
+        # Un convertisseur par flux : trames incomplètes et phase du rééchantillonnage
+        # sont reportées sur le chunk suivant
+        fmt = (rate, channels, sample_width)
+        if self._converter is None or fmt != (self._converter.sample_rate, self._converter.channels,
+                                              self._converter.sample_width):
+            self._converter = PcmConverter(*fmt)
+        try:
+            self._accept(self._converter.convert(chunk))
+        except Exception:
+            self.close()
+            raise
+        return " ".join(self.segments + ([self.partial] if self.partial else []))
+
+    def finish(self):
+        """Termine le flux, rend le recognizer au pool et retourne le texte final"""
+        try:
+            text = json.loads(self.rec.FinalResult()).get("text", "")
+            if text:
+                self.segments.append(text)
+        finally:
+            self.close()
+        return " ".join(self.segments).strip()
+
+    def close(self):
+        """Rend le recognizer au pool (idempotent)"""
+        if self.rec is not None:
+            rec, self.rec = self.rec, None
+            self.pool.release(rec)
+
+def transcribe_audio_bytes(data, sample_rate=None):
+    """Transcrit un fichier audio complet (upload)"""
+    pcm = decode_audio(data, sample_rate)
+    transcriber = StreamingTranscriber()
+    transcriber.feed(pcm)
+    return transcriber.finish()
+
+# ==============================
+# 5. Benchmark : facteur temps réel (RTF) sur CPU
+# ==============================
+def benchmark(fixtures_dir):
+    files = sorted(Path(fixtures_dir).glob("*.wav"))
+    if not files:
+        print(f"Aucun fichier .wav dans {fixtures_dir}")
+        return
+
+    get_vosk_model()  # le chargement du modèle n'entre pas dans la mesure
+    total_audio, total_time = 0.0, 0.0
+    for path in files:
+        data = path.read_bytes()
+        start = time.perf_counter()
+        pcm = decode_audio(data)
+        transcriber = StreamingTranscriber()
+        transcriber.feed(pcm)
+        text = transcriber.finish()
+        elapsed = time.perf_counter() - start
+        duration = len(pcm) / 2 / SAMPLE_RATE
+        total_audio += duration
+        total_time += elapsed
+        print(f"{path.name}: {duration:.1f} s audio, {elapsed:.2f} s, RTF={elapsed / max(duration, 1e-9):.3f} → {text[:60]}")
+
+    print(f"\nRTF global: {total_time / max(total_audio, 1e-9):.3f} ({len(files)} fichiers, {total_audio:.1f} s audio)")
+
+
+def check_streaming(fixtures_dir, chunk_seconds=0.1):
+    """Conversion par chunks (taille impaire, comme un flux navigateur) vs fichier entier, sans Vosk"""
+    for path in sorted(Path(fixtures_dir).glob("*.wav")):
+        with wave.open(str(path), "rb") as wf:
+            fmt = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+            pcm = wf.readframes(wf.getnframes())
+        whole = np.frombuffer(pcm_to_mono16k(pcm, *fmt), dtype="<i2").astype(np.int32)
+        step = int(chunk_seconds * fmt[0] * fmt[1] * fmt[2]) | 1
+        converter = PcmConverter(*fmt)
+        start = time.perf_counter()
+        streamed = b"".join(converter.convert(pcm[i:i + step]) for i in range(0, len(pcm), step))
+        elapsed = time.perf_counter() - start
+        streamed = np.frombuffer(streamed, dtype="<i2").astype(np.int32)
+        n = min(len(whole), len(streamed))
+        print(f"{path.name}: {fmt[0]} Hz x{fmt[1]}, {len(streamed) - len(whole):+d} échantillons, "
+              f"écart max {np.abs(whole[:n] - streamed[:n]).max() if n else 0}, "
+              f"conversion RTF={elapsed / max(len(whole) / SAMPLE_RATE, 1e-9):.4f}")
+
+
+def write_fixture(path, seconds=0.5, sample_rate=48000, channels=2):
+    """Balayage 200 Hz -> 4 kHz : une discontinuité de rééchantillonnage s'y voit aussitôt"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = 8000 * np.sin(2 * np.pi * (200 * t + (3800 / (2 * seconds)) * t ** 2))
+    frames = np.repeat(signal[:, None], channels, axis=1).astype("<i2")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(frames.tobytes())
+
+
+if __name__ == "__main__":
+    # Usage : python audio_transcription.py [dossier] [--resample]
+    # --resample : vérifie seulement la conversion par chunks (sans modèle Vosk)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    fixtures = args[0] if args else "data/audio_fixtures"
+    if "--resample" in sys.argv:
+        check_streaming(fixtures)
+    else:
+        benchmark(fixtures)
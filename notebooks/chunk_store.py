@@ -0,0 +1,186 @@
+import json
+import mmap
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+
+# ==============================
+# 1. Format du fichier
+# ==============================
+# chunk_store.bin : MAGIC | n (uint64) | offsets (n+1 x uint64) | textes UTF-8 concaténés
+# chunk_store.json : clés des chunks dans l'ordre du fichier [[source, chunk_index], ...]
+STORE_PATH = Path("data") / "chunk_store.bin"
+MAGIC = b"CHKSTOR1"
+HEADER = struct.Struct("<8sQ")
+
+
+def chunk_key(source, chunk_index):
+    """Clé d'un chunk, identique au champ "id" des JSON ("Code_du_travail_12")"""
+    return f"{source}_{chunk_index}"
+
+
+def meta_path(store_path):
+    return Path(store_path).with_suffix(".json")
+
+# ==============================
+# 2. Construction (au moment du chunking)
+# ==============================
+def write_chunk_store(chunks, store_path=STORE_PATH):
+    encoded = [c["text"].encode("utf-8") for c in chunks]
+    offsets = array("Q", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    with open(store_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(encoded)))
+        f.write(offsets.tobytes())
+        for data in encoded:
+            f.write(data)
+
+    keys = [[c["source"], c["chunk_index"]] for c in chunks]
+    with open(meta_path(store_path), "w", encoding="utf-8") as f:
+        json.dump({"keys": keys}, f, ensure_ascii=False)
+
+    print(f"{len(chunks)} chunks écrits dans {store_path} ({Path(store_path).stat().st_size / 1024:.0f} Ko)")
+
+
+def build_chunk_store(chunk_files, store_path=STORE_PATH):
+    chunks = []
+    for file in chunk_files:
+        with open(file, "r", encoding="utf-8") as f:
+            chunks.extend(json.load(f))
+    write_chunk_store(chunks, store_path)
+    return chunks
+
+# ==============================
+# 3. Lecture memory-mappée
+# ==============================
+class ChunkStore:
+    """Accès aux textes des chunks par clé sans tout charger en mémoire.
+
+    Le fichier est memory-mappé : get_bytes() retourne une vue (sans copie)
+    sur le texte, get() ne décode que le chunk demandé.
+    """
+
+    def __init__(self, store_path=STORE_PATH):
+        self.path = Path(store_path)
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Fichier {self.path} invalide")
+        self.count = count
+        view = memoryview(self._mm)
+        start = HEADER.size
+        self._offsets = view[start:start + 8 * (count + 1)].cast("Q")
+        self._blob = view[start + 8 * (count + 1):]
+
+        with open(meta_path(self.path), "r", encoding="utf-8") as f:
+            keys = json.load(f)["keys"]
+        self.keys = [(source, chunk_index) for source, chunk_index in keys]
+        self._positions = {chunk_key(s, i): pos for pos, (s, i) in enumerate(self.keys)}
+
+    @classmethod
+    def open_if_exists(cls, store_path=STORE_PATH):
+        if Path(store_path).exists() and meta_path(store_path).exists():
+            return cls(store_path)
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def get_bytes(self, key):
+        pos = self._positions[key]
+        return self._blob[self._offsets[pos]:self._offsets[pos + 1]]
+
+    def get(self, key, default=None):
+        if key not in self._positions:
+            return default
+        return str(self.get_bytes(key), "utf-8")
+
+    def get_by_source(self, source, chunk_index, default=None):
+        return self.get(chunk_key(source, chunk_index), default)
+
+    def neighbors(self, source, chunk_index, radius):
+        """Intervalle (premier, dernier) des chunks présents autour d'un chunk, à `radius` près.
+
+        Une recherche de clé par voisin (O(1)) : les chunk_index d'un corpus
+        sont consécutifs, l'intervalle s'arrête au premier trou.
+        """
+        first = last = chunk_index
+        while chunk_index - first < radius and chunk_key(source, first - 1) in self._positions:
+            first -= 1
+        while last - chunk_index < radius and chunk_key(source, last + 1) in self._positions:
+            last += 1
+        return first, last
+
+    def iter_chunks(self):
+        """Chunks au format des JSON (id, source, chunk_index, text)"""
+        for source, chunk_index in self.keys:
+            key = chunk_key(source, chunk_index)
+            yield {"id": key, "source": source, "chunk_index": chunk_index, "text": self.get(key)}
+
+
+def load_chunks(path):
+    """Charge des chunks depuis un JSON ou depuis un chunk store (.bin)"""
+    path = Path(path)
+    if path.suffix == ".bin":
+        return list(ChunkStore(path).iter_chunks())
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ==============================
+# 4. Mesures : taille et latence
+# ==============================
+def report(chunk_files, store_path=STORE_PATH, top_k=5):
+    chunks = build_chunk_store(chunk_files, store_path)
+    json_size = sum(Path(f).stat().st_size for f in chunk_files)
+    store_size = Path(store_path).stat().st_size + meta_path(store_path).stat().st_size
+    print(f"JSON: {json_size / 1024:.0f} Ko → chunk store: {store_size / 1024:.0f} Ko")
+
+    # Charge utile d'une recherche : 2 recherches x 2*top_k hits
+    avg_text = sum(len(c["text"].encode("utf-8")) for c in chunks) / len(chunks)
+    hits = 2 * top_k * 2
+    print(f"Texte transféré par recherche : ~{hits * avg_text / 1024:.1f} Ko avant, "
+          f"0 Ko après (+ {top_k * avg_text / 1024:.1f} Ko lus localement pour les passages finaux)")
+
+    store = ChunkStore(store_path)
+    keys = [chunk_key(s, i) for s, i in store.keys]
+    start = time.perf_counter()
+    for _ in range(10):
+        for key in keys:
+            store.get(key)
+    elapsed = time.perf_counter() - start
+    print(f"Lecture: {1e6 * elapsed / (10 * len(keys)):.2f} µs/chunk")
+
+
+def benchmark_search(queries, top_k=5, repeat=3):
+    """Latence de hybrid_search avec et sans le chunk store (nécessite Milvus)"""
+    import hybrid_search as hs
+
+    store = hs.CHUNK_STORE
+    for label, value in [("texte depuis Milvus", None), ("chunk store local", store)]:
+        hs.CHUNK_STORE = value
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for q in queries:
+                hs.hybrid_search(q, top_k=top_k)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {1000 * elapsed / (repeat * len(queries)):.1f} ms/requête")
+    hs.CHUNK_STORE = store
+
+
+if __name__ == "__main__":
+    data_dir = Path("data")
+    report([data_dir / "code_travail_chunks.json", data_dir / "manuel_chunks.json"])
+    if "--search" in sys.argv:
+        benchmark_search([
+            "Quels sont les droits du travailleur malade ?",
+            "Quelles sont les conditions de licenciement ?",
+            "Comment est calculée l'indemnité de congé ?",
+        ])
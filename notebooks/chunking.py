@@ -1,7 +1,9 @@
-import fitz
 import json
-import re
 from pathlib import Path
+from article_index import build_article_index_file
+from chunk_store import build_chunk_store
+from text_normalization import normalize_document
+from dedup import build_dedup_map
 
 # =============================
 # 1. Fonctions utilitaires
@@ -9,6 +11,8 @@ from pathlib import Path
 
 def extract_text_from_pdf(pdf_path):
     """Extrait tout le texte d'un PDF page par page"""
+    import fitz  # PyMuPDF, seulement pour les PDF texte (split_into_chunks n'en a pas besoin)
+
     doc = fitz.open(pdf_path)
     text = ""
     for page in doc:
@@ -22,10 +26,8 @@ def extract_text_from_txt(txt_path):
     return text
 
 def clean_text(text):
-    """Nettoyage de base du texte"""
-    text = re.sub(r"\s+", " ", text)  # enlever espaces multiples
-    text = re.sub(r"\n+", "\n", text)  # normaliser sauts de lignes
-    return text.strip()
+    """Nettoyage de base du texte : espaces et sauts de ligne multiples réduits en une passe"""
+    return " ".join(text.split())
 
 def split_into_chunks(text, chunk_size=512, overlap=50):
     """Découpe un texte en chunks avec overlap"""
@@ -48,7 +50,8 @@ def split_into_chunks(text, chunk_size=512, overlap=50):
 def process_document(input_path, source_name, output_json, chunk_size=512, overlap=50, is_txt=False):
     # Extraire texte
     if is_txt:  # si on travaille avec un fichier OCR déjà transformé en txt
-        raw_text = extract_text_from_txt(input_path)
+        # mojibake, en-têtes/pieds de page répétés, césures et marqueurs de page
+        raw_text = normalize_document(extract_text_from_txt(input_path))
     else:       # sinon, extraction directe du PDF
         raw_text = extract_text_from_pdf(input_path)
 
@@ -73,6 +76,7 @@ def process_document(input_path, source_name, output_json, chunk_size=512, overl
         json.dump(data, f, ensure_ascii=False, indent=2)
 
     print(f"{len(chunks)} chunks sauvegardés dans {output_json}")
+    return data
 
 
 # =============================
@@ -94,3 +98,15 @@ if __name__ == "__main__":
     # Traiter Manuel du travailleur (texte OCR)
     process_document(manuel_txt, "Manuel_du_travailleur", data_dir / "manuel_chunks.json", 
                      chunk_size=512, overlap=50, is_txt=True)
+
+    # Textes des chunks en un seul fichier memory-mappé (lu par hybrid_search)
+    build_chunk_store([data_dir / "code_travail_chunks.json", data_dir / "manuel_chunks.json"],
+                      data_dir / "chunk_store.bin")
+
+    # Quasi-doublons (MinHash/LSH) : alias non encodés et fusionnés à la requête
+    build_dedup_map([data_dir / "code_travail_chunks.json", data_dir / "manuel_chunks.json"],
+                    data_dir / "dedup_map.json")
+
+    # Index article -> chunks pour le pré-routage des questions
+    build_article_index_file([data_dir / "code_travail_chunks.json", data_dir / "manuel_chunks.json"],
+                             data_dir / "article_index.json")
@@ -0,0 +1,232 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# ==============================
+# 1. Configuration (lue par create_collection, embed_insert et hybrid_search)
+# ==============================
+# Stockage dense : "float32" (défaut), "float16" (FLOAT16_VECTOR) ou
+# "int8" (FLOAT_VECTOR + index quantifié IVF_SQ8)
+DENSE_MODE = os.environ.get("CHATBOT_DENSE_MODE", "float32")
+
+# Élagage des vecteurs sparse : garder les N poids les plus forts et/ou la
+# part MASS de la masse totale (None = pas d'élagage)
+SPARSE_TOP_N = int(os.environ["CHATBOT_SPARSE_TOP_N"]) if os.environ.get("CHATBOT_SPARSE_TOP_N") else None
+SPARSE_MASS = float(os.environ["CHATBOT_SPARSE_MASS"]) if os.environ.get("CHATBOT_SPARSE_MASS") else None
+
+# Vecteurs denses pleine précision gardés localement pour le re-scoring exact
+FULL_PRECISION_PATH = Path("data") / "dense_fp32.npy"
+
+DENSE_MODES = ("float32", "float16", "int8")
+
+# ==============================
+# 2. Schéma et index Milvus selon le mode
+# ==============================
+def dense_field_dtype(mode=DENSE_MODE):
+    from pymilvus import DataType
+    return DataType.FLOAT16_VECTOR if mode == "float16" else DataType.FLOAT_VECTOR
+
+
+def dense_index_params(mode=DENSE_MODE):
+    if mode == "int8":
+        return {"index_type": "IVF_SQ8", "metric_type": "IP", "params": {"nlist": 128}}
+    return {"index_type": "HNSW", "metric_type": "IP", "params": {"M": 8, "efConstruction": 64}}
+
+
+def dense_search_params(mode=DENSE_MODE, ef=64):
+    if mode == "int8":
+        return {"metric_type": "IP", "params": {"nprobe": max(8, ef // 4)}}
+    return {"metric_type": "IP", "params": {"ef": ef}}
+
+
+def needs_rescoring(mode=DENSE_MODE):
+    return mode != "float32"
+
+# ==============================
+# 3. Compression à l'ingestion
+# ==============================
+def compress_dense(vectors, mode=DENSE_MODE):
+    """Vecteurs denses au format attendu par le champ Milvus du mode choisi"""
+    if mode == "float16":
+        return [np.asarray(v, dtype=np.float16) for v in vectors]
+    # float32 et int8 : la quantification int8 est faite par l'index IVF_SQ8
+    return [np.asarray(v, dtype=np.float32) for v in vectors]
+
+
+def prune_sparse_row(indices, values, top_n=SPARSE_TOP_N, mass=SPARSE_MASS):
+    """Garde les poids les plus forts d'un vecteur sparse -> (indices, values)"""
+    indices = np.asarray(indices)
+    values = np.asarray(values, dtype=np.float32)
+    if len(values) == 0 or (top_n is None and mass is None):
+        return indices, values
+
+    order = np.argsort(-values)
+    keep = len(order)
+    if top_n is not None:
+        keep = min(keep, top_n)
+    if mass is not None:
+        cumulative = np.cumsum(values[order]) / values.sum()
+        keep = min(keep, int(np.searchsorted(cumulative, mass) + 1))
+    kept = np.sort(order[:keep])
+    return indices[kept], values[kept]
+
+
+def prune_sparse(sparse_matrix, top_n=SPARSE_TOP_N, mass=SPARSE_MASS):
+    """Élague chaque ligne d'une matrice sparse scipy (sortie de BGE-M3)"""
+    if top_n is None and mass is None:
+        return sparse_matrix
+    from scipy.sparse import csr_array
+
+    csr = sparse_matrix.tocsr()
+    rows, cols, data = [], [], []
+    for r in range(csr.shape[0]):
+        start, end = csr.indptr[r], csr.indptr[r + 1]
+        idx, val = prune_sparse_row(csr.indices[start:end], csr.data[start:end], top_n, mass)
+        rows.extend([r] * len(idx))
+        cols.extend(idx.tolist())
+        data.extend(val.tolist())
+    return csr_array((data, (rows, cols)), shape=csr.shape)
+
+
+def quantize_int8(vectors):
+    """Quantification scalaire par dimension (min/max) -> codes uint8, échelle, offset"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    low = vectors.min(axis=0)
+    scale = (vectors.max(axis=0) - low) / 255.0
+    scale[scale == 0] = 1.0
+    codes = np.round((vectors - low) / scale).astype(np.uint8)
+    return codes, scale, low
+
+
+def dequantize_int8(codes, scale, low):
+    return codes.astype(np.float32) * scale + low
+
+# ==============================
+# 4. Re-scoring exact des candidats
+# ==============================
+def save_full_precision(keys, vectors, path=FULL_PRECISION_PATH):
+    """Sauvegarde des vecteurs float32 (fusion avec les corpus déjà présents)"""
+    path = Path(path)
+    keys = [list(k) for k in keys]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    keys_path = path.with_suffix(".json")
+    if path.exists() and keys_path.exists():
+        with open(keys_path, "r", encoding="utf-8") as f:
+            old_keys = json.load(f)["keys"]
+        old_vectors = np.load(path)
+        new_sources = {k[0] for k in keys}
+        kept = [i for i, k in enumerate(old_keys) if k[0] not in new_sources]
+        keys = [old_keys[i] for i in kept] + keys
+        vectors = np.vstack([old_vectors[kept], vectors]) if kept else vectors
+    np.save(path, vectors)
+    with open(keys_path, "w", encoding="utf-8") as f:
+        json.dump({"keys": keys}, f, ensure_ascii=False)
+
+
+class Rescorer:
+    """Produit scalaire exact en float32 sur les candidats d'une recherche compressée"""
+
+    def __init__(self, path=FULL_PRECISION_PATH):
+        path = Path(path)
+        self.vectors = np.load(path, mmap_mode="r")
+        with open(path.with_suffix(".json"), "r", encoding="utf-8") as f:
+            self.rows = {(s, i): row for row, (s, i) in enumerate(json.load(f)["keys"])}
+
+    @classmethod
+    def open_if_exists(cls, path=FULL_PRECISION_PATH):
+        path = Path(path)
+        if path.exists() and path.with_suffix(".json").exists():
+            return cls(path)
+        return None
+
+    def score(self, query_vec, keys):
+        """Scores exacts pour des clés (source, chunk_index) ; None si inconnue"""
+        query = np.asarray(query_vec, dtype=np.float32)
+        scores = []
+        for key in keys:
+            row = self.rows.get(key)
+            scores.append(None if row is None else float(self.vectors[row] @ query))
+        return scores
+
+# ==============================
+# 5. Benchmark : mémoire, latence, perte de rappel
+# ==============================
+def _recall(reference, candidate):
+    return np.mean([len(set(r) & set(c)) / len(r) for r, c in zip(reference, candidate)])
+
+
+def _top_k(scores, k):
+    part = np.argpartition(-scores, k, axis=1)[:, :k]
+    order = np.take_along_axis(scores, part, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(part, order, axis=1)
+
+
+def benchmark(n_vectors=20000, dim=1024, n_queries=200, k=10, vocab=250002, nnz=60, seed=0):
+    """Compare les modes sur des vecteurs stockés (dense_fp32.npy) ou synthétiques"""
+    rng = np.random.default_rng(seed)
+    if FULL_PRECISION_PATH.exists():
+        base = np.load(FULL_PRECISION_PATH).astype(np.float32)
+        print(f"Vecteurs réels: {base.shape}")
+    else:
+        base = rng.standard_normal((n_vectors, dim)).astype(np.float32)
+        base /= np.linalg.norm(base, axis=1, keepdims=True)
+        print(f"Vecteurs synthétiques: {base.shape}")
+    queries = base[rng.choice(len(base), size=min(n_queries, len(base)), replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    k = min(k, len(base) - 1)
+
+    reference = _top_k(queries @ base.T, k)
+    print(f"\n{'mode':<10}{'mémoire':>12}{'latence/req':>14}{'rappel@' + str(k):>12}{'rescoré':>10}")
+    for mode in DENSE_MODES:
+        if mode == "float32":
+            stored, scorer = base, (lambda q: q @ base.T)
+            memory = base.nbytes
+        elif mode == "float16":
+            stored = base.astype(np.float16)
+            scorer = lambda q: (q.astype(np.float16) @ stored.T).astype(np.float32)
+            memory = stored.nbytes
+        else:
+            codes, scale, low = quantize_int8(base)
+            approx = dequantize_int8(codes, scale, low)
+            scorer = lambda q: q @ approx.T
+            memory = codes.nbytes + scale.nbytes + low.nbytes
+
+        start = time.perf_counter()
+        candidates = _top_k(scorer(queries), k * 2)
+        latency = (time.perf_counter() - start) / len(queries)
+        found = candidates[:, :k]
+
+        # Re-scoring exact des 2k candidats en float32
+        exact = np.einsum("qd,qkd->qk", queries, base[candidates])
+        rescored = np.take_along_axis(candidates, exact.argsort(axis=1)[:, ::-1][:, :k], axis=1)
+
+        print(f"{mode:<10}{memory / 2**20:>10.1f}Mo{1000 * latency:>12.2f}ms"
+              f"{_recall(reference, found):>12.3f}{_recall(reference, rescored):>10.3f}")
+
+    # Sparse : vecteurs synthétiques à poids décroissants (profil BGE-M3)
+    print(f"\n{'élagage sparse':<20}{'nnz moyen':>10}{'mémoire':>12}{'rappel@' + str(k):>12}")
+    n_docs = min(len(base), 5000)
+    docs = [(rng.choice(vocab, nnz, replace=False), rng.exponential(0.1, nnz).astype(np.float32))
+            for _ in range(n_docs)]
+    qs = [docs[i] for i in rng.choice(n_docs, 100, replace=False)]
+
+    def sparse_scores(doc_set, q):
+        qmap = dict(zip(q[0].tolist(), q[1].tolist()))
+        return np.array([sum(qmap.get(int(t), 0.0) * w for t, w in zip(idx, val)) for idx, val in doc_set])
+
+    full_ref = [np.argsort(-sparse_scores(docs, q))[:k] for q in qs]
+    for label, top_n, mass in [("aucun", None, None), ("top-32", 32, None),
+                               ("top-16", 16, None), ("masse 0.8", None, 0.8)]:
+        pruned = [prune_sparse_row(idx, val, top_n, mass) for idx, val in docs]
+        avg_nnz = np.mean([len(idx) for idx, _ in pruned])
+        memory = sum(len(idx) * 8 for idx, _ in pruned)  # int32 + float32 par poids
+        found = [np.argsort(-sparse_scores(pruned, q))[:k] for q in qs]
+        print(f"{label:<20}{avg_nnz:>10.1f}{memory / 2**20:>10.2f}Mo{_recall(full_ref, found):>12.3f}")
+
+
+if __name__ == "__main__":
+    benchmark(n_vectors=int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
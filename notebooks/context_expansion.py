@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+from chunk_store import STORE_PATH, ChunkStore, write_chunk_store
+from dedup import DEDUP_MAP_PATH
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Mode "small-to-big" (CHATBOT_SMALL_TO_BIG=1) : la collection indexe des petits
+# chunks (correspondance plus précise, encodage moins cher) et chaque passage
+# retrouvé est élargi à ses voisins (source, chunk_index) lus dans le chunk store.
+# Comme DENSE_MODE, le mode doit correspondre à la collection servie.
+SMALL_TO_BIG = os.environ.get("CHATBOT_SMALL_TO_BIG") == "1"
+
+# Voisins ajoutés de chaque côté d'un passage (0 = pas d'élargissement)
+NEIGHBOR_RADIUS = int(os.environ.get("CHATBOT_NEIGHBOR_RADIUS", "2" if SMALL_TO_BIG else "0"))
+# Les fenêtres sont déjà bornées (3 x rayon + 1 chunks après fusion) : le
+# prompt en garde plus que les 500 caractères d'un chunk seul
+PROMPT_CHARS = 4000
+# Budget total des extraits dans le prompt (~1700 tokens) : au-delà, les
+# fenêtres les moins bien classées sont raccourcies puis abandonnées
+CONTEXT_CHARS = int(os.environ.get("CHATBOT_CONTEXT_CHARS", "6000"))
+MIN_EXCERPT_CHARS = 200      # en dessous, un extrait raccourci n'apporte plus rien
+
+# Petits chunks, redécoupés depuis les chunks de 512 mots
+SMALL_CHUNK_SIZE = 128
+SMALL_OVERLAP = 16
+BIG_OVERLAP = 50             # recouvrement des chunks de chunking.py
+MIN_OVERLAP = 5              # en dessous, deux chunks sont simplement concaténés
+
+SMALL_STORE_PATH = Path("data") / "chunk_store_small.bin"
+SMALL_DEDUP_MAP_PATH = Path("data") / "dedup_map_small.json"
+BIG_CHUNK_FILES = [Path("data") / "code_travail_chunks.json", Path("data") / "manuel_chunks.json"]
+
+# Fichiers lus à l'indexation et à la requête selon le mode
+INDEX_CHUNK_FILES = [SMALL_STORE_PATH] if SMALL_TO_BIG else BIG_CHUNK_FILES
+INDEX_STORE_PATH = SMALL_STORE_PATH if SMALL_TO_BIG else STORE_PATH
+INDEX_DEDUP_MAP_PATH = SMALL_DEDUP_MAP_PATH if SMALL_TO_BIG else DEDUP_MAP_PATH
+
+# ==============================
+# 2. Recollage des chunks consécutifs
+# ==============================
+def overlap_words(left, right, expected=None, max_overlap=64):
+    """Nombre de mots communs entre la fin de `left` et le début de `right`"""
+    if expected and left[-expected:] == right[:expected]:
+        return expected
+    for k in range(min(max_overlap, len(left), len(right)), MIN_OVERLAP - 1, -1):
+        if left[-k:] == right[:k]:
+            return k
+    return 0
+
+
+def join_chunks(texts, expected_overlap=None):
+    """Texte continu de chunks consécutifs, sans répéter leurs recouvrements"""
+    words = []
+    for text in texts:
+        chunk_words = text.split()
+        words.extend(chunk_words[overlap_words(words, chunk_words, expected_overlap):])
+    return " ".join(words)
+
+
+def rechunk(chunks, chunk_size=SMALL_CHUNK_SIZE, overlap=SMALL_OVERLAP):
+    """Redécoupe des chunks (format JSON) en chunks plus petits, corpus par corpus"""
+    from chunking import split_into_chunks
+
+    by_source = {}
+    for c in sorted(chunks, key=lambda c: (c["source"], c["chunk_index"])):
+        by_source.setdefault(c["source"], []).append(c["text"])
+
+    small = []
+    for source, texts in by_source.items():
+        text = join_chunks(texts, BIG_OVERLAP)
+        for i, chunk in enumerate(split_into_chunks(text, chunk_size, overlap)):
+            small.append({"id": f"{source}_{i + 1}", "source": source, "chunk_index": i + 1, "text": chunk})
+    return small
+
+# ==============================
+# 3. Élargissement des passages à la requête
+# ==============================
+def expand_passages(passages, store, radius=NEIGHBOR_RADIUS, max_chunks=None):
+    """Élargit chaque passage à ses voisins et fusionne les fenêtres qui se recouvrent.
+
+    Les fenêtres d'un même corpus qui se touchent sont réunies (dans la limite
+    de max_chunks, par défaut 3 x radius + 1) ; sinon la suivante est rognée
+    pour ne pas répéter de texte. Le passage garde le chunk_index du meilleur
+    hit et gagne "chunk_range".
+    """
+    if radius <= 0 or store is None:
+        return passages
+    max_chunks = max_chunks or 3 * radius + 1
+
+    windows = {}
+    for p in passages:
+        first, last = store.neighbors(p["source"], p["chunk_index"], radius)
+        windows.setdefault(p["source"], []).append([first, last, p])
+
+    merged = []
+    for source, items in windows.items():
+        items.sort(key=lambda w: w[0])
+        current = items[0]
+        for first, last, p in items[1:]:
+            if first <= current[1] + 1 and max(last, current[1]) - current[0] < max_chunks:
+                current[1] = max(current[1], last)
+                if p["score"] > current[2]["score"]:
+                    current[2] = p
+                continue
+            if p["chunk_index"] <= current[1]:
+                continue  # hit déjà dans la fenêtre pleine
+            merged.append(current)
+            current = [max(first, current[1] + 1), last, p]
+        merged.append(current)
+
+    expected = SMALL_OVERLAP if Path(store.path).name == SMALL_STORE_PATH.name else BIG_OVERLAP
+    expanded = []
+    for first, last, best in merged:
+        texts = [store.get_by_source(best["source"], i) for i in range(first, last + 1)]
+        expanded.append(dict(best, chunk_range=(first, last), text=join_chunks(texts, expected)))
+    return sorted(expanded, key=lambda p: p["score"], reverse=True)
+
+# ==============================
+# 4. Construction et mesures
+# ==============================
+def build_small_index(chunk_files=BIG_CHUNK_FILES, store_path=SMALL_STORE_PATH,
+                      dedup_path=SMALL_DEDUP_MAP_PATH):
+    """Petits chunks -> chunk store et carte des doublons du mode small-to-big"""
+    from chunk_store import load_chunks
+    from dedup import write_dedup_map
+
+    chunks = [c for path in chunk_files for c in load_chunks(path)]
+    small = rechunk(chunks)
+    write_chunk_store(small, store_path)
+    write_dedup_map(small, dedup_path)
+    return small
+
+
+def report(store_path=SMALL_STORE_PATH, radius=None, n_passages=2000):
+    """Taille des chunks indexés, coût de l'élargissement et taille du contexte"""
+    from chunk_store import load_chunks
+
+    radius = radius if radius is not None else (NEIGHBOR_RADIUS or 2)
+    big = [c for path in BIG_CHUNK_FILES for c in load_chunks(path)]
+    store = ChunkStore(store_path)
+    small_words = [len(store.get_by_source(s, i).split()) for s, i in store.keys]
+    print(f"Chunks indexés: {len(big)} x {sum(len(c['text'].split()) for c in big) / len(big):.0f} mots "
+          f"→ {len(store)} x {sum(small_words) / len(small_words):.0f} mots (encodage par chunk ~"
+          f"{SMALL_CHUNK_SIZE / 512:.0%} du coût, attention quadratique en plus)")
+
+    step = max(1, len(store.keys) // n_passages)
+    passages = [{"source": s, "chunk_index": i, "text": "", "score": 1.0} for s, i in store.keys[::step]]
+    start = time.perf_counter()
+    windows = [expand_passages([p], store, radius) for p in passages]
+    elapsed = time.perf_counter() - start
+    words = [len(w[0]["text"].split()) for w in windows]
+    print(f"Élargissement (rayon {radius}): {1e6 * elapsed / len(passages):.1f} µs/passage, "
+          f"fenêtre moyenne {sum(words) / len(words):.0f} mots")
+
+    # Passages adjacents : fusionnés en une fenêtre, sans texte répété
+    s, i = store.keys[len(store.keys) // 2]
+    pair = [{"source": s, "chunk_index": i, "text": "", "score": 1.0},
+            {"source": s, "chunk_index": i + 1, "text": "", "score": 0.5}]
+    merged = expand_passages(pair, store, radius)
+    print(f"2 hits adjacents → {len(merged)} fenêtre(s) {merged[0]['chunk_range']}, "
+          f"{len(merged[0]['text'].split())} mots")
+
+
+if __name__ == "__main__":
+    # Usage : python context_expansion.py build | report [rayon]
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if command == "build":
+        build_small_index()
+        print("Indexation : CHATBOT_SMALL_TO_BIG=1 python versioning.py build")
+    else:
+        report(radius=int(sys.argv[2]) if len(sys.argv) > 2 else None)
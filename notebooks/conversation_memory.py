@@ -0,0 +1,238 @@
+import os
+import re
+import sys
+import threading
+
+from chunk_store import chunk_key
+from faq_cache import normalize_question
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Budget du résumé des échanges précédents inséré dans le prompt (tokens
+# estimés) : le coût d'évaluation du prompt sur CPU reste borné quel que soit
+# le nombre de tours.
+MEMORY_TOKENS = int(os.environ.get("CHATBOT_MEMORY_TOKENS", "250"))
+CHARS_PER_TOKEN = 3.5          # estimation pour du français (tokenizer Qwen)
+ANSWER_SUMMARY_CHARS = 160     # une phrase de la réponse gardée par tour
+
+# Passages des tours précédents gardés pour être réutilisés
+MAX_CACHED_PASSAGES = 12
+# Part des termes de la question reformulée présents dans un passage pour qu'il
+# soit jugé encore pertinent ; même seuil sur les termes propres de la question
+# de suivi ("cadre" dans "Et pour un cadre ?"), que le sujet ajouté ne couvre pas
+REUSE_MIN_MATCH = 0.6
+
+# Détection des questions de suivi ("et en cas de faute grave ?")
+FOLLOW_UP_PREFIXES = ("et ", "mais ", "alors ", "ou ", "sinon ", "dans ce cas", "qu en est il",
+                      "quid ", "pareil", "meme chose", "aussi ")
+ANAPHORS = {"il", "elle", "ils", "elles", "ce", "cet", "cette", "ces", "cela", "ca", "celui", "celle",
+            "ceux", "celles", "lui", "leur", "leurs", "son", "sa", "ses", "y"}
+MAX_FOLLOW_UP_TERMS = 4        # question très courte = suite de la précédente
+TOPIC_TERMS = 6                # termes du sujet ajoutés à une question de suivi
+
+STOPWORDS = {
+    "a", "au", "aux", "avec", "c", "ce", "ces", "cette", "d", "dans", "de", "des", "du", "elle", "en",
+    "est", "et", "il", "ils", "j", "je", "l", "la", "le", "les", "leur", "lui", "m", "ma", "mais", "me",
+    "mes", "mon", "n", "ne", "nous", "on", "ou", "par", "pas", "pour", "qu", "que", "quel", "quelle",
+    "quelles", "quels", "qui", "s", "sa", "se", "ses", "si", "son", "sont", "sur", "t", "ta", "te",
+    "tes", "ton", "tu", "un", "une", "vos", "votre", "vous", "y", "comment", "quoi", "quand", "combien",
+    "peut", "doit", "faut", "etre", "avoir", "cas", "alors", "aussi", "sinon", "en", "est-ce", "quid",
+}
+
+
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def content_terms(text):
+    """Termes significatifs d'un texte, normalisés (minuscules, sans accents), dans l'ordre"""
+    return [t for t in normalize_question(text).split() if t not in STOPWORDS and len(t) > 1]
+
+
+def first_sentence(text, limit=ANSWER_SUMMARY_CHARS):
+    text = " ".join(text.split())
+    match = re.search(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[:limit].rsplit(" ", 1)[0] + "..."
+
+# ==============================
+# 2. Mémoire d'une conversation
+# ==============================
+class ConversationMemory:
+    """État d'une conversation : sujet courant, résumé borné, passages déjà lus.
+
+    - rewrite() transforme une question de suivi en requête autonome pour la
+      recherche (sujet de la question précédente ajouté), sans appel au LLM ;
+    - summary() rend un résumé extractif des tours précédents (une ligne par
+      tour, les plus anciennes abandonnées au-delà de MEMORY_TOKENS) ;
+    - passages_for() réutilise, pour une question de suivi, les passages déjà
+      lus s'ils couvrent encore la requête et les termes propres de la
+      question ; sinon la recherche est faite et complétée par ceux qui
+      correspondent.
+    """
+
+    def __init__(self, memory_tokens=MEMORY_TOKENS, max_passages=MAX_CACHED_PASSAGES):
+        self.memory_tokens = memory_tokens
+        self.max_passages = max_passages
+        self.turns = []            # (question autonome, résumé de la réponse)
+        self.passages = []         # passages des tours précédents, plus récents en tête
+        self.stats = {"turns": 0, "rewritten": 0, "reused": 0, "retrieved": 0}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.turns.clear()
+            self.passages.clear()
+
+    # ----- Reformulation -----
+    def is_follow_up(self, question):
+        if not self.turns:
+            return False
+        normalized = normalize_question(question)
+        words = normalized.split()
+        if not words:
+            return False
+        if f"{normalized} ".startswith(FOLLOW_UP_PREFIXES):
+            return True
+        terms = content_terms(question)
+        if len(terms) <= MAX_FOLLOW_UP_TERMS and any(w in ANAPHORS for w in words[:4]):
+            return True
+        return len(terms) <= 1
+
+    def rewrite(self, question):
+        """Requête autonome pour la recherche ; la question est rendue telle quelle si elle l'est déjà"""
+        if not self.is_follow_up(question):
+            return question
+        present = set(content_terms(question))
+        topic = []
+        for term in content_terms(self.turns[-1][0]):
+            if term not in present and term not in topic:
+                topic.append(term)
+        if not topic:
+            return question
+        return f"{question.strip()} ({' '.join(topic[:TOPIC_TERMS])})"
+
+    # ----- Résumé borné -----
+    def summary(self):
+        """Lignes des tours précédents, des plus récentes aux plus anciennes tant que le budget le permet"""
+        with self._lock:
+            lines, used = [], 0
+            for question, answer in reversed(self.turns):
+                line = f"- {question} → {answer}"
+                cost = estimate_tokens(line)
+                if used + cost > self.memory_tokens:
+                    break
+                lines.append(line)
+                used += cost
+            return "\n".join(reversed(lines))
+
+    # ----- Passages -----
+    @staticmethod
+    def match(query_terms, passage):
+        """Part des termes de la requête présents dans le passage"""
+        if not query_terms:
+            return 0.0
+        passage_terms = set(normalize_question(passage["text"]).split())
+        return sum(t in passage_terms for t in query_terms) / len(query_terms)
+
+    def passages_for(self, query, retrieve, top_k=3, sources=None, follow_up=True, question=None):
+        """Passages pour une requête autonome : réutilisés si ceux déjà lus suffisent
+
+        question : question de suivi telle que posée ; la requête reformulée
+        contient le sujet du tour précédent, que les passages déjà lus couvrent
+        toujours, donc la réutilisation exige aussi les termes de la question.
+        """
+        terms = set(content_terms(query))
+        own_terms = set(content_terms(question)) if question else set()
+        with self._lock:
+            cached = [p for p in self.passages if sources is None or p["source"] in sources]
+        matching = sorted(((self.match(terms, p), p) for p in cached), key=lambda x: x[0], reverse=True)
+        matching = [p for score, p in matching if score >= REUSE_MIN_MATCH]
+        reusable = [p for p in matching if not own_terms or self.match(own_terms, p) >= REUSE_MIN_MATCH]
+        # Une nouvelle question (pas une suite) passe toujours par la recherche
+        if follow_up and len(reusable) >= top_k:
+            self.stats["reused"] += 1
+            return reusable[:top_k]
+
+        self.stats["retrieved"] += 1
+        passages = list(retrieve(query) or [])
+        keys = {chunk_key(p["source"], p["chunk_index"]) for p in passages}
+        # Passages déjà lus qui correspondent toujours : ajoutés après les nouveaux
+        for p in matching:
+            if len(passages) >= top_k:
+                break
+            if chunk_key(p["source"], p["chunk_index"]) not in keys:
+                passages.append(p)
+        return passages
+
+    # ----- Mise à jour après réponse -----
+    def add_turn(self, question, standalone, answer, passages=None):
+        with self._lock:
+            self.stats["turns"] += 1
+            self.stats["rewritten"] += standalone != question
+            self.turns.append((standalone, first_sentence(answer)))
+            # Le résumé ne garde jamais plus de tours que le budget n'en permet
+            del self.turns[:-max(1, self.memory_tokens // 20)]
+            seen = set()
+            merged = []
+            for p in list(passages or []) + self.passages:
+                key = chunk_key(p["source"], p["chunk_index"])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(p)
+            self.passages = merged[:self.max_passages]
+
+# ==============================
+# 3. Démonstration : taille du prompt par tour
+# ==============================
+DEMO_CONVERSATION = [
+    "Quelles sont les conditions du licenciement pour motif économique ?",
+    "Et en cas de faute grave ?",
+    "Quel est le délai de préavis ?",
+    "Et pour un cadre ?",
+    "Comment est calculée l'indemnité de congé ?",
+    "Est-elle due en cas de démission ?",
+    "Quels sont les droits du travailleur malade ?",
+    "Et s'il est hospitalisé plus de six mois ?",
+]
+
+
+def demo(conversation=DEMO_CONVERSATION, top_k=3):
+    """Conversation scriptée sur la recherche hybride : requêtes reformulées,
+    réutilisation des passages et taille du prompt avec mémoire vs historique complet"""
+    from rag_generation import build_legal_prompt, retrieve_passages
+
+    memory = ConversationMemory()
+    history = ""
+    print(f"{'tour':<5}{'recherche':<10}{'prompt mémoire':>16}{'historique complet':>20}  requête")
+    for turn, question in enumerate(conversation, 1):
+        standalone = memory.rewrite(question)
+        before = dict(memory.stats)
+        passages = memory.passages_for(standalone, lambda q: retrieve_passages(q, top_k=top_k), top_k,
+                                       follow_up=standalone != question, question=question)
+        mode = "réutilisés" if memory.stats["reused"] > before["reused"] else "Milvus"
+        prompt = build_legal_prompt(question, passages, history=memory.summary())
+        # Réponse simulée : début du premier passage
+        answer = passages[0]["text"][:400] if passages else "Aucune information."
+        history += f"\nQuestion: {question}\nRéponse: {answer}\n"
+        naive = build_legal_prompt(question, passages) + history
+        print(f"{turn:<5}{mode:<10}{estimate_tokens(prompt):>12} tok{estimate_tokens(naive):>16} tok  {standalone}")
+        memory.add_turn(question, standalone, answer, passages)
+    print(f"Mémoire: {memory.stats}")
+
+
+if __name__ == "__main__":
+    # Usage : python conversation_memory.py [--stub]
+    # --stub : collection en mémoire et encodeur factice (sans Milvus ni BGE-M3)
+    if "--stub" in sys.argv:
+        import hybrid_search as hs
+        from chunk_store import load_chunks
+        from context_expansion import INDEX_CHUNK_FILES
+        from stubs import HashingEncoder, InMemoryCollection
+
+        encoder = HashingEncoder()
+        hs.ef = encoder
+        hs.collection = InMemoryCollection([c for f in INDEX_CHUNK_FILES for c in load_chunks(f)], encoder,
+                                           latency=0)
+    demo()
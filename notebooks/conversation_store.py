@@ -0,0 +1,158 @@
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+# ==============================
+# 1. Configuration
+# ==============================
+DB_PATH = Path("data") / "conversations.db"
+PAGE_SIZE = 20        # conversations affichées par page dans la sidebar
+CACHE_SIZE = 128      # réponses gardées en mémoire (LRU)
+
+# Clé de signature des identifiants de session : CHATBOT_SESSION_SECRET, sinon
+# une clé aléatoire créée au premier lancement et gardée dans ce fichier
+SESSION_SECRET_PATH = Path("data") / "session_secret"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    error INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_session_time
+    ON conversations (session_id, created_at DESC);
+"""
+
+# ==============================
+# 2. Identifiant de session signé
+# ==============================
+# L'URL ne porte qu'un jeton "<id>.<signature>" : un identifiant choisi ou
+# modifié à la main est refusé et remplacé par une nouvelle session.
+def _session_secret(path=SESSION_SECRET_PATH):
+    secret = os.environ.get("CHATBOT_SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    path = Path(path)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(secrets.token_hex(32), encoding="utf-8")
+    return path.read_text(encoding="utf-8").strip().encode("utf-8")
+
+
+def _signature(session_id, secret):
+    return hmac.new(secret, session_id.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def session_token(session_id, secret=None):
+    """Jeton à mettre dans l'URL pour retrouver l'historique de `session_id`"""
+    return f"{session_id}.{_signature(session_id, secret or _session_secret())}"
+
+
+def session_from_token(token, secret=None):
+    """Identifiant de session d'un jeton valide, sinon un nouvel identifiant"""
+    session_id, _, signature = (token or "").partition(".")
+    if session_id and hmac.compare_digest(signature, _signature(session_id, secret or _session_secret())):
+        return session_id
+    return uuid.uuid4().hex
+
+# ==============================
+# 3. Historique
+# ==============================
+class ConversationStore:
+    """Historique des échanges persistant (SQLite), partagé entre les sessions.
+
+    La sidebar ne lit qu'une page de titres à la fois ; le texte complet d'une
+    réponse n'est chargé qu'à l'affichage, puis gardé dans un cache LRU borné.
+    """
+
+    def __init__(self, db_path=DB_PATH, cache_size=CACHE_SIZE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def add(self, session_id, question, answer, error=False):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO conversations (session_id, question, answer, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, question, answer, int(error), time.time()),
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def get(self, conversation_id, session_id):
+        """Conversation complète par id (question, réponse, erreur, horodatage).
+
+        None si elle n'appartient pas à `session_id` : une session ne lit pas
+        l'historique d'une autre, même en connaissant l'id.
+        """
+        with self._lock:
+            if conversation_id in self._cache:
+                conv = self._cache[conversation_id]
+                if conv["session_id"] != session_id:
+                    return None
+                self._cache.move_to_end(conversation_id)
+                return conv
+            row = self._conn.execute(
+                "SELECT id, session_id, question, answer, error, created_at "
+                "FROM conversations WHERE id = ? AND session_id = ?", (conversation_id, session_id)
+            ).fetchone()
+            if row is None:
+                return None
+            conv = {
+                "id": row[0],
+                "session_id": row[1],
+                "question": row[2],
+                "answer": row[3],
+                "error": bool(row[4]),
+                "timestamp": datetime.fromtimestamp(row[5]),
+            }
+            self._cache[conversation_id] = conv
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return conv
+
+    def page(self, session_id, page=0, page_size=PAGE_SIZE, title_length=40):
+        """Titres d'une page d'historique, du plus récent au plus ancien"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, substr(question, 1, ?), length(question) > ?, created_at "
+                "FROM conversations WHERE session_id = ? "
+                "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (title_length, title_length, session_id, page_size, page * page_size),
+            ).fetchall()
+        return [{"id": r[0], "title": r[1] + ("..." if r[2] else ""),
+                 "timestamp": datetime.fromtimestamp(r[3])} for r in rows]
+
+    def count(self, session_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def clear(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+            for key in [k for k, v in self._cache.items() if v["session_id"] == session_id]:
+                del self._cache[key]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
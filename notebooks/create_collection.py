@@ -1,52 +1,65 @@
+import sys
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
+from partitions import ensure_partition, load_corpora
+from compression import DENSE_MODE, dense_field_dtype, dense_index_params
 
-# 1. Connexion à Milvus
-connections.connect("default", host="localhost", port="19530")
-print("Connecté à Milvus")
-
-# 2. Paramètres des embeddings
-DENSE_DIM = 1024 
-
-# 3. Définir le schéma de la collection hybride
-fields = [
-    FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-    FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=200),   
-    FieldSchema(name="chunk_index", dtype=DataType.INT64),                
-    FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=8000),    
-    FieldSchema(name="dense", dtype=DataType.FLOAT_VECTOR, dim=DENSE_DIM),  
-    FieldSchema(name="sparse", dtype=DataType.SPARSE_FLOAT_VECTOR),         
-]
-
-schema = CollectionSchema(fields, description="Collection hybride (dense + sparse) pour chatbot juridique")
-
-# 4. Créer la collection 
-collection_name = "chatbot_chunks_hybrid"
-if utility.has_collection(collection_name):
-    utility.drop_collection(collection_name)
-    print(f"Ancienne collection '{collection_name}' supprimée")
-
-collection = Collection(name=collection_name, schema=schema)
-print(f"Nouvelle collection '{collection_name}' créée avec champs dense et sparse")
-
-# 5. Créer les index
-# Index dense (vecteur continu)
-index_params_dense = {
-    "index_type": "HNSW",   
-    "metric_type": "IP",    
-    "params": {"M": 8, "efConstruction": 64}
-}
-collection.create_index(field_name="dense", index_params=index_params_dense)
-print("Index HNSW créé sur 'dense'")
-
-# Index sparse (vecteur lexical)
-index_params_sparse = {
-    "index_type": "SPARSE_INVERTED_INDEX",
-    "metric_type": "IP",
-    "params": {}
-}
-collection.create_index(field_name="sparse", index_params=index_params_sparse)
-print("Index inversé créé sur 'sparse'")
-
-# 6. Charger la collection
-collection.load()
-print("Collection hybride prête à recevoir les données")
+# 1. Paramètres des embeddings
+DENSE_DIM = 1024
+
+
+def create_hybrid_collection(collection_name):
+    """Crée et charge une collection hybride vide (jamais celle servie : voir versioning.py)"""
+    # 2. Définir le schéma de la collection hybride
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=200),
+        FieldSchema(name="chunk_index", dtype=DataType.INT64),
+        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=8000),
+        FieldSchema(name="dense", dtype=dense_field_dtype(), dim=DENSE_DIM),  # float32 ou float16 selon DENSE_MODE
+        FieldSchema(name="sparse", dtype=DataType.SPARSE_FLOAT_VECTOR),
+    ]
+
+    schema = CollectionSchema(fields, description="Collection hybride (dense + sparse) pour chatbot juridique")
+
+    # 3. Créer la collection
+    if utility.has_collection(collection_name):
+        raise ValueError(f"La collection '{collection_name}' existe déjà")
+
+    collection = Collection(name=collection_name, schema=schema)
+    print(f"Nouvelle collection '{collection_name}' créée avec champs dense et sparse")
+
+    # Une partition par corpus (recherche filtrée par source)
+    for source in load_corpora():
+        ensure_partition(collection, source)
+
+    # 4. Créer les index
+    # Index dense (vecteur continu) : HNSW, ou IVF_SQ8 en mode int8
+    index_params_dense = dense_index_params()
+    collection.create_index(field_name="dense", index_params=index_params_dense)
+    print(f"Index {index_params_dense['index_type']} créé sur 'dense' (mode {DENSE_MODE})")
+
+    # Index sparse (vecteur lexical)
+    index_params_sparse = {
+        "index_type": "SPARSE_INVERTED_INDEX",
+        "metric_type": "IP",
+        "params": {}
+    }
+    collection.create_index(field_name="sparse", index_params=index_params_sparse)
+    print("Index inversé créé sur 'sparse'")
+
+    # 5. Charger la collection
+    collection.load()
+    print("Collection hybride prête à recevoir les données")
+    return collection
+
+
+if __name__ == "__main__":
+    # Usage : python create_collection.py [nom]
+    # Crée seulement une collection vide (essais). Pour réindexer, utiliser
+    # `python versioning.py build` : création, remplissage, fichiers locaux
+    # figés dans data/versions/<nom>/, contrôle puis promotion.
+    from versioning import next_version_name
+
+    connections.connect("default", host="localhost", port="19530")
+    print("Connecté à Milvus")
+    create_hybrid_collection(sys.argv[1] if len(sys.argv) > 1 else next_version_name())
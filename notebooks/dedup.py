@@ -0,0 +1,203 @@
+import json
+import re
+import sys
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# ==============================
+# 1. Configuration
+# ==============================
+SHINGLE_SIZE = 5          # shingles de 5 mots
+NUM_PERM = 128            # taille de la signature MinHash
+BANDS = 32                # LSH : 32 bandes de 4 lignes
+THRESHOLD = 0.5           # Jaccard estimé minimal pour regrouper deux chunks
+# Seuil plus strict pour ne pas encoder un alias : sous ce seuil l'alias
+# contient encore trop de texte propre, il reste indexé et n'est fusionné
+# qu'au moment de la requête
+SKIP_EMBED_THRESHOLD = 0.8
+DEDUP_MAP_PATH = Path("data") / "dedup_map.json"
+
+# En cas de doublon, le chunk canonique est pris dans la source la plus
+# prioritaire (le texte officiel avant ses reproductions)
+SOURCE_PRIORITY = ["Code_du_travail", "Manuel_du_travailleur"]
+
+_MERSENNE = (1 << 31) - 1
+
+# ==============================
+# 2. Signatures MinHash
+# ==============================
+def shingles(text, size=SHINGLE_SIZE):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        # a, b, x < p = 2^31 - 1 : a*x + b tient dans un uint64 sans débordement
+        self.a = rng.integers(1, _MERSENNE, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingle_set):
+        if not shingle_set:
+            return np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _MERSENNE for s in shingle_set),
+                             dtype=np.uint64, count=len(shingle_set))
+        # h(x) = (a*x + b) mod p, calculé pour toutes les permutations à la fois
+        values = (hashes[:, None] * self.a[None, :] + self.b[None, :]) % _MERSENNE
+        return values.min(axis=0)
+
+
+def estimated_jaccard(sig_a, sig_b):
+    return float(np.mean(sig_a == sig_b))
+
+# ==============================
+# 3. LSH par bandes + regroupement
+# ==============================
+def lsh_candidate_pairs(signatures, bands=BANDS):
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        block = signatures[:, band * rows:(band + 1) * rows]
+        for i, row in enumerate(block):
+            buckets.setdefault(row.tobytes(), []).append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+def _priority(chunk):
+    source = chunk["source"]
+    rank = SOURCE_PRIORITY.index(source) if source in SOURCE_PRIORITY else len(SOURCE_PRIORITY)
+    return rank, source, chunk["chunk_index"]
+
+
+def find_duplicates(chunks, threshold=THRESHOLD, bands=BANDS, num_perm=NUM_PERM):
+    """Regroupe les quasi-doublons -> {id alias: (id canonique, similarité)}"""
+    hasher = MinHasher(num_perm)
+    signatures = np.stack([hasher.signature(shingles(c["text"])) for c in chunks])
+
+    neighbors = {}
+    for i, j in lsh_candidate_pairs(signatures, bands):
+        neighbors.setdefault(i, []).append(j)
+        neighbors.setdefault(j, []).append(i)
+
+    # Parcours par priorité : chaque chunk rejoint le canonique le plus proche
+    # déjà retenu, s'il est assez similaire à lui (pas de chaînage transitif
+    # qui fusionnerait des chunks sans rapport)
+    canonical_of = {}
+    alias_map = {}
+    for i in sorted(range(len(chunks)), key=lambda m: _priority(chunks[m])):
+        best, best_sim = None, threshold
+        for j in neighbors.get(i, ()):
+            if canonical_of.get(j) != j:
+                continue
+            sim = estimated_jaccard(signatures[i], signatures[j])
+            if sim >= best_sim:
+                best, best_sim = j, sim
+        if best is None:
+            canonical_of[i] = i
+        else:
+            canonical_of[i] = best
+            alias_map[chunks[i]["id"]] = (chunks[best]["id"], best_sim)
+    return alias_map
+
+
+def build_dedup_map(chunk_files, output_path=DEDUP_MAP_PATH, threshold=THRESHOLD):
+    chunks = []
+    for file in chunk_files:
+        with open(file, "r", encoding="utf-8") as f:
+            chunks.extend(json.load(f))
+    return write_dedup_map(chunks, output_path, threshold)
+
+
+def write_dedup_map(chunks, output_path=DEDUP_MAP_PATH, threshold=THRESHOLD):
+    start = time.perf_counter()
+    alias_map = find_duplicates(chunks, threshold)
+    elapsed = time.perf_counter() - start
+
+    aliases = {}
+    for alias, (canonical, sim) in alias_map.items():
+        aliases.setdefault(canonical, []).append([alias, round(sim, 3)])
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"threshold": threshold, "aliases": aliases}, f, ensure_ascii=False, indent=1)
+
+    print(f"Déduplication: {len(alias_map)} doublons sur {len(chunks)} chunks "
+          f"regroupés en {len(aliases)} clusters ({elapsed:.1f} s) → {output_path}")
+    return chunks, alias_map
+
+# ==============================
+# 4. Utilisation : ingestion et requête
+# ==============================
+def load_alias_map(path=DEDUP_MAP_PATH, min_similarity=THRESHOLD):
+    """{id alias: id canonique}, vide si la déduplication n'a pas été faite"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        aliases = json.load(f)["aliases"]
+    return {alias: canonical for canonical, members in aliases.items()
+            for alias, sim in members if sim >= min_similarity}
+
+
+def chunk_source(chunk_id):
+    """Source d'un id de chunk ("Code_du_travail_12" -> "Code_du_travail")"""
+    return chunk_id.rsplit("_", 1)[0]
+
+
+def skipped_aliases(alias_map):
+    """Alias non encodés : seulement ceux dont le canonique est dans la même source.
+
+    Un alias d'une autre source (Manuel reprenant un article du Code) reste
+    indexé dans sa partition, sinon une recherche limitée à sa source ne le
+    trouverait jamais ; il est fusionné au moment de la requête.
+    """
+    return {alias: canonical for alias, canonical in alias_map.items()
+            if chunk_source(alias) == chunk_source(canonical)}
+
+
+def drop_aliases(chunks, alias_map):
+    """Chunks à embarquer : les alias de la même source ne sont ni encodés ni indexés"""
+    skipped = skipped_aliases(alias_map)
+    return [c for c in chunks if c["id"] not in skipped]
+
+
+def collapse_duplicates(passages, alias_map):
+    """Ne garde que le premier passage de chaque cluster de doublons"""
+    if not alias_map:
+        return passages
+    seen = set()
+    kept = []
+    for p in passages:
+        key = f"{p['source']}_{p['chunk_index']}"
+        canonical = alias_map.get(key, key)
+        if canonical in seen:
+            continue
+        seen.add(canonical)
+        kept.append(p)
+    return kept
+
+
+if __name__ == "__main__":
+    data_dir = Path("data")
+    threshold = float(sys.argv[1]) if len(sys.argv) > 1 else THRESHOLD
+    chunks, alias_map = build_dedup_map(
+        [data_dir / "code_travail_chunks.json", data_dir / "manuel_chunks.json"],
+        DEDUP_MAP_PATH, threshold)
+
+    # Économies d'encodage et d'index (vecteurs denses float32 1024-d)
+    skipped = {a for a, (_, sim) in alias_map.items() if sim >= SKIP_EMBED_THRESHOLD}
+    words = sum(len(c["text"].split()) for c in chunks if c["id"] in skipped)
+    print(f"Chunks à encoder (alias >= {SKIP_EMBED_THRESHOLD}): {len(chunks)} → {len(chunks) - len(skipped)} "
+          f"(-{100 * len(skipped) / len(chunks):.1f} %), {words} mots non encodés, "
+          f"index dense économisé: {len(skipped) * 1024 * 4 / 1024:.0f} Ko")
+    print(f"Doublons fusionnés à la requête (>= {threshold}): {len(alias_map)}")
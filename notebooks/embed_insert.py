@@ -1,14 +1,28 @@
-import json
+import os
+import sys
 from pathlib import Path
-import torch
+import numpy as np
 from pymilvus import connections, Collection
-from pymilvus.model.hybrid import BGEM3EmbeddingFunction 
+from partitions import ensure_partition, drop_corpus
+from chunk_store import load_chunks
+from dedup import SKIP_EMBED_THRESHOLD, load_alias_map, drop_aliases
+from compression import (DENSE_MODE, SPARSE_TOP_N, SPARSE_MASS, compress_dense, needs_rescoring,
+                         prune_sparse_row, save_full_precision)
+from embedding_cache import embed_chunks
+from onnx_encoder import ENCODER_BACKEND, load_encoder
+from resources import apply as apply_profile
+from context_expansion import INDEX_CHUNK_FILES, INDEX_DEDUP_MAP_PATH
+from profiling import memory_snapshot, start_tracemalloc
+from versioning import ALIAS, LEGACY_NAME, live_collection_name
 
 # ==============================
-# 1. CPU uniquement
+# 1. CPU uniquement (threads répartis par resources.py, profil ingest)
 # ==============================
 device = "cpu"
-torch.set_num_threads(6)
+BUDGET = apply_profile("ingest")
+
+# Instantanés mémoire aux étapes clés si CHATBOT_TRACEMALLOC=1 (profiling.py)
+start_tracemalloc()
 
 # ==============================
 # 2. Connexion à Milvus
@@ -16,32 +30,60 @@ torch.set_num_threads(6)
 connections.connect("default", host="localhost", port="19530")
 print("Connecté à Milvus")
 
-collection_name = "chatbot_chunks_hybrid"
+# Cible : la version en construction, passée par versioning.py build (seul
+# chemin de réindexation). Jamais la collection servie : ses partitions
+# seraient vidées pendant le réencodage.
+collection_name = os.environ.get("CHATBOT_INGEST_COLLECTION")
+if not collection_name:
+    sys.exit("CHATBOT_INGEST_COLLECTION absent : réindexer avec `python versioning.py build`")
+if collection_name in (ALIAS, live_collection_name() or LEGACY_NAME):
+    sys.exit(f"{collection_name} est la collection servie : réindexer avec `python versioning.py build`")
 collection = Collection(collection_name)
+print(f"Collection cible: {collection_name}")
 collection.load()
 
 # ==============================
 # 3. Charger les JSON
 # ==============================
-data_dir = Path("data")
-files = [data_dir / "code_travail_chunks.json", data_dir / "manuel_chunks.json"]
+# Fichiers passés en argument : seuls ces corpus sont (ré)insérés, les autres
+# partitions restent intactes. Par défaut : chunks du mode d'index
+# (petits chunks si CHATBOT_SMALL_TO_BIG=1)
+files = [Path(f) for f in sys.argv[1:]] or INDEX_CHUNK_FILES
 
 documents = []
 for file in files:
-    with open(file, "r", encoding="utf-8") as f:
-        docs = json.load(f)
-        documents.extend(docs)
+    # JSON ou chunk store (.bin)
+    documents.extend(load_chunks(file))
 
 print(f"{len(documents)} chunks chargés")
 
+# Les quasi-doublons d'un chunk canonique de la même source ne sont ni encodés ni indexés
+alias_map = load_alias_map(INDEX_DEDUP_MAP_PATH, min_similarity=SKIP_EMBED_THRESHOLD)
+if alias_map:
+    documents = drop_aliases(documents, alias_map)
+    print(f"{len(documents)} chunks après déduplication")
+memory_snapshot("chunks-charges")
+
+# Repartir d'une partition vide pour chaque corpus réinséré
+for source in sorted({doc["source"] for doc in documents}):
+    drop_corpus(collection, source)
+    ensure_partition(collection, source)
+
 # ==============================
-# 4. Charger le modèle BGE-M3 via Milvus SDK
+# 4. Vecteurs : caches par document (embedding_cache.py, étapes embed:<source>
+# de pipeline.py) ; BGE-M3 n'est chargé que pour les chunks absents du cache
 # ==============================
-ef = BGEM3EmbeddingFunction(use_fp16=False, device=device)
-print(f"BGEM3EmbeddingFunction initialisé sur {device.upper()}")
+def _load_encoder():
+    ef = load_encoder(device=device)
+    print(f"Encodeur BGE-M3 initialisé sur {device.upper()} ({ENCODER_BACKEND})")
+    return ef
+
+
+full_precision, sparse_rows = embed_chunks(documents, _load_encoder)
+memory_snapshot("embeddings-charges")
 
 # ==============================
-# 5. Générer et insérer les embeddings par batch
+# 5. Insérer par batch (compression et élagage appliqués ici)
 # ==============================
 texts = [doc["text"] for doc in documents]
 sources = [doc["source"] for doc in documents]
@@ -49,30 +91,39 @@ indices = [doc["chunk_index"] for doc in documents]
 
 BATCH_SIZE = 50
 print(f"Insertion par batch de {BATCH_SIZE} chunks...")
+print(f"Compression: dense={DENSE_MODE}, sparse top_n={SPARSE_TOP_N}, masse={SPARSE_MASS}")
 
 for i in range(0, len(texts), BATCH_SIZE):
     batch_texts = texts[i:i+BATCH_SIZE]
     batch_sources = sources[i:i+BATCH_SIZE]
     batch_indices = indices[i:i+BATCH_SIZE]
 
-    # Génération des embeddings pour ce batch
-    embeddings = ef(batch_texts)
-    dense_vectors = embeddings["dense"]
-    sparse_vectors = embeddings["sparse"]
-
-    # Préparer entités
-    entities = [
-        batch_sources,     
-        batch_indices,     
-        batch_texts,       
-        dense_vectors,     
-        sparse_vectors     
-    ]
-
-    # Insertion
-    collection.insert(entities)
+    dense_vectors = compress_dense(full_precision[i:i+BATCH_SIZE])
+    sparse_vectors = []
+    for idx, val in sparse_rows[i:i+BATCH_SIZE]:
+        idx, val = prune_sparse_row(idx, val)
+        sparse_vectors.append(dict(zip(np.asarray(idx).tolist(), np.asarray(val).tolist())))
+
+    # Insertion dans la partition de chaque source
+    for source in dict.fromkeys(batch_sources):
+        rows = [j for j, s in enumerate(batch_sources) if s == source]
+
+        # Préparer entités
+        entities = [
+            [batch_sources[j] for j in rows],
+            [batch_indices[j] for j in rows],
+            [batch_texts[j] for j in rows],
+            [dense_vectors[j] for j in rows],
+            [sparse_vectors[j] for j in rows],
+        ]
+
+        collection.insert(entities, partition_name=ensure_partition(collection, source))
     print(f"Batch {i//BATCH_SIZE + 1} inséré ({len(batch_texts)} chunks)")
 
 collection.flush()
+# Vecteurs float32 conservés localement pour le re-scoring exact (index
+# compressé uniquement : en float32, Milvus a déjà les scores exacts)
+if needs_rescoring():
+    save_full_precision(list(zip(sources, indices)), full_precision)
 print("Insertion terminée")
 print(f"Nombre total d’entrées : {collection.num_entities}")
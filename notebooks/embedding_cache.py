@@ -0,0 +1,180 @@
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from chunk_store import load_chunks
+from context_expansion import SMALL_TO_BIG, rechunk
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Vecteurs BGE-M3 de chaque document, calculés une fois par version de son
+# fichier de chunks (étape embed:<source> de pipeline.py) : une nouvelle
+# version de collection (versioning.py build) ne fait qu'insérer ces vecteurs,
+# sans réencoder les documents qui n'ont pas changé.
+#   data/embeddings/<source>.npz        chunks de 512 mots
+#   data/embeddings/<source>_small.npz  petits chunks (CHATBOT_SMALL_TO_BIG=1)
+# Dense en float32 et sparse non élagué : compression et élagage
+# (compression.py) sont appliqués à l'insertion et ne rendent pas le cache périmé.
+CACHE_DIR = Path("data") / "embeddings"
+ENCODE_BATCH = 50
+# Moteur inscrit dans le cache ; "stub" pour l'encodeur factice (jamais relu
+# par un encodage réel). None = CHATBOT_ENCODER (onnx_encoder.py)
+BACKEND = None
+
+
+def cache_path(source, small_to_big=SMALL_TO_BIG):
+    return CACHE_DIR / f"{source}{'_small' if small_to_big else ''}.npz"
+
+
+def cache_meta():
+    """Ce qui rend les vecteurs incomparables : modèle et moteur d'inférence"""
+    from onnx_encoder import ENCODER_BACKEND, MODEL_NAME
+
+    return {"model": MODEL_NAME, "backend": BACKEND or ENCODER_BACKEND}
+
+
+def text_digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def document_chunks(chunk_file, small_to_big=SMALL_TO_BIG):
+    """Chunks indexés d'un document (redécoupés comme build_small_index en mode small-to-big)"""
+    chunks = load_chunks(chunk_file)
+    return rechunk(chunks) if small_to_big else chunks
+
+# ==============================
+# 2. Encodage et lecture du cache
+# ==============================
+def encode(chunks, encoder, batch_size=ENCODE_BATCH):
+    """-> dense float32 (n, dim), liste de (indices, poids) sparse non élagués"""
+    dense, sparse = [], []
+    for i in range(0, len(chunks), batch_size):
+        embeddings = encoder([c["text"] for c in chunks[i:i + batch_size]])
+        dense.extend(np.asarray(v, dtype=np.float32) for v in embeddings["dense"])
+        for j in range(len(embeddings["dense"])):
+            coo = embeddings["sparse"][j].tocoo()
+            sparse.append((np.asarray(coo.col, dtype=np.int64), np.asarray(coo.data, dtype=np.float32)))
+    return np.stack(dense) if dense else np.empty((0, 0), dtype=np.float32), sparse
+
+
+class EmbeddingCache:
+    """Vecteurs d'un document, retrouvés par id de chunk et empreinte de son texte.
+
+    Un chunk dont le texte a changé (ou un cache d'un autre modèle / moteur)
+    n'est pas trouvé : get() retourne None et le chunk est réencodé.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.rows = {}
+        if not self.path.exists():
+            return
+        with np.load(self.path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta != cache_meta():
+                print(f"Cache {self.path} ignoré ({meta['model']}, {meta['backend']})")
+                return
+            self.dense = data["dense"]
+            self.indptr = data["sparse_indptr"]
+            self.indices = data["sparse_indices"]
+            self.values = data["sparse_values"]
+            self.rows = {(cid, digest): r for r, (cid, digest) in enumerate(zip(data["ids"].tolist(),
+                                                                                data["digests"].tolist()))}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, chunk):
+        """(dense, (indices, poids)) ou None"""
+        r = self.rows.get((chunk["id"], text_digest(chunk["text"])))
+        if r is None:
+            return None
+        start, end = self.indptr[r], self.indptr[r + 1]
+        return self.dense[r], (self.indices[start:end], self.values[start:end])
+
+
+def write_cache(path, chunks, dense, sparse):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    indptr = np.cumsum([0] + [len(idx) for idx, _ in sparse]).astype(np.int64)
+    tmp = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp,
+             meta=np.array(json.dumps(cache_meta())),
+             ids=np.array([c["id"] for c in chunks]),
+             digests=np.array([text_digest(c["text"]) for c in chunks]),
+             dense=np.asarray(dense, dtype=np.float32),
+             sparse_indptr=indptr,
+             sparse_indices=np.concatenate([idx for idx, _ in sparse]) if sparse else np.empty(0, np.int64),
+             sparse_values=np.concatenate([val for _, val in sparse]) if sparse else np.empty(0, np.float32))
+    tmp.replace(path)
+
+
+def embed_chunks(chunks, load_encoder_fn, caches=None):
+    """Vecteurs des chunks : lus dans les caches des documents, encodés seulement s'ils manquent.
+
+    load_encoder_fn n'est appelé que s'il reste des chunks à encoder.
+    -> dense float32 (n, dim), liste de (indices, poids) sparse non élagués
+    """
+    caches = {} if caches is None else caches
+    dense, sparse, missing = [None] * len(chunks), [None] * len(chunks), []
+    for i, chunk in enumerate(chunks):
+        source = chunk["source"]
+        if source not in caches:
+            caches[source] = EmbeddingCache(cache_path(source))
+        hit = caches[source].get(chunk)
+        if hit is None:
+            missing.append(i)
+        else:
+            dense[i], sparse[i] = hit
+    if missing:
+        start = time.perf_counter()
+        new_dense, new_sparse = encode([chunks[i] for i in missing], load_encoder_fn())
+        for k, i in enumerate(missing):
+            dense[i], sparse[i] = new_dense[k], new_sparse[k]
+        print(f"{len(missing)} chunks absents du cache encodés en {time.perf_counter() - start:.1f} s")
+    print(f"Vecteurs: {len(chunks) - len(missing)} lus dans data/embeddings/, {len(missing)} encodés")
+    return (np.stack(dense) if chunks else np.empty((0, 0), dtype=np.float32)), sparse
+
+# ==============================
+# 3. Cache d'un document (étape embed:<source>)
+# ==============================
+def build_document_cache(chunk_file, source, path=None, load_encoder_fn=None):
+    """(Ré)écrit le cache d'un document ; les chunks inchangés ne sont pas réencodés"""
+    if load_encoder_fn is None:
+        from onnx_encoder import load_encoder
+        from resources import apply as apply_profile
+
+        def load_encoder_fn():
+            apply_profile("ingest")
+            return load_encoder()
+
+    path = Path(path or cache_path(source))
+    chunks = [c for c in document_chunks(chunk_file) if c["source"] == source]
+    start = time.perf_counter()
+    dense, sparse = embed_chunks(chunks, load_encoder_fn, caches={source: EmbeddingCache(path)})
+    write_cache(path, chunks, dense, sparse)
+    print(f"Cache {path}: {len(chunks)} chunks ({path.stat().st_size / 2**20:.1f} Mo) "
+          f"en {time.perf_counter() - start:.1f} s")
+    return path
+
+
+if __name__ == "__main__":
+    # Usage : python embedding_cache.py <fichier de chunks> <source> [--stub]
+    # --stub : encodeur factice de stubs.py (sans BGE-M3)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(args) != 2:
+        sys.exit("Usage : python embedding_cache.py <fichier de chunks> <source> [--stub]")
+    loader = None
+    if "--stub" in sys.argv:
+        from stubs import HashingEncoder
+
+        BACKEND = "stub"
+
+        def loader():
+            return HashingEncoder(latency=0)
+    build_document_cache(args[0], args[1], load_encoder_fn=loader)
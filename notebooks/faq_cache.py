@@ -0,0 +1,257 @@
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from context_expansion import INDEX_DEDUP_MAP_PATH, INDEX_STORE_PATH
+from versioning import STATE_PATH, served_version, sidecar_dir, sidecar_path
+
+# ==============================
+# 1. Configuration
+# ==============================
+FAQ_PATH = Path("data") / "faq_answers.json"
+QUESTIONS_PATH = Path("data") / "faq_questions.txt"
+
+# Fichiers dont dépend une réponse : si leur contenu change (ré-ingestion),
+# les réponses précalculées deviennent périmées. Ceux de la version servie
+# (data/versions/<collection>/, versioning.py) quand elle existe.
+CORPUS_FILES = [INDEX_STORE_PATH, INDEX_DEDUP_MAP_PATH]
+
+# Générations simultanées pendant le précalcul (un seul modèle Ollama sur CPU)
+MAX_WORKERS = 2
+
+# ==============================
+# 2. Normalisation et version du corpus
+# ==============================
+def normalize_question(question):
+    """Minuscules, sans accents ni ponctuation : "Congés payés ?" -> "conges payes" """
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.replace("'", " ").replace("’", " ")
+    return " ".join(re.findall(r"\w+", text))
+
+
+def corpus_files(files=CORPUS_FILES):
+    version = served_version()
+    directory = sidecar_dir(version) if version else None
+    return [sidecar_path(path, directory) for path in files]
+
+
+def corpus_stamp(files=CORPUS_FILES):
+    """(mtime, taille) du fichier d'état des versions et des fichiers du corpus : quelques stat()"""
+    stamp = []
+    for path in [STATE_PATH] + list(files):
+        try:
+            st = Path(path).stat()
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def corpus_version(files=None):
+    files = corpus_files() if files is None else files
+    digest = hashlib.sha1()
+    for path in files:
+        path = Path(path)
+        if path.exists():
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def is_error_answer(answer):
+    return not answer or answer.startswith(("Erreur", "Aucune information"))
+
+# ==============================
+# 3. Table des réponses précalculées
+# ==============================
+class FaqTable:
+    """Réponses précalculées servies instantanément pour les questions fréquentes.
+
+    Une entrée n'est servie que si elle a été calculée sur la version courante
+    du corpus ; les entrées périmées sont recalculées en arrière-plan, dans la
+    JobQueue de l'application (priorité basse). La version est revérifiée à
+    chaque lookup() par quelques stat() : une ré-ingestion ou une promotion
+    pendant que l'application tourne rend les entrées périmées aussitôt.
+    """
+
+    def __init__(self, path=FAQ_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries = {}
+        self._stamp = corpus_stamp()
+        self.version = corpus_version()
+        self._refresh_jobs = []
+        self._refresher = None     # (answer_fn, job_queue) du dernier rafraîchissement
+        self.stats = {"lookups": 0, "hits": 0, "stale": 0, "refresh_failed": 0}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+            print(f"FAQ: {len(self.entries)} réponses précalculées chargées")
+
+    def check_version(self):
+        """Recalcule la version du corpus si ses fichiers ont changé ; True dans ce cas"""
+        stamp = corpus_stamp()
+        if stamp == self._stamp:
+            return False
+        version = corpus_version()
+        with self._lock:
+            self._stamp = stamp
+            changed = version != self.version
+            self.version = version
+        if changed:
+            print(f"FAQ: corpus modifié (version {version}), réponses précalculées périmées")
+            if self._refresher is not None:
+                self.refresh_stale_async(*self._refresher)
+        return changed
+
+    def lookup(self, question):
+        """Réponse précalculée ou None"""
+        key = normalize_question(question)
+        self.check_version()
+        with self._lock:
+            self.stats["lookups"] += 1
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry["corpus_version"] != self.version:
+                self.stats["stale"] += 1
+                return None
+            self.stats["hits"] += 1
+            return entry["answer"]
+
+    def put(self, question, answer, passages):
+        entry = {
+            "question": question,
+            "answer": answer,
+            "passage_ids": [f"{p['source']}_{p['chunk_index']}" for p in passages],
+            "corpus_version": self.version,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self.entries[normalize_question(question)] = entry
+
+    def stale_questions(self):
+        with self._lock:
+            return [e["question"] for e in self.entries.values() if e["corpus_version"] != self.version]
+
+    def save(self):
+        with self._lock:
+            payload = {"corpus_version": self.version, "entries": self.entries}
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+        tmp.replace(self.path)
+
+    def refresh_one(self, question, answer_fn):
+        """Recalcule une entrée ; une erreur ne concerne que cette question"""
+        with self._lock:
+            entry = self.entries.get(normalize_question(question))
+            if entry is not None and entry["corpus_version"] == self.version:
+                return True
+        try:
+            answer, passages = answer_fn(question)
+        except Exception as e:
+            answer, passages = f"Erreur: {e}", None
+        if is_error_answer(answer):
+            self.stats["refresh_failed"] += 1
+            print(f"FAQ: échec du rafraîchissement: {question} ({answer[:80]})")
+            return False
+        self.put(question, answer, passages or [])
+        self.save()
+        return True
+
+    def refresh_stale_async(self, answer_fn, job_queue):
+        """Soumet à la JobQueue (priorité basse) le recalcul des entrées d'une ancienne version du corpus"""
+        self._refresher = (answer_fn, job_queue)
+        # Jobs d'un rafraîchissement précédent encore en attente : remplacés
+        for job in self._refresh_jobs:
+            job_queue.cancel(job)
+        stale = self.stale_questions()
+        if not stale:
+            return []
+        print(f"FAQ: rafraîchissement de {len(stale)} réponses périmées")
+        self._refresh_jobs = [job_queue.submit_background(self.refresh_one, q, answer_fn) for q in stale]
+        return self._refresh_jobs
+
+# ==============================
+# 4. Précalcul par lots
+# ==============================
+def precompute(questions, answer_fn, table, max_workers=MAX_WORKERS):
+    """answer_fn(question) -> (réponse, passages) ; nombre de générations simultanées borné"""
+    done = failed = 0
+    start = time.perf_counter()
+
+    def work(question):
+        t0 = time.perf_counter()
+        # Une question en erreur ne doit pas interrompre le lot (pool.map relance l'exception)
+        try:
+            answer, passages = answer_fn(question)
+        except Exception as e:
+            answer, passages = f"Erreur: {e}", None
+        return question, answer, passages, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for question, answer, passages, elapsed in pool.map(work, questions):
+            if is_error_answer(answer):
+                failed += 1
+                print(f"  échec ({elapsed:.1f} s): {question}")
+                continue
+            table.put(question, answer, passages)
+            table.save()
+            done += 1
+            print(f"  ok ({elapsed:.1f} s): {question}")
+
+    print(f"FAQ: {done} réponses calculées, {failed} échecs en {time.perf_counter() - start:.0f} s")
+    return done
+
+
+def questions_from_file(path=QUESTIONS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def questions_from_log(db_path, top_n=50):
+    """Questions les plus fréquentes de l'historique des conversations"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT question FROM conversations WHERE error = 0").fetchall()
+    conn.close()
+    counts = {}
+    for (question,) in rows:
+        key = normalize_question(question)
+        count, first = counts.get(key, (0, question))
+        counts[key] = (count + 1, first)
+    ranked = sorted(counts.values(), key=lambda x: x[0], reverse=True)
+    return [question for _, question in ranked[:top_n]]
+
+
+if __name__ == "__main__":
+    # Usage : python faq_cache.py [questions.txt] [--from-log N] [--stale] [--workers N]
+    # --stale : recalcule les réponses périmées du fichier FAQ (corpus modifié)
+    from rag_generation import answer_with_passages
+
+    args = sys.argv[1:]
+    workers = MAX_WORKERS
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    table = FaqTable()
+    if "--stale" in args:
+        questions = table.stale_questions()
+    elif "--from-log" in args:
+        i = args.index("--from-log")
+        questions = questions_from_log(Path("data") / "conversations.db", int(args[i + 1]))
+    else:
+        questions = questions_from_file(args[0] if args else QUESTIONS_PATH)
+
+    print(f"Précalcul de {len(questions)} questions (corpus {table.version}, {workers} workers)")
+    precompute(questions, answer_with_passages, table, max_workers=workers)
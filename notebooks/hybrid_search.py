@@ -1,50 +1,227 @@
-from pymilvus import connections, Collection
-from pymilvus.model.hybrid import BGEM3EmbeddingFunction
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from partitions import partition_names
+from chunk_store import ChunkStore, chunk_key
+from dedup import load_alias_map
+from compression import (DENSE_MODE, FULL_PRECISION_PATH, Rescorer, compress_dense, dense_search_params,
+                         needs_rescoring)
+from context_expansion import INDEX_DEDUP_MAP_PATH, INDEX_STORE_PATH, NEIGHBOR_RADIUS, expand_passages
+from local_index import LOCAL_INDEX_PATH, VECTOR_BACKEND, LocalCollection
+from onnx_encoder import ENCODER_BACKEND, load_encoder
+from resources import apply as apply_profile
+from versioning import SidecarWatcher, resolve_collection_name, sidecar_path
+
+# ==============================
+# 1. Connexion à Milvus et modèle (au premier appel)
+# ==============================
+# Chargés à la première recherche et non à l'import ; remplaçables par des
+# objets de même interface (ex: bouchons de loadtest.py) en affectant
+# hybrid_search.collection et hybrid_search.ef.
+# La collection est ouverte par l'alias de la version servie (versioning.py) :
+# Milvus résout l'alias à chaque requête, une promotion est donc prise en
+# compte sans redémarrage.
+# Avec CHATBOT_VECTOR_BACKEND=local, la collection est l'index local
+# memory-mappé (local_index.py), de même interface de recherche.
+collection = None
+ef = None
+_init_lock = threading.Lock()
+
+
+def get_collection():
+    global collection
+    with _init_lock:
+        if collection is None and VECTOR_BACKEND == "local":
+            # Index local memory-mappé (postes sans serveur Milvus)
+            collection = LocalCollection(LOCAL_INDEX_PATH)
+            collection.load()
+            print(f"Index local chargé: {LOCAL_INDEX_PATH} ({collection.num_entities} chunks)")
+        elif collection is None:
+            from pymilvus import connections, Collection
+
+            connections.connect("default", host="localhost", port="19530")
+            print("Connecté à Milvus")
+            collection = Collection(resolve_collection_name())
+            collection.load()
+    return collection
+
+
+def get_encoder():
+    global ef
+    with _init_lock:
+        if ef is None:
+            # Backend choisi par CHATBOT_ENCODER (torch, onnx, onnx-int8), threads
+            # limités par le profil de ressources (serve par défaut)
+            apply_profile()
+            ef = load_encoder()
+            print(f"Encodeur BGE-M3 initialisé ({ENCODER_BACKEND})")
+    return ef
 
 # ==============================
-# 1. Connexion à Milvus
+# 2. Données locales
 # ==============================
-connections.connect("default", host="localhost", port="19530")
-print("Connecté à Milvus")
+# Fichiers de la version servie (data/versions/<collection>/, versioning.py),
+# ou de data/ pour une collection d'avant le versionnement. Rouverts quand une
+# promotion ou un retour arrière change la version servie.
+#   CHUNK_STORE  textes des passages lus localement (memory-map) : Milvus ne
+#                renvoie que source, chunk_index et score. Sans chunk store, le
+#                texte vient de Milvus. En mode small-to-big, petits chunks
+#                indexés (context_expansion.py)
+#   ALIAS_MAP    quasi-doublons fusionnés au moment de la requête (alias -> canonique)
+#   RESCORER     re-scoring exact en float32 des candidats denses si l'index est compressé
+SIDECARS = SidecarWatcher()
+SIDECAR_DIR = None
+CHUNK_STORE = ALIAS_MAP = RESCORER = None
+
+
+def open_sidecars(directory):
+    global SIDECAR_DIR, CHUNK_STORE, ALIAS_MAP, RESCORER
+    CHUNK_STORE = ChunkStore.open_if_exists(sidecar_path(INDEX_STORE_PATH, directory))
+    ALIAS_MAP = load_alias_map(sidecar_path(INDEX_DEDUP_MAP_PATH, directory))
+    RESCORER = Rescorer.open_if_exists(sidecar_path(FULL_PRECISION_PATH, directory)) if needs_rescoring() else None
+    SIDECAR_DIR = directory
+
 
-collection_name = "chatbot_chunks_hybrid"
-collection = Collection(collection_name)
-collection.load()
+def sidecars():
+    return SIDECAR_DIR, CHUNK_STORE, ALIAS_MAP, RESCORER
+
+
+def restore_sidecars(saved):
+    global SIDECAR_DIR, CHUNK_STORE, ALIAS_MAP, RESCORER
+    SIDECAR_DIR, CHUNK_STORE, ALIAS_MAP, RESCORER = saved
+
+
+def refresh_sidecars():
+    """Rouvre les fichiers locaux si la version servie a changé ; True dans ce cas"""
+    directory = SIDECARS.poll()
+    if directory is False:
+        return False
+    open_sidecars(directory)
+    print(f"Fichiers locaux de la version {SIDECARS.version}: {directory or 'data/'}")
+    return True
+
+
+open_sidecars(SIDECARS.poll() or None)
 
 # ==============================
-# 2. Charger le modèle
+# 3. Profondeur adaptative
 # ==============================
-ef = BGEM3EmbeddingFunction(use_fp16=False, device="cpu")
-print("BGEM3EmbeddingFunction initialisé")
+# Mode adaptatif : la recherche sparse est faite d'abord ; si son premier
+# résultat domine nettement le second (question à mots-clés), la recherche
+# dense est sautée. La profondeur et ef ne sont augmentés que si les deux
+# signaux sont ambigus.
+# Désactivé par défaut : CHATBOT_ADAPTIVE_SEARCH=1 seulement après avoir vérifié
+# avec `python hybrid_search.py` (section 6) que le hit@5 du mode adaptatif
+# reste celui du mode fixe sur le corpus déployé.
+ADAPTIVE = os.environ.get("CHATBOT_ADAPTIVE_SEARCH", "0") == "1"
+SPARSE_DECISIVE_RATIO = 1.5    # score sparse n°1 / n°2 au-delà duquel le dense est inutile
+DENSE_AMBIGUOUS_MARGIN = 0.02  # écart de score dense n°1 - n°2 en dessous duquel le dense hésite
+MIN_AGREEMENT = 0.2            # part du top_k commune aux deux signaux en dessous de laquelle on élargit
+DEPTH, WIDE_DEPTH = 2, 4       # limit = top_k * profondeur
+EF, WIDE_EF = 64, 128
+
+logger = logging.getLogger("hybrid_search")
+DECISION_STATS = Counter()
+MISSING_TEXT = Counter()        # hits écartés faute de texte (chunk store périmé)
+
+
+def _search(field, vector, limit, ef_search, filter_expr, partitions, output_fields):
+    param = dense_search_params(DENSE_MODE, ef=ef_search) if field == "dense" else {"metric_type": "IP"}
+    return get_collection().search(
+        data=[vector],
+        anns_field=field,
+        param=param,
+        limit=limit,
+        expr=filter_expr,
+        partition_names=partitions,
+        output_fields=output_fields,
+    )[0]
+
+
+def _keys(hits):
+    return [(hit.entity.get("source"), hit.entity.get("chunk_index")) for hit in hits]
+
+
+def _sparse_decisive(hits):
+    if len(hits) == 0:
+        return False
+    if len(hits) == 1:
+        return True
+    return hits[1].distance <= 0 or hits[0].distance / hits[1].distance >= SPARSE_DECISIVE_RATIO
+
+
+def _ambiguous(dense_hits, sparse_hits, top_k):
+    """Signaux en désaccord et dense sans gagnant net -> élargir la recherche"""
+    if len(dense_hits) < 2:
+        return False
+    agreement = len(set(_keys(dense_hits)[:top_k]) & set(_keys(sparse_hits)[:top_k])) / top_k
+    margin = dense_hits[0].distance - dense_hits[1].distance
+    return agreement < MIN_AGREEMENT and margin < DENSE_AMBIGUOUS_MARGIN
 
 # ==============================
-# 3. Fonction de recherche hybride (dense + sparse + fusion RRF)
+# 4. Fonction de recherche hybride (dense + sparse + fusion RRF)
 # ==============================
-def hybrid_search(query, top_k=5, alpha=0.5,return_passages=True):
+def hybrid_search(query, top_k=5, alpha=0.5,return_passages=True, sources=None, filter_expr=None, adaptive=None,
+                  refresh=True):
+    # sources : liste de corpus à interroger (None = tous) -> seules leurs partitions sont parcourues
+    # filter_expr : expression de filtrage Milvus supplémentaire (ex: "chunk_index < 100")
+    # adaptive : None = valeur de ADAPTIVE ; False = toujours dense + sparse à profondeur fixe
+    # refresh : False pour garder les fichiers locaux ouverts (contrôle d'une version candidate)
+    adaptive = ADAPTIVE if adaptive is None else adaptive
+    partitions = partition_names(sources)
+    if refresh:
+        refresh_sidecars()
+    store, alias_map, rescorer = CHUNK_STORE, ALIAS_MAP, RESCORER
+    output_fields = ["source", "chunk_index"] if store is not None else ["source", "chunk_index", "text"]
+    search = lambda field, vec, depth, ef_search: _search(
+        field, vec, top_k * depth, ef_search, filter_expr, partitions, output_fields)
+
     # Générer embeddings
-    q_emb = ef([query])
+    q_emb = get_encoder()([query])
 
-    dense_vec = q_emb["dense"][0].tolist()
+    # Champ FLOAT16_VECTOR : même conversion qu'à l'ingestion (compress_dense) ;
+    # le re-scoring se fait sur le vecteur float32
+    query_dense = q_emb["dense"][0]
+    dense_vec = compress_dense([query_dense])[0] if DENSE_MODE == "float16" else query_dense.tolist()
 
     coo = q_emb["sparse"][0].tocoo()
     sparse_vec = {int(i): float(v) for i, v in zip(coo.col, coo.data)}
-    # Recherche dense
-    dense_results = collection.search(
-        data=[dense_vec],
-        anns_field="dense",
-        param={"metric_type": "IP", "params": {"ef": 64}},
-        limit=top_k * 2,  # on prend plus large avant fusion
-        output_fields=["source", "chunk_index", "text"],
-    )[0]
 
-    # Recherche sparse
-    sparse_results = collection.search(
-        data=[sparse_vec],
-        anns_field="sparse",
-        param={"metric_type": "IP"},
-        limit=top_k * 2,
-        output_fields=["source", "chunk_index", "text"],
-    )[0]
+    # Recherche sparse puis dense (on prend plus large que top_k avant fusion)
+    sparse_results = search("sparse", sparse_vec, DEPTH, EF)
+    if not adaptive:
+        decision = "fixed"
+        dense_results = search("dense", dense_vec, DEPTH, EF)
+    elif _sparse_decisive(sparse_results):
+        decision = "sparse_only"
+        dense_results = []
+    else:
+        dense_results = search("dense", dense_vec, DEPTH, EF)
+        if _ambiguous(dense_results, sparse_results, top_k):
+            decision = "widened"
+            sparse_results = search("sparse", sparse_vec, WIDE_DEPTH, WIDE_EF)
+            dense_results = search("dense", dense_vec, WIDE_DEPTH, WIDE_EF)
+        else:
+            decision = "both"
+    DECISION_STATS[decision] += 1
+    logger.info("%s: %r (sparse=%s, dense=%s)", decision, query[:60],
+                [round(h.distance, 3) for h in sparse_results[:2]],
+                [round(h.distance, 3) for h in dense_results[:2]])
+
+    # Re-classement exact des candidats denses (index float16 / int8)
+    if rescorer is not None and dense_results:
+        keys = _keys(dense_results)
+        exact = rescorer.score(query_dense, keys)
+        dense_results = [hit for _, hit in sorted(
+            zip(exact, dense_results),
+            key=lambda pair: pair[0] if pair[0] is not None else pair[1].distance,
+            reverse=True)]
 
     # Fusion via Reciprocal Rank Fusion (RRF)
     rrf_scores = {}
@@ -60,16 +237,43 @@ def hybrid_search(query, top_k=5, alpha=0.5,return_passages=True):
     merged = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)
 
     results = []
-    for (source, chunk_idx), score in merged[:top_k]:
-        entity = next(hit.entity for hit in (dense_results + sparse_results)
-                      if hit.entity.get("source") == source and hit.entity.get("chunk_index") == chunk_idx)
+    seen = set()
+    for (source, chunk_idx), score in merged:
+        if len(results) == top_k:
+            break
+        # Un seul passage par cluster de quasi-doublons
+        key = chunk_key(source, chunk_idx)
+        canonical = alias_map.get(key, key)
+        if canonical in seen:
+            continue
+
+        if store is not None and key in store:
+            # Seuls les passages finaux sont lus depuis le chunk store
+            text = store.get_by_source(source, chunk_idx)
+        else:
+            entity = next(hit.entity for hit in (list(dense_results) + list(sparse_results))
+                          if hit.entity.get("source") == source and hit.entity.get("chunk_index") == chunk_idx)
+            text = entity.get("text")
+        if text is None:
+            # Chunk store désynchronisé de la collection (reconstruit à part) :
+            # Milvus n'a pas renvoyé le texte, le hit est écarté
+            MISSING_TEXT[key] += 1
+            logger.warning("Chunk %s absent du chunk store %s, passage ignoré", key,
+                           store.path if store is not None else "(aucun)")
+            continue
+        seen.add(canonical)
         results.append({
             "source": source,
             "chunk_index": chunk_idx,
-            "text": entity.get("text"),
+            "text": text,
             "score": score
         })
 
+    # Small-to-big : chaque passage est élargi à ses voisins dans le corpus,
+    # les fenêtres qui se recouvrent sont fusionnées
+    if NEIGHBOR_RADIUS and store is not None:
+        results = expand_passages(results, store, NEIGHBOR_RADIUS)
+
     if return_passages:
         return results
 
@@ -79,7 +283,7 @@ def hybrid_search(query, top_k=5, alpha=0.5,return_passages=True):
         print(f"{i}. [Score={r['score']:.4f}] {r['source']} (chunk {r['chunk_index']})")
         print(f"   → {r['text']}...\n")
 # ==============================
-# 4. Questions de test
+# 5. Questions de test
 # ==============================
 # questions = [
 #     "Quels sont les droits du travailleur malade ?",
@@ -91,3 +295,80 @@ def hybrid_search(query, top_k=5, alpha=0.5,return_passages=True):
 
 # for q in questions:
 #     hybrid_search(q, top_k=5, alpha=0.5)
+
+# ==============================
+# 6. Benchmark du mode adaptatif
+# ==============================
+def labeled_questions(n=60, words=12, index_path=Path("data") / "article_index.json"):
+    """Questions étiquetées tirées de l'index des articles.
+
+    Chaque question reprend les premiers mots de la définition d'un article
+    (sans son numéro, pour ne pas passer par le routeur) ; les chunks qui
+    définissent l'article sont les réponses attendues.
+    """
+    from article_index import MAX_DEFINITIONS
+
+    with open(index_path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    texts = {}
+    for file in payload["chunk_files"]:
+        with open(file, "r", encoding="utf-8") as f:
+            texts.update((c["id"], c["text"]) for c in json.load(f))
+
+    questions = []
+    for article, entries in sorted(payload["articles"].items()):
+        definitions = [e for e in entries if e["kind"] == "definition"]
+        # Numéros définis trop souvent (conventions annexes) : ambigus, exclus comme par le routeur
+        if not definitions or len(definitions) > MAX_DEFINITIONS:
+            continue
+        first = definitions[0]
+        tokens = texts[first["id"]][first["offset"]:first["end"]].split()[2:]
+        body = [t for t in tokens if any(c.isalpha() for c in t)][:words]
+        if len(body) < words:
+            continue
+        questions.append({"question": " ".join(body),
+                          "expected": {chunk_key(e["source"], e["chunk_index"]) for e in definitions}})
+    step = max(1, len(questions) // n)
+    return questions[::step][:n]
+
+
+def label_hit(expected, keys):
+    """Un des chunks attendus (ou un de ses quasi-doublons) est-il parmi les résultats ?"""
+    canonical = {ALIAS_MAP.get(k, k) for k in expected}
+    return any(ALIAS_MAP.get(k, k) in canonical for k in keys)
+
+
+def benchmark(n=60, top_k=5):
+    """Latence gagnée et rappel gardé par le mode adaptatif par rapport au mode fixe"""
+    questions = labeled_questions(n)
+    encode = []
+    for q in questions:
+        start = time.perf_counter()
+        get_encoder()([q["question"]])
+        encode.append(time.perf_counter() - start)
+
+    runs = {}
+    for label, adaptive in [("fixe", False), ("adaptatif", True)]:
+        DECISION_STATS.clear()
+        latencies, found = [], []
+        for q in questions:
+            start = time.perf_counter()
+            passages = hybrid_search(q["question"], top_k=top_k, adaptive=adaptive)
+            latencies.append(time.perf_counter() - start)
+            found.append([chunk_key(p["source"], p["chunk_index"]) for p in passages])
+        runs[label] = (latencies, found, dict(DECISION_STATS))
+
+    encode_ms = 1000 * sum(encode) / len(encode)
+    fixed = runs["fixe"][1]
+    print(f"{len(questions)} questions étiquetées, top_k={top_k}, encodage {encode_ms:.1f} ms/question\n")
+    print(f"{'mode':<12}{'latence':>10}{'hors encodage':>15}{'hit@' + str(top_k):>8}{'recouvr. fixe':>15}  décisions")
+    for label, (latencies, found, decisions) in runs.items():
+        total_ms = 1000 * sum(latencies) / len(latencies)
+        hits = sum(label_hit(q["expected"], keys) for q, keys in zip(questions, found)) / len(questions)
+        overlap = sum(len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(fixed, found)) / len(questions)
+        print(f"{label:<12}{total_ms:>8.1f}ms{total_ms - encode_ms:>13.1f}ms{hits:>8.2f}{overlap:>15.2f}  {decisions}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 60)
@@ -0,0 +1,86 @@
+import ast
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Modules importés au démarrage de l'application en mode texte seul
+# (CHATBOT_TEXT_ONLY=1) : ils ne doivent charger ni la pile vocale, ni
+# l'encodeur, ni le client Milvus.
+MODULES = ["rag_generation", "hybrid_search", "audio_transcription"]
+APP_PATH = Path(__file__).with_name("app.py")
+
+# Budget d'import cumulé par module (ms), ajustable selon la machine
+BUDGET_MS = float(os.environ.get("CHATBOT_IMPORT_BUDGET_MS", "1000"))
+
+# Dépendances lourdes à ne charger qu'au premier usage
+FORBIDDEN = ("vosk", "sounddevice", "torch", "pymilvus", "onnxruntime", "transformers",
+             "scipy", "FlagEmbedding")
+
+# ==============================
+# 2. Mesure avec python -X importtime
+# ==============================
+def import_times(module):
+    """Importe `module` dans un processus neuf -> {module importé: cumul en µs}"""
+    env = dict(os.environ, CHATBOT_TEXT_ONLY="1")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=Path(__file__).parent, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} a échoué:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+        # Sortie en post-ordre : un module de premier niveau autre que `module`
+        # (site, encodings...) clôt les imports du démarrage de l'interpréteur
+        if name[1:2] != " " and name.strip() != module:
+            times = {}
+    return times
+
+
+def forbidden_in(names):
+    return sorted({n for n in names if n.split(".")[0] in FORBIDDEN})
+
+
+def app_top_level_imports(path=APP_PATH):
+    """Modules importés au niveau module de app.py (hors fonctions)"""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    names = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module)
+    return names
+
+
+def check(modules=MODULES, budget_ms=BUDGET_MS, top=8):
+    ok = True
+    for module in modules:
+        times = import_times(module)
+        total = times.get(module, 0) / 1000
+        heavy = forbidden_in(times)
+        status = "OK" if total <= budget_ms and not heavy else "ÉCHEC"
+        ok &= status == "OK"
+        print(f"{module:<22} {total:7.1f} ms / {budget_ms:.0f} ms  {status}")
+        if heavy:
+            print(f"  importe au démarrage: {', '.join(heavy)}")
+        slowest = sorted(((t, n) for n, t in times.items() if n != module), reverse=True)[:top]
+        print("  " + ", ".join(f"{n} {t / 1000:.0f} ms" for t, n in slowest))
+
+    # app.py ne peut pas être importé hors de streamlit : contrôle statique
+    heavy = forbidden_in(app_top_level_imports())
+    ok &= not heavy
+    print(f"{'app.py (imports)':<22} {'ÉCHEC: ' + ', '.join(heavy) if heavy else 'OK'}")
+    return ok
+
+
+if __name__ == "__main__":
+    # Usage : python import_budget.py [module ...]
+    sys.exit(0 if check(sys.argv[1:] or MODULES) else 1)
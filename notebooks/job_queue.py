@@ -0,0 +1,287 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Nombre de workers qui exécutent les générations en parallèle.
+# Un seul modèle Ollama tourne sur CPU : 1 ou 2 workers suffisent.
+NUM_WORKERS = int(os.environ.get("CHATBOT_QUEUE_WORKERS", "1"))
+
+# Taille maximale de la file (au-delà, les nouvelles demandes sont refusées)
+MAX_PENDING = int(os.environ.get("CHATBOT_QUEUE_MAX_PENDING", "20"))
+
+# Limitation par session : MAX_REQUESTS questions par fenêtre RATE_WINDOW (s)
+RATE_LIMIT_REQUESTS = int(os.environ.get("CHATBOT_RATE_LIMIT", "5"))
+RATE_LIMIT_WINDOW = float(os.environ.get("CHATBOT_RATE_WINDOW", "60"))
+
+# Une session sans signe de vie depuis SESSION_TIMEOUT secondes est
+# considérée comme fermée : ses jobs en attente sont annulés
+SESSION_TIMEOUT = float(os.environ.get("CHATBOT_SESSION_TIMEOUT", "30"))
+
+# Temps d'attente maximal dans la file avant abandon du job
+MAX_WAIT = float(os.environ.get("CHATBOT_QUEUE_MAX_WAIT", "300"))
+
+# Pseudo-session des jobs de fond (rafraîchissement FAQ) : servis seulement
+# quand aucune session n'attend
+BACKGROUND = "background"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class QueueFullError(Exception):
+    """La file est pleine : le serveur est saturé"""
+
+
+class RateLimitError(Exception):
+    """La session a dépassé son quota de questions"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Trop de questions, réessayez dans {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+# ==============================
+# 2. Job
+# ==============================
+class Job:
+    def __init__(self, session_id, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self._done.set()
+
+
+# ==============================
+# 3. File partagée avec ordonnancement équitable
+# ==============================
+class JobQueue:
+    """File de jobs en mémoire partagée entre toutes les sessions Streamlit.
+
+    Chaque session possède sa propre sous-file ; les workers servent les
+    sessions à tour de rôle (round-robin) pour qu'un utilisateur pressé ne
+    monopolise pas le modèle. Les jobs de fond (submit_background) passent
+    après toutes les sessions et ne comptent ni dans MAX_PENDING ni dans les
+    quotas.
+    """
+
+    def __init__(self, num_workers=NUM_WORKERS, max_pending=MAX_PENDING,
+                 rate_limit=RATE_LIMIT_REQUESTS, rate_window=RATE_LIMIT_WINDOW,
+                 session_timeout=SESSION_TIMEOUT, max_wait=MAX_WAIT):
+        self.num_workers = max(1, num_workers)
+        self.max_pending = max_pending
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.session_timeout = session_timeout
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._sessions = OrderedDict()  # session_id -> deque de jobs (ordre round-robin)
+        self._background = deque()      # jobs de fond, priorité basse
+        self._last_seen = {}
+        self._history = {}              # session_id -> timestamps des soumissions
+        self._pending = 0
+        self._running = 0
+        self._stopped = False
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0,
+                      "cancelled": 0, "rejected": 0, "rate_limited": 0, "background": 0}
+
+        self._workers = []
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+        self._reaper = threading.Thread(target=self._reaper_loop, name="job-reaper", daemon=True)
+        self._reaper.start()
+
+    # ---------- API publique ----------
+    def submit(self, session_id, func, *args, **kwargs):
+        """Ajouter un job pour une session. Lève RateLimitError ou QueueFullError."""
+        now = time.time()
+        with self._lock:
+            self._last_seen[session_id] = now
+
+            history = self._history.setdefault(session_id, deque())
+            while history and now - history[0] > self.rate_window:
+                history.popleft()
+            if len(history) >= self.rate_limit:
+                self.stats["rate_limited"] += 1
+                raise RateLimitError(self.rate_window - (now - history[0]))
+
+            if self._pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise QueueFullError("Serveur saturé, réessayez dans quelques instants")
+
+            job = Job(session_id, func, args, kwargs)
+            history.append(now)
+            self._sessions.setdefault(session_id, deque()).append(job)
+            self._pending += 1
+            self.stats["submitted"] += 1
+            self._not_empty.notify()
+            return job
+
+    def submit_background(self, func, *args, **kwargs):
+        """Job de priorité basse : exécuté quand aucune question d'utilisateur n'attend"""
+        with self._lock:
+            job = Job(BACKGROUND, func, args, kwargs)
+            self._background.append(job)
+            self.stats["background"] += 1
+            self._not_empty.notify()
+            return job
+
+    def touch(self, session_id):
+        """Signe de vie d'une session (à appeler à chaque rerun)"""
+        with self._lock:
+            self._last_seen[session_id] = time.time()
+
+    def position(self, job):
+        """Position du job dans la file (1 = prochain servi, 0 = en cours ou terminé)"""
+        with self._lock:
+            if job.status != PENDING:
+                return 0
+            queues = list(self._sessions.values())
+            # Simulation du round-robin : on dépile une tête de file par session à chaque tour
+            depth = [list(q) for q in queues]
+            position = 0
+            while True:
+                for jobs in depth:
+                    if not jobs:
+                        continue
+                    position += 1
+                    if jobs.pop(0) is job:
+                        return position
+                if not any(depth):
+                    return 0
+
+    def cancel(self, job):
+        with self._lock:
+            return self._cancel_locked(job)
+
+    def cancel_session(self, session_id):
+        """Annuler tous les jobs en attente d'une session"""
+        with self._lock:
+            jobs = list(self._sessions.get(session_id, ()))
+            return sum(self._cancel_locked(job) for job in jobs)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "background_pending": len(self._background),
+                "running": self._running,
+                "sessions": len(self._sessions),
+                "workers": self.num_workers,
+                **self.stats,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._stopped = True
+            self._not_empty.notify_all()
+
+    # ---------- Interne ----------
+    def _cancel_locked(self, job):
+        if job.status != PENDING:
+            return False
+        if job.session_id == BACKGROUND:
+            self._background.remove(job)
+            self.stats["cancelled"] += 1
+            job._finish(CANCELLED)
+            return True
+        jobs = self._sessions.get(job.session_id)
+        if jobs is not None:
+            try:
+                jobs.remove(job)
+            except ValueError:
+                pass
+            if not jobs:
+                del self._sessions[job.session_id]
+        self._pending -= 1
+        self.stats["cancelled"] += 1
+        job._finish(CANCELLED)
+        return True
+
+    def _next_job_locked(self):
+        if not self._sessions:
+            return self._background.popleft()
+        # Prendre la session en tête, puis la remettre en fin (round-robin)
+        session_id, jobs = next(iter(self._sessions.items()))
+        job = jobs.popleft()
+        if jobs:
+            self._sessions.move_to_end(session_id)
+        else:
+            del self._sessions[session_id]
+        self._pending -= 1
+        return job
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                while not self._sessions and not self._background and not self._stopped:
+                    self._not_empty.wait()
+                if self._stopped:
+                    return
+                job = self._next_job_locked()
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._running += 1
+
+            try:
+                result = job.func(*job.args, **job.kwargs)
+                status, error = DONE, None
+            except Exception as e:
+                result, status, error = None, FAILED, e
+
+            with self._lock:
+                self._running -= 1
+                self.stats["completed" if status == DONE else "failed"] += 1
+            job._finish(status, result, error)
+
+    def _reaper_loop(self):
+        """Annule les jobs des sessions fermées et ceux qui attendent trop longtemps"""
+        while True:
+            time.sleep(min(self.session_timeout, 5.0))
+            now = time.time()
+            with self._lock:
+                if self._stopped:
+                    return
+                for session_id in list(self._sessions):
+                    inactive = now - self._last_seen.get(session_id, 0) > self.session_timeout
+                    for job in list(self._sessions.get(session_id, ())):
+                        if inactive or now - job.submitted_at > self.max_wait:
+                            self._cancel_locked(job)
+                # Oublier les sessions inactives sans job
+                for session_id in list(self._last_seen):
+                    if session_id not in self._sessions and now - self._last_seen[session_id] > self.rate_window:
+                        self._last_seen.pop(session_id, None)
+                        self._history.pop(session_id, None)
@@ -0,0 +1,307 @@
+import argparse
+import contextlib
+import io
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+import hybrid_search as hs
+import rag_generation as rag
+from article_index import MAX_DEFINITIONS
+from chunk_store import load_chunks
+from dedup import SKIP_EMBED_THRESHOLD, drop_aliases, load_alias_map
+from faq_cache import is_error_answer, questions_from_file
+from job_queue import CANCELLED, DONE, JobQueue, QueueFullError, RateLimitError
+from query_log import QueryLog
+from stubs import FakeOllamaServer, HashingEncoder, InMemoryCollection
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Usage :
+#   python loadtest.py --users 8 --duration 60                  (boucle fermée, bouchons)
+#   python loadtest.py --rate 0.5 --requests 100 --workers 2    (arrivées de Poisson)
+#   python loadtest.py --backend real --users 2 --requests 10   (Milvus + Ollama réels)
+CHUNK_FILES = [Path("data") / "code_travail_chunks.json", Path("data") / "manuel_chunks.json"]
+DEFAULT_MIX = "faq=0.2,article=0.2,free=0.6"
+STAGES = ["queue", "faq", "retrieval", "generation", "total"]
+
+# ==============================
+# 2. Questions
+# ==============================
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"faq", "article", "free"}
+    if unknown:
+        raise ValueError(f"Catégories inconnues dans --mix: {sorted(unknown)}")
+    return mix
+
+
+def build_question_pool(n_free=200):
+    """Questions par catégorie : FAQ précalculée, citation d'article, question libre"""
+    articles = []
+    if rag.ARTICLE_ROUTER.load():
+        for article, entries in sorted(rag.ARTICLE_ROUTER.index.items()):
+            n_def = sum(1 for e in entries if e["kind"] == "definition")
+            if 0 < n_def <= MAX_DEFINITIONS:
+                articles.append(f"Que dit l'article {article} ?")
+    return {
+        "faq": questions_from_file(),
+        "article": articles,
+        "free": [q["question"] for q in hs.labeled_questions(n_free)],
+    }
+
+
+class QuestionMix:
+    def __init__(self, pool, mix, seed=0):
+        self.categories = [c for c in mix if mix[c] > 0 and pool.get(c)]
+        missing = [c for c in mix if mix[c] > 0 and not pool.get(c)]
+        if missing:
+            print(f"Catégories sans question ignorées: {missing}")
+        weights = np.array([mix[c] for c in self.categories])
+        self.weights = weights / weights.sum()
+        self.pool = pool
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        with self._lock:
+            category = self._random.choices(self.categories, weights=self.weights)[0]
+            return category, self._random.choice(self.pool[category])
+
+# ==============================
+# 3. Backends : bouchons ou réels
+# ==============================
+def install_stubs(args):
+    """Remplace Milvus, BGE-M3 et Ollama par des bouchons locaux"""
+    encoder = HashingEncoder(latency=args.encode_latency / 1000)
+    chunks = [c for path in CHUNK_FILES for c in load_chunks(path)]
+    chunks = drop_aliases(chunks, load_alias_map(min_similarity=SKIP_EMBED_THRESHOLD))
+    start = time.perf_counter()
+    hs.collection = InMemoryCollection(chunks, encoder, latency=args.search_latency / 1000)
+    hs.ef = encoder
+    print(f"Store en mémoire: {len(chunks)} chunks indexés en {time.perf_counter() - start:.1f} s")
+
+    server = FakeOllamaServer(rag.MODEL_NAME, tokens_per_second=args.tokens_per_second,
+                              parallel=args.ollama_parallel, error_rate=args.error_rate)
+    rag.OLLAMA_HOST = server.start()
+    rag.OLLAMA_URL = f"{rag.OLLAMA_HOST}/api/generate"
+    print(f"Ollama simulé sur {rag.OLLAMA_HOST} ({args.tokens_per_second} tokens/s, "
+          f"{args.ollama_parallel} génération(s) simultanée(s))")
+    return server
+
+
+def warm_faq(questions, max_tokens):
+    """Remplit la table FAQ en mémoire (sans l'écrire sur disque) pour la catégorie faq"""
+    for question in questions:
+        if rag.FAQ_TABLE.lookup(question) is None:
+            passages = rag.retrieve_passages(question, top_k=3)
+            answer = rag.generate_answer_ollama(question, max_tokens=max_tokens, passages=passages, use_faq=False)
+            if not is_error_answer(answer):
+                rag.FAQ_TABLE.put(question, answer, passages)
+
+# ==============================
+# 4. Générateur de charge
+# ==============================
+class LoadGenerator:
+    """Envoie les questions dans la même JobQueue que l'application Streamlit.
+
+    Boucle fermée (`users` utilisateurs qui attendent leur réponse puis
+    réfléchissent `think_time` s) ou boucle ouverte (arrivées de Poisson à
+    `rate` questions/s, quel que soit l'état du serveur).
+    """
+
+    def __init__(self, job_queue, mix, max_tokens):
+        self.job_queue = job_queue
+        self.mix = mix
+        self.max_tokens = max_tokens
+        self.records = []
+        self._lock = threading.Lock()
+        self._pending_samples = []
+
+    def _ask(self, session_id):
+        category, question = self.mix.draw()
+        timings = {}
+        record = {"category": category, "stages": timings}
+        submitted = time.time()
+
+        # Comme app.py : une question de la table FAQ ne passe pas par la file
+        start = time.perf_counter()
+        cached = rag.FAQ_TABLE.lookup(question)
+        if cached is not None:
+            timings["faq"] = timings["total"] = time.perf_counter() - start
+            record["outcome"] = "ok"
+            with self._lock:
+                self.records.append(record)
+            return
+
+        try:
+            job = self.job_queue.submit(session_id, rag.generate_answer_ollama, question,
+                                        max_tokens=self.max_tokens, timings=timings)
+        except QueueFullError:
+            record["outcome"] = "rejected"
+        except RateLimitError:
+            record["outcome"] = "rate_limited"
+        else:
+            job.wait()
+            if job.status == DONE:
+                record["outcome"] = "error" if is_error_answer(job.result) else "ok"
+            else:
+                record["outcome"] = "cancelled" if job.status == CANCELLED else "failed"
+            if job.started_at is not None:
+                timings["queue"] = job.started_at - job.submitted_at
+            timings["total"] = job.finished_at - submitted
+        with self._lock:
+            self.records.append(record)
+
+    def _monitor(self, stop):
+        while not stop.wait(0.2):
+            self._pending_samples.append(self.job_queue.snapshot()["pending"])
+
+    def run_closed(self, users, think_time, deadline, max_requests):
+        def user_loop():
+            session_id = uuid.uuid4().hex
+            while time.time() < deadline and len(self.records) < max_requests:
+                self._ask(session_id)
+                if think_time:
+                    time.sleep(random.expovariate(1.0 / think_time))
+
+        threads = [threading.Thread(target=user_loop, daemon=True) for _ in range(users)]
+        return self._run(threads)
+
+    def run_open(self, rate, sessions, deadline, max_requests, seed=0):
+        rng = random.Random(seed)
+        session_ids = [uuid.uuid4().hex for _ in range(sessions)]
+
+        def arrivals():
+            started = []
+            n = 0
+            while time.time() < deadline and n < max_requests:
+                t = threading.Thread(target=self._ask, args=(rng.choice(session_ids),), daemon=True)
+                t.start()
+                started.append(t)
+                n += 1
+                time.sleep(rng.expovariate(rate))
+            for t in started:
+                t.join()
+
+        return self._run([threading.Thread(target=arrivals, daemon=True)])
+
+    def _run(self, threads):
+        stop = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(stop,), daemon=True)
+        start = time.time()
+        monitor.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stop.set()
+        return time.time() - start
+
+# ==============================
+# 5. Rapport
+# ==============================
+def report(records, wall_time, pending_samples, queue_stats):
+    n = len(records)
+    outcomes = {}
+    for r in records:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    ok = outcomes.get("ok", 0)
+
+    print(f"\n{n} requêtes en {wall_time:.1f} s — débit {ok / wall_time:.2f} réponses/s "
+          f"({60 * ok / wall_time:.1f}/min)")
+    print("Issues: " + ", ".join(f"{k} {v} ({100 * v / n:.1f} %)" for k, v in sorted(outcomes.items())))
+    if pending_samples:
+        print(f"File d'attente: {np.mean(pending_samples):.1f} jobs en moyenne, max {max(pending_samples)}")
+    print(f"JobQueue: {queue_stats}")
+
+    done = [r for r in records if r["outcome"] in ("ok", "error")]
+    print(f"\n{'étape (ms)':<12}{'n':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for stage in STAGES:
+        values = [1000 * r["stages"][stage] for r in done if stage in r["stages"]]
+        if values:
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            print(f"{stage:<12}{len(values):>6}{p50:>10.0f}{p90:>10.0f}{p99:>10.0f}{max(values):>10.0f}")
+
+    print(f"\n{'catégorie':<12}{'n':>6}{'ok':>6}{'total p50':>12}{'total p90':>12}")
+    for category in sorted({r["category"] for r in records}):
+        rows = [r for r in records if r["category"] == category]
+        totals = [1000 * r["stages"]["total"] for r in rows if "total" in r["stages"]]
+        p50, p90 = np.percentile(totals, [50, 90]) if totals else (float("nan"),) * 2
+        print(f"{category:<12}{len(rows):>6}{sum(r['outcome'] == 'ok' for r in rows):>6}"
+              f"{p50:>10.0f}ms{p90:>10.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du pipeline RAG")
+    parser.add_argument("--backend", choices=["stub", "real"], default="stub")
+    parser.add_argument("--users", type=int, default=4, help="utilisateurs simultanés (boucle fermée)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause moyenne entre deux questions (s)")
+    parser.add_argument("--rate", type=float, default=0.0, help="arrivées/s (boucle ouverte si > 0)")
+    parser.add_argument("--sessions", type=int, default=20, help="sessions tirées en boucle ouverte")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--requests", type=int, default=10**9, help="nombre maximal de requêtes")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--workers", type=int, default=1, help="workers de la JobQueue")
+    parser.add_argument("--max-pending", type=int, default=20)
+    parser.add_argument("--rate-limit", type=int, default=0, help="questions/min par session (0 = illimité)")
+    parser.add_argument("--max-tokens", type=int, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=12.0)
+    parser.add_argument("--ollama-parallel", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--encode-latency", type=float, default=60.0, help="ms par encodage simulé")
+    parser.add_argument("--search-latency", type=float, default=5.0, help="ms par recherche simulée")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--query-log", action="store_true",
+                        help="journaliser les questions (répertoire séparé, pour mesurer le coût du writer)")
+    args = parser.parse_args()
+
+    # Questions synthétiques : jamais dans le journal des vraies questions
+    rag.QUERY_LOG = QueryLog(Path("data") / "query_log_loadtest") if args.query_log else None
+
+    server = install_stubs(args) if args.backend == "stub" else None
+    if server is None and not rag.check_ollama():
+        return
+
+    pool = build_question_pool()
+    mix = QuestionMix(pool, parse_mix(args.mix), seed=args.seed)
+    if "faq" in mix.categories and args.backend == "stub":
+        with contextlib.redirect_stdout(io.StringIO()):
+            warm_faq(pool["faq"], args.max_tokens)
+        print(f"Table FAQ remplie en mémoire: {len(pool['faq'])} questions")
+        hs.DECISION_STATS.clear()
+
+    job_queue = JobQueue(num_workers=args.workers, max_pending=args.max_pending,
+                         rate_limit=args.rate_limit or 10**9, rate_window=60.0,
+                         session_timeout=args.duration + 3600, max_wait=args.duration + 3600)
+    generator = LoadGenerator(job_queue, mix, args.max_tokens)
+    deadline = time.time() + args.duration
+    mode = f"boucle ouverte {args.rate}/s" if args.rate > 0 else f"boucle fermée {args.users} utilisateurs"
+    print(f"Charge: {mode}, {args.workers} worker(s), mix {args.mix}, {args.duration:.0f} s max")
+
+    # Les messages de progression du pipeline sont masqués pendant la mesure
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.rate > 0:
+            wall_time = generator.run_open(args.rate, args.sessions, deadline, args.requests, args.seed)
+        else:
+            wall_time = generator.run_closed(args.users, args.think_time, deadline, args.requests)
+
+    report(generator.records, wall_time, generator._pending_samples, job_queue.snapshot())
+    if hs.DECISION_STATS:
+        print(f"Recherche adaptative: {dict(hs.DECISION_STATS)}")
+    print(rag.ARTICLE_ROUTER.report())
+    job_queue.shutdown()
+    if server is not None:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
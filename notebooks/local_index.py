@@ -0,0 +1,709 @@
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from heapq import heapify, heappop, heappush, heapreplace
+from pathlib import Path
+
+import numpy as np
+
+from partitions import partition_name
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Backend vectoriel lu par hybrid_search.get_collection() :
+#   "milvus" (défaut)  serveur Milvus (create_collection.py, embed_insert.py)
+#   "local"            fichier d'index memory-mappé, sans serveur ni Docker
+#                      (python local_index.py build)
+VECTOR_BACKEND = os.environ.get("CHATBOT_VECTOR_BACKEND", "milvus")
+LOCAL_INDEX_PATH = Path(os.environ.get("CHATBOT_LOCAL_INDEX", str(Path("data") / "local_index.bin")))
+
+# Graphe HNSW : M voisins par nœud et par niveau (2 x M au niveau 0),
+# EF_CONSTRUCTION candidats examinés à l'insertion. L'ef de recherche est
+# celui passé dans `param` (compression.dense_search_params), comme pour Milvus.
+HNSW_M = 16
+EF_CONSTRUCTION = 100
+
+# Recherche filtrée par partition : si le filtre garde moins de cette part
+# des lignes, elles sont parcourues exactement au lieu du graphe
+EXACT_FILTER_FRACTION = 0.1
+# Petits index : tant que lignes x dim reste sous ce nombre de valeurs, un
+# parcours exact (produit matriciel) est plus rapide que le graphe et sans
+# perte de rappel. Bascule mesurée par `python local_index.py bench` :
+# ~20 000 vecteurs en dim 256, ~5 000 en dim 1024 (BGE-M3)
+EXACT_SCAN_VALUES = int(os.environ.get("CHATBOT_EXACT_SCAN_VALUES", str(5_000_000)))
+
+# ==============================
+# 2. Format du fichier
+# ==============================
+# local_index.bin : MAGIC | offset et taille des métadonnées (uint64 x 2)
+#                   | sections alignées sur 64 octets | métadonnées JSON
+# Sections (tableaux numpy lus sans copie depuis le memory-map) :
+#   dense         n x dim (float32, float16 si CHATBOT_DENSE_MODE=float16)
+#   links0        voisins au niveau 0, n x 2M int32 (-1 = vide)
+#   upper_nodes   nœuds présents aux niveaux >= 1 (triés) ; upper_offsets leur
+#                 première ligne dans upper_links (une ligne de M voisins par niveau)
+#   source        corpus de chaque ligne (indice dans meta["sources"]), chunk_index
+#   terms         termes sparse triés ; term_offsets -> post_rows / post_weights
+MAGIC = b"LOCANN01"
+HEADER = struct.Struct("<8sQQ")
+ALIGN = 64
+
+
+class Hit:
+    """Résultat au format pymilvus : id, distance (produit scalaire), entity.get()"""
+    __slots__ = ("id", "distance", "entity")
+
+    def __init__(self, id, distance, entity):
+        self.id = id
+        self.distance = distance
+        self.entity = entity
+
+# ==============================
+# 3. Parcours du graphe (commun à la construction et à la recherche)
+# ==============================
+class _Graph:
+    """Recherche gloutonne HNSW sur des vecteurs normalisés (produit scalaire).
+
+    Les sous-classes fournissent vectors, entry, max_level et _neighbors().
+    Les nœuds visités sont marqués dans un tableau par thread (numéro de
+    passage) plutôt qu'un set : les voisins déjà vus sont écartés en une
+    opération numpy.
+    """
+
+    def _visit_tags(self):
+        local = self._local
+        if getattr(local, "tags", None) is None or len(local.tags) != len(self.vectors):
+            local.tags = np.zeros(len(self.vectors), dtype=np.uint32)
+            local.gen = 0
+        local.gen += 1
+        if local.gen == 2**32 - 1:
+            local.tags[:] = 0
+            local.gen = 1
+        return local.tags, local.gen
+
+    def _search_layer(self, q, entries, ef, level, allowed=None):
+        """Les ef nœuds les plus proches de q sur un niveau -> [(similarité, nœud)] décroissant.
+
+        `allowed` (masque booléen) : le graphe est parcouru en entier mais seuls
+        les nœuds autorisés entrent dans les résultats.
+        """
+        tags, gen = self._visit_tags()
+        entries = np.asarray(entries, dtype=np.int64)
+        tags[entries] = gen
+        sims = np.asarray(self.vectors[entries] @ q, dtype=np.float32).tolist()
+        candidates = [(-s, e) for s, e in zip(sims, entries.tolist())]
+        heapify(candidates)
+        results = [(s, e) for s, e in zip(sims, entries.tolist()) if allowed is None or allowed[e]]
+        heapify(results)
+        while len(results) > ef:
+            heappop(results)
+
+        while candidates:
+            neg, node = heappop(candidates)
+            if len(results) >= ef and -neg < results[0][0]:
+                break
+            neighbors = self._neighbors(node, level)
+            neighbors = neighbors[tags[neighbors] != gen]
+            if not len(neighbors):
+                continue
+            tags[neighbors] = gen
+            sims = np.asarray(self.vectors[neighbors] @ q, dtype=np.float32)
+            if len(results) >= ef:
+                keep = sims > results[0][0]
+                neighbors, sims = neighbors[keep], sims[keep]
+            for s, e in zip(sims.tolist(), neighbors.tolist()):
+                if len(results) < ef:
+                    heappush(candidates, (-s, e))
+                    if allowed is None or allowed[e]:
+                        heappush(results, (s, e))
+                elif s > results[0][0]:
+                    heappush(candidates, (-s, e))
+                    if allowed is None or allowed[e]:
+                        heapreplace(results, (s, e))
+        return sorted(results, reverse=True)
+
+    def _entry_point(self, q, level=0):
+        """Descente gloutonne depuis le sommet jusqu'au niveau `level`"""
+        entry = self.entry
+        for lv in range(self.max_level, level, -1):
+            entry = self._search_layer(q, [entry], 1, lv)[0][1]
+        return entry
+
+    def knn(self, q, k, ef, allowed=None):
+        if self.entry < 0:
+            return []
+        q = np.asarray(q, dtype=np.float32)
+        return self._search_layer(q, [self._entry_point(q)], max(ef, k), 0, allowed)[:k]
+
+# ==============================
+# 4. Construction
+# ==============================
+class HNSWBuilder(_Graph):
+    """Graphe HNSW construit par insertions successives (Malkov & Yashunin).
+
+    Les voisins d'un nouveau nœud sont choisis par l'heuristique de diversité :
+    un candidat n'est gardé que s'il est plus proche du nœud que de tous les
+    voisins déjà retenus, ce qui garde des liens vers chaque direction et
+    relie les groupes entre eux. La même règle réduit la liste d'un voisin
+    qui dépasse sa capacité.
+    """
+
+    def __init__(self, vectors, m=HNSW_M, ef_construction=EF_CONSTRUCTION, seed=0):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(self.vectors)
+        self.m, self.m0 = m, 2 * m
+        self.ef_construction = ef_construction
+        rng = np.random.default_rng(seed)
+        # Niveau tiré selon une loi géométrique de paramètre 1/M
+        self.levels = np.floor(-np.log(1.0 - rng.random(n)) / np.log(m)).astype(np.int32)
+        self.links0 = np.full((n, self.m0), -1, dtype=np.int32)
+        self.counts0 = np.zeros(n, dtype=np.int32)
+        self.upper = {}            # nœud -> [voisins au niveau 1, au niveau 2, ...]
+        self.entry, self.max_level = -1, -1
+        self._local = threading.local()
+
+    def _neighbors(self, node, level):
+        if level == 0:
+            return self.links0[node, :self.counts0[node]]
+        return np.asarray(self.upper[node][level - 1], dtype=np.int32)
+
+    def _select(self, candidates, m):
+        """Heuristique de diversité sur [(similarité à la cible, nœud)] trié décroissant"""
+        if len(candidates) <= m:
+            return [e for _, e in candidates]
+        ids = np.fromiter((e for _, e in candidates), dtype=np.int64, count=len(candidates))
+        vecs = self.vectors[ids]
+        sims = np.fromiter((s for s, _ in candidates), dtype=np.float32, count=len(candidates))
+        # closer[i][j] : le candidat i est plus proche de la cible que du candidat j
+        closer = ((vecs @ vecs.T) < sims[:, None]).tolist()
+        selected = []
+        for i, row in enumerate(closer):
+            if all(row[j] for j in selected):
+                selected.append(i)
+                if len(selected) == m:
+                    break
+        return ids[selected].tolist()
+
+    def _set_links(self, node, level, links):
+        if level == 0:
+            self.links0[node, :len(links)] = links
+            self.links0[node, len(links):] = -1
+            self.counts0[node] = len(links)
+        else:
+            self.upper[node][level - 1] = list(links)
+
+    def _connect(self, node, new, level):
+        """Lien retour new -> node ; liste pleine : réduite par l'heuristique"""
+        cap = self.m0 if level == 0 else self.m
+        links = self._neighbors(node, level).tolist()
+        if len(links) < cap:
+            self._set_links(node, level, links + [new])
+            return
+        ids = np.array(links + [new], dtype=np.int64)
+        sims = self.vectors[ids] @ self.vectors[node]
+        order = np.argsort(-sims)
+        self._set_links(node, level, self._select(list(zip(sims[order].tolist(), ids[order].tolist())), cap))
+
+    def add(self, node):
+        level = int(self.levels[node])
+        if level > 0:
+            self.upper[node] = [[] for _ in range(level)]
+        if self.entry < 0:
+            self.entry, self.max_level = node, level
+            return
+        q = self.vectors[node]
+        entry = self._entry_point(q, level)
+        entries = [entry]
+        for lv in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(q, entries, self.ef_construction, lv)
+            links = self._select(found, self.m)
+            self._set_links(node, lv, links)
+            for neighbor in links:
+                self._connect(neighbor, node, lv)
+            entries = [e for _, e in found]
+        if level > self.max_level:
+            self.entry, self.max_level = node, level
+
+    def build(self, progress=True):
+        n = len(self.vectors)
+        start = time.perf_counter()
+        step = max(1, n // 10)
+        for node in range(n):
+            self.add(node)
+            if progress and (node + 1) % step == 0 and node + 1 < n:
+                print(f"  HNSW: {node + 1}/{n} nœuds ({time.perf_counter() - start:.0f} s)")
+        return self
+
+    def upper_arrays(self):
+        """Niveaux >= 1 -> (nœuds triés, première ligne de chaque nœud, lignes de M voisins)"""
+        nodes = np.array(sorted(self.upper), dtype=np.int32)
+        offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.upper[node]) for node in nodes.tolist()])
+        links = np.full((int(offsets[-1]), self.m), -1, dtype=np.int32)
+        for node, first in zip(nodes.tolist(), offsets[:-1].tolist()):
+            for lv, neighbors in enumerate(self.upper[node]):
+                links[first + lv, :len(neighbors)] = neighbors
+        return nodes, offsets, links
+
+
+def build_sparse(indptr, indices, values):
+    """Vecteurs sparse en lignes (CSR) -> index inversé (termes triés, offsets, lignes, poids float16)"""
+    indptr = np.asarray(indptr, dtype=np.int64)
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(np.asarray(indices), kind="stable")
+    sorted_terms = np.asarray(indices)[order]
+    terms, counts = np.unique(sorted_terms, return_counts=True)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return (terms.astype(np.int32), offsets, rows[order],
+            np.asarray(values, dtype=np.float32)[order].astype(np.float16))
+
+
+def write_index(path, sources, chunk_indices, dense, sparse, m=HNSW_M, ef_construction=EF_CONSTRUCTION,
+                dense_dtype=np.float32, progress=True):
+    """Construit graphe et index sparse puis écrit le fichier -> durées par étape (s).
+
+    sparse : (indptr, indices, values) au format CSR, une ligne par chunk.
+    """
+    dense = np.asarray(dense, dtype=np.float32)
+    timings = {}
+    start = time.perf_counter()
+    graph = HNSWBuilder(dense, m, ef_construction).build(progress)
+    upper_nodes, upper_offsets, upper_links = graph.upper_arrays()
+    timings["hnsw"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    terms, term_offsets, post_rows, post_weights = build_sparse(*sparse)
+    timings["sparse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    names = sorted(set(sources))
+    codes = {s: i for i, s in enumerate(names)}
+    arrays = {
+        "dense": dense.astype(dense_dtype, copy=False),
+        "links0": graph.links0,
+        "upper_nodes": upper_nodes,
+        "upper_offsets": upper_offsets,
+        "upper_links": upper_links,
+        "source": np.array([codes[s] for s in sources], dtype=np.uint16),
+        "chunk_index": np.asarray(chunk_indices, dtype=np.int32),
+        "terms": terms,
+        "term_offsets": term_offsets,
+        "post_rows": post_rows,
+        "post_weights": post_weights,
+    }
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    sections = {}
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        for name, array in arrays.items():
+            f.write(b"\0" * (-f.tell() % ALIGN))
+            array = np.ascontiguousarray(array)
+            sections[name] = {"offset": f.tell(), "dtype": array.dtype.str, "shape": list(array.shape)}
+            f.write(memoryview(array).cast("B"))
+        meta = json.dumps({"count": len(dense), "dim": int(dense.shape[1]), "m": m,
+                           "ef_construction": ef_construction, "entry": graph.entry,
+                           "max_level": graph.max_level, "sources": names,
+                           "sections": sections}).encode("utf-8")
+        meta_offset = f.tell()
+        f.write(meta)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, meta_offset, len(meta)))
+    os.replace(tmp, path)
+    timings["write"] = time.perf_counter() - start
+    return timings
+
+# ==============================
+# 5. Lecture memory-mappée (interface Collection de pymilvus)
+# ==============================
+EXPR_TERM = re.compile(r"^\s*(source|chunk_index)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*$")
+
+
+class LocalCollection(_Graph):
+    """Index local : graphe HNSW (dense) et index inversé (sparse) lus depuis un fichier.
+
+    Le fichier est memory-mappé au load() : rien n'est copié en mémoire, les
+    pages des vecteurs et des listes de voisins sont lues à la demande par le
+    système. search() a la signature de pymilvus.Collection.search ; `expr`
+    accepte des comparaisons sur source et chunk_index reliées par "and".
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH):
+        self.path = Path(path)
+        self._mm = None
+        self._local = threading.local()
+        self._masks = {}
+        self._store = None
+
+    def load(self):
+        if self._mm is not None:
+            return
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_offset, meta_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Fichier {self.path} invalide")
+        meta = json.loads(self._mm[meta_offset:meta_offset + meta_len])
+        self.meta = meta
+        for name, section in meta["sections"].items():
+            shape = tuple(section["shape"])
+            array = np.frombuffer(self._mm, dtype=np.dtype(section["dtype"]), count=int(np.prod(shape)),
+                                  offset=section["offset"]).reshape(shape)
+            setattr(self, name, array)
+        self.vectors = self.dense
+        self.entry, self.max_level = meta["entry"], meta["max_level"]
+        self.sources = meta["sources"]
+        self._upper_rows = dict(zip(self.upper_nodes.tolist(), self.upper_offsets[:-1].tolist()))
+
+    @property
+    def num_entities(self):
+        return self.meta["count"]
+
+    @property
+    def exact_scan_rows(self):
+        """Nombre de lignes en dessous duquel la recherche dense est exacte"""
+        return EXACT_SCAN_VALUES // self.meta["dim"]
+
+    def _neighbors(self, node, level):
+        row = self.links0[node] if level == 0 else self.upper_links[self._upper_rows[node] + level - 1]
+        return row[row >= 0]
+
+    # ----- Filtres -----
+    def _mask(self, partition_names, expr):
+        key = (tuple(partition_names or ()), expr)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.ones(self.num_entities, dtype=bool)
+            if partition_names:
+                codes = [i for i, s in enumerate(self.sources) if partition_name(s) in partition_names]
+                mask &= np.isin(self.source, codes)
+            if expr:
+                mask &= self._expr_mask(expr)
+            self._masks[key] = mask
+        return mask
+
+    def _expr_mask(self, expr):
+        mask = np.ones(self.num_entities, dtype=bool)
+        ops = {"==": np.equal, "!=": np.not_equal, "<": np.less, "<=": np.less_equal,
+               ">": np.greater, ">=": np.greater_equal}
+        for term in re.split(r"\s+and\s+", expr.strip(), flags=re.IGNORECASE):
+            match = EXPR_TERM.match(term)
+            if not match or (match.group(1) == "source" and match.group(2) not in ("==", "!=")):
+                raise ValueError(f"Expression non prise en charge par l'index local: {term!r}")
+            field, op, value = match.groups()
+            if field == "source":
+                value = value.strip("\"'")
+                column = np.array([s == value for s in self.sources])[self.source]
+                value = True
+            else:
+                column, value = self.chunk_index, int(value)
+            mask &= ops[op](column, value)
+        return mask
+
+    # ----- Recherche -----
+    def _dense(self, vector, limit, ef, allowed):
+        q = np.asarray(vector, dtype=np.float32)
+        if allowed is None:
+            if self.num_entities <= self.exact_scan_rows:
+                scores = np.asarray(self.vectors @ q, dtype=np.float32)
+                return self._top(np.arange(self.num_entities), scores, limit)
+            return self.knn(q, limit, ef)
+        rows = np.flatnonzero(allowed)
+        if len(rows) <= max(limit, self.exact_scan_rows, EXACT_FILTER_FRACTION * self.num_entities):
+            scores = np.asarray(self.vectors[rows] @ q, dtype=np.float32)
+            return self._top(rows, scores, limit)
+        return self.knn(q, limit, ef, allowed)
+
+    def _sparse(self, vector, limit, allowed):
+        if not vector:
+            return []
+        query_terms = np.fromiter(vector.keys(), dtype=np.int64, count=len(vector))
+        query_weights = np.fromiter(vector.values(), dtype=np.float32, count=len(vector))
+        pos = np.searchsorted(self.terms, query_terms)
+        found = pos < len(self.terms)
+        found[found] &= self.terms[pos[found]] == query_terms[found]
+        pos, query_weights = pos[found], query_weights[found]
+        if not len(pos):
+            return []
+        starts, ends = self.term_offsets[pos], self.term_offsets[pos + 1]
+        rows = np.concatenate([self.post_rows[s:e] for s, e in zip(starts, ends)])
+        weights = np.concatenate([self.post_weights[s:e].astype(np.float32) * w
+                                  for s, e, w in zip(starts, ends, query_weights)])
+        if len(rows) > self.num_entities // 8:
+            # Termes fréquents : accumulation directe sur toutes les lignes
+            scores = np.bincount(rows, weights=weights, minlength=self.num_entities).astype(np.float32)
+            rows = np.arange(self.num_entities)
+        else:
+            rows, inverse = np.unique(rows, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        keep = scores > 0
+        if allowed is not None:
+            keep &= allowed[rows]
+        return self._top(rows[keep], scores[keep], limit)
+
+    @staticmethod
+    def _top(rows, scores, limit):
+        k = min(limit, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return list(zip(scores[top].tolist(), rows[top].tolist()))
+
+    def _entity(self, row, fields):
+        entity = {}
+        for field in fields:
+            if field == "source":
+                entity[field] = self.sources[self.source[row]]
+            elif field == "chunk_index":
+                entity[field] = int(self.chunk_index[row])
+            elif field == "text":
+                entity[field] = self._text(row)
+        return entity
+
+    def _text(self, row):
+        # Textes dans le chunk store du mode d'index (non dupliqués dans le fichier)
+        if self._store is None:
+            from chunk_store import ChunkStore
+            from context_expansion import INDEX_STORE_PATH
+
+            self._store = ChunkStore(INDEX_STORE_PATH)
+        return self._store.get_by_source(self.sources[self.source[row]], int(self.chunk_index[row]))
+
+    def search(self, data, anns_field, param, limit, expr=None, partition_names=None,
+               output_fields=None, **kwargs):
+        self.load()
+        allowed = self._mask(partition_names, expr) if partition_names or expr else None
+        ef = (param or {}).get("params", {}).get("ef", EF_CONSTRUCTION)
+        fields = output_fields or []
+        results = []
+        for vector in data:
+            if anns_field == "dense":
+                found = self._dense(vector, limit, ef, allowed)
+            else:
+                found = self._sparse(vector, limit, allowed)
+            results.append([Hit(row, score, self._entity(row, fields)) for score, row in found])
+        return results
+
+# ==============================
+# 6. Construction depuis les chunks
+# ==============================
+def build_from_chunks(chunks, load_encoder_fn, path=LOCAL_INDEX_PATH):
+    """Vecteurs des chunks (caches par document, sinon encodage) et écriture de l'index local.
+
+    Même traitement qu'embed_insert.py : quasi-doublons écartés, poids sparse
+    élagués selon CHATBOT_SPARSE_TOP_N / CHATBOT_SPARSE_MASS.
+    """
+    from compression import DENSE_MODE, prune_sparse_row
+    from context_expansion import INDEX_DEDUP_MAP_PATH
+    from dedup import SKIP_EMBED_THRESHOLD, drop_aliases, load_alias_map
+    from embedding_cache import embed_chunks
+
+    alias_map = load_alias_map(INDEX_DEDUP_MAP_PATH, min_similarity=SKIP_EMBED_THRESHOLD)
+    if alias_map:
+        chunks = drop_aliases(chunks, alias_map)
+    print(f"{len(chunks)} chunks à indexer")
+
+    start = time.perf_counter()
+    dense, sparse = embed_chunks(chunks, load_encoder_fn)
+    indptr, indices, values = [0], [], []
+    for idx, val in sparse:
+        idx, val = prune_sparse_row(idx, val)
+        indices.extend(np.asarray(idx).tolist())
+        values.extend(np.asarray(val).tolist())
+        indptr.append(len(indices))
+    print(f"Vecteurs: {time.perf_counter() - start:.1f} s")
+
+    timings = write_index(path, [c["source"] for c in chunks], [c["chunk_index"] for c in chunks],
+                          dense, (indptr, indices, values),
+                          dense_dtype=np.float16 if DENSE_MODE == "float16" else np.float32)
+    print(f"Index local écrit dans {path} ({Path(path).stat().st_size / 2**20:.1f} Mo): "
+          + ", ".join(f"{k} {v:.1f} s" for k, v in timings.items()))
+
+# ==============================
+# 7. Benchmark : construction, chargement, mémoire, rappel
+# ==============================
+def _rss_mb():
+    """Mémoire résidente du processus (Linux), None ailleurs"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _drop_page_cache(path):
+    """Retire le fichier du cache disque si possible (chargement à froid)"""
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def synthetic_corpus(n, dim, n_queries, nnz=60, vocab=250002, clusters=None, seed=0):
+    """Vecteurs denses groupés (mélange de gaussiennes, normalisés) et sparse à vocabulaire zipfien"""
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(16, n // 1000)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+
+    def sample(count):
+        out = np.empty((count, dim), dtype=np.float32)
+        for start in range(0, count, 100000):
+            end = min(count, start + 100000)
+            out[start:end] = centers[rng.integers(clusters, size=end - start)]
+            out[start:end] += 0.8 * rng.standard_normal((end - start, dim), dtype=np.float32)
+        out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out
+
+    dense, queries = sample(n), sample(n_queries)
+    # Un terme au plus une fois par ligne (les termes fréquents sont dans presque toutes)
+    keys = np.unique(np.repeat(np.arange(n, dtype=np.int64), nnz) * vocab + rng.zipf(1.3, size=n * nnz) % vocab)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // vocab, minlength=n), out=indptr[1:])
+    indices = (keys % vocab).astype(np.int32)
+    values = rng.random(len(keys), dtype=np.float32)
+    del keys
+    sparse_queries = [{int(t): 1.0 for t in rng.zipf(1.3, size=8) % vocab} for _ in range(n_queries)]
+    return dense, (indptr, indices, values), queries, sparse_queries
+
+
+def _exact_top(queries, vectors, k):
+    scores = queries @ np.asarray(vectors).T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def _dense_latencies(collection, queries, k, ef, exact_values, partition_names=None):
+    """Latences de recherche dense avec le seuil de parcours exact `exact_values`"""
+    global EXACT_SCAN_VALUES
+    saved, EXACT_SCAN_VALUES = EXACT_SCAN_VALUES, exact_values
+    try:
+        latencies, results = [], []
+        for q in queries:
+            start = time.perf_counter()
+            hits = collection.search([q], "dense", {"params": {"ef": ef}}, k, partition_names=partition_names)[0]
+            latencies.append(time.perf_counter() - start)
+            results.append({h.id for h in hits})
+        return np.array(latencies), results
+    finally:
+        EXACT_SCAN_VALUES = saved
+
+
+def benchmark(sizes=(10000, 100000), dim=256, n_queries=200, k=10, efs=(64, 128), path=None, seed=0):
+    """Index local contre recherche exacte sur des corpus synthétiques de tailles `sizes`"""
+    path = Path(path or LOCAL_INDEX_PATH.with_name("local_index_bench.bin"))
+    print(f"dim={dim}, M={HNSW_M}, efConstruction={EF_CONSTRUCTION}, {n_queries} requêtes, recall@{k}")
+    for n in sizes:
+        dense, sparse, queries, sparse_queries = synthetic_corpus(n, dim, n_queries, seed=seed)
+        sources = ["Code_du_travail" if i % 2 else "Manuel_du_travailleur" for i in range(n)]
+        print(f"\n--- {n} vecteurs ---")
+        timings = write_index(path, sources, np.arange(n), dense, sparse)
+        size = path.stat().st_size / 2**20
+        print(f"Construction: HNSW {timings['hnsw']:.1f} s ({1e3 * timings['hnsw'] / n:.2f} ms/vecteur), "
+              f"sparse {timings['sparse']:.1f} s, écriture {timings['write']:.1f} s, fichier {size:.0f} Mo "
+              f"(dense {dense.nbytes / 2**20:.0f} Mo)")
+
+        exact = np.concatenate([_exact_top(queries[i:i + 10], dense, k) for i in range(0, n_queries, 10)])
+        del dense
+        _drop_page_cache(path)
+        rss = _rss_mb()
+        start = time.perf_counter()
+        collection = LocalCollection(path)
+        collection.load()
+        load = time.perf_counter() - start
+        first, _ = _dense_latencies(collection, queries[:1], k, efs[0], exact_values=0)
+        print(f"Chargement: {1e3 * load:.1f} ms (memory-map), première requête à froid {1e3 * first[0]:.1f} ms")
+
+        # Graphe forcé (seuil 0) puis parcours exact forcé : point de bascule pour EXACT_SCAN_VALUES
+        graph_p50 = {}
+        for ef in efs:
+            latencies, results = _dense_latencies(collection, queries, k, ef, exact_values=0)
+            recall = np.mean([len(hits & set(truth.tolist())) / k for hits, truth in zip(results, exact)])
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+            graph_p50[ef] = p50
+            print(f"Dense HNSW ef={ef}: recall@{k} {recall:.3f}, p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+        latencies, _ = _dense_latencies(collection, queries, k, efs[0], exact_values=n * dim)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+        faster = "parcours exact" if p50 < graph_p50[efs[0]] else "HNSW"
+        print(f"Dense exact: recall@{k} 1.000, p50 {p50:.2f} ms, p99 {p99:.2f} ms "
+              f"-> {faster} plus rapide à {n} x {dim} (seuil {collection.exact_scan_rows} vecteurs, "
+              f"{'exact' if n <= collection.exact_scan_rows else 'HNSW'} utilisé)")
+
+        latencies, _ = _dense_latencies(collection, queries, k, efs[0], EXACT_SCAN_VALUES,
+                                        partition_names=["src_Code_du_travail"])
+        print(f"Dense filtré (1 partition sur 2): p50 {np.percentile(latencies, 50) * 1e3:.2f} ms")
+
+        latencies = []
+        for q in sparse_queries:
+            start = time.perf_counter()
+            collection.search([q], "sparse", {"metric_type": "IP"}, k)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+        after = _rss_mb()
+        print(f"Sparse: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+        if rss is not None:
+            print(f"Mémoire résidente ajoutée par l'index après {len(queries) * (len(efs) + 2)} requêtes: "
+                  f"{after - rss:.0f} Mo (fichier {size:.0f} Mo)")
+
+        # Références exactes (hors mesure mémoire) : parcours dense complet, scores sparse
+        start = time.perf_counter()
+        _exact_top(queries[:10], collection.vectors, k)
+        print(f"Recherche dense exacte (parcours complet): {1e2 * (time.perf_counter() - start):.1f} ms/requête")
+        rows = np.repeat(np.arange(n), np.diff(sparse[0]))
+        matches = []
+        for q in sparse_queries[:20]:
+            hits = collection.search([q], "sparse", {"metric_type": "IP"}, k)[0]
+            hit_terms = np.isin(sparse[1], list(q))
+            scores = np.bincount(rows[hit_terms], weights=sparse[2][hit_terms], minlength=n)
+            truth = np.sort(scores)[::-1][:len(hits)]
+            matches.append(np.allclose([h.distance for h in hits], truth, rtol=2e-3, atol=2e-3))
+        print(f"Sparse: {np.mean(matches):.0%} des top-{k} identiques au calcul exact (poids float16)")
+        del collection, rows
+    path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    # Usage : python local_index.py build [--stub] | info | bench [n ...] [--dim D]
+    # --stub : encodeur factice de stubs.py (sans BGE-M3)
+    command = sys.argv[1] if len(sys.argv) > 1 else "info"
+    if command == "build":
+        from chunk_store import load_chunks
+        from context_expansion import INDEX_CHUNK_FILES
+
+        if "--stub" in sys.argv:
+            import embedding_cache
+            from stubs import HashingEncoder
+
+            embedding_cache.BACKEND = "stub"
+            load_encoder_fn = lambda: HashingEncoder(latency=0)
+        else:
+            from onnx_encoder import load_encoder
+            from resources import apply as apply_profile
+
+            apply_profile("ingest")
+            load_encoder_fn = load_encoder
+        build_from_chunks([c for f in INDEX_CHUNK_FILES for c in load_chunks(f)], load_encoder_fn)
+    elif command == "bench":
+        args = sys.argv[2:]
+        dim = 256
+        if "--dim" in args:
+            i = args.index("--dim")
+            dim = int(args[i + 1])
+            del args[i:i + 2]
+        benchmark(sizes=[int(a) for a in args] or (10000, 100000), dim=dim)
+    else:
+        collection = LocalCollection()
+        collection.load()
+        meta = collection.meta
+        print(f"{collection.path}: {meta['count']} vecteurs x {meta['dim']}, M={meta['m']}, "
+              f"{meta['max_level'] + 1} niveaux, {len(collection.terms)} termes sparse, "
+              f"corpus {', '.join(meta['sources'])}")
@@ -4,6 +4,8 @@ import os
 from multiprocessing import Pool
 import time
 import fitz  # PyMuPDF
+from text_normalization import normalize_page
+from resources import apply as apply_profile, limit_tesseract_threads
 
 
 # ===============================
@@ -22,7 +24,10 @@ DPI = 300
 
 # Traitement par lots pour éviter les erreurs mémoire
 BATCH_SIZE = 50  
-NUM_PROCESSES = 6  
+# Un processus tesseract par cœur, chacun limité à 1 thread OpenMP
+# (OMP_THREAD_LIMIT posé dans chaque processus du pool) : profil ingest
+BUDGET = apply_profile("ingest")
+NUM_PROCESSES = BUDGET["ocr_processes"]
 
 # ===============================
 # ÉTAPE 2: FONCTIONS
@@ -73,7 +78,8 @@ def process_batch(pdf_path, start_page, end_page, batch_num, total_batches):
         page_data = [(page, start_page - 1 + i) for i, page in enumerate(pages)]
         
         # Traitement parallèle du lot
-        with Pool(processes=NUM_PROCESSES) as pool:
+        with Pool(processes=NUM_PROCESSES, initializer=limit_tesseract_threads,
+                  initargs=(BUDGET["tesseract_threads"],)) as pool:
             results = pool.map(process_page, page_data)
         
         # Nettoyer immédiatement les images de la mémoire
@@ -100,7 +106,7 @@ def cleanup_temp_files():
 # ÉTAPE 3: SCRIPT PRINCIPAL
 # ===============================
 
-def main():
+def main(pdf_path=PDF_PATH, output_path=OUTPUT_PATH):
     start_time = time.time()
     print("DÉMARRAGE DE L'OCR PARALLÈLE (TRAITEMENT PAR LOTS)")
     print("=" * 60)
@@ -108,11 +114,11 @@ def main():
     # Créer dossier temporaire
     create_temp_directory()
     
-    print(f"Analyse du PDF: {PDF_PATH}")
+    print(f"Analyse du PDF: {pdf_path}")
     
     # ÉTAPE 3.1: Obtenir le nombre total de pages
     try:
-        total_pages = get_pdf_page_count(PDF_PATH)
+        total_pages = get_pdf_page_count(pdf_path)
         print(f"PDF analysé: {total_pages} pages détectées")
         
         # Pour test: décommenter la ligne suivante
@@ -138,7 +144,7 @@ def main():
         print(f"TRAITEMENT LOT {batch_num}/{total_batches}")
         print(f"{'='*40}")
         
-        batch_results = process_batch(PDF_PATH, start_page, end_page, batch_num, total_batches)
+        batch_results = process_batch(pdf_path, start_page, end_page, batch_num, total_batches)
         all_results.extend(batch_results)
         
         processed_pages = len(all_results)
@@ -159,21 +165,14 @@ def main():
     
     # ÉTAPE 3.5: Correction de l'encodage et sauvegarde
     try:
-        # Corriger l'encodage des caractères français
-        corrected_text = []
-        for text in all_text:
-            # Corrections communes des caractères mal encodés
-            corrected = text.replace("Ã©", "é").replace("Ã¨", "è").replace("Ã ", "à")
-            corrected = corrected.replace("Ã´", "ô").replace("Ã®", "î").replace("Ã¢", "â")
-            corrected = corrected.replace("Ã§", "ç").replace("Ã¹", "ù").replace("Ãª", "ê")
-            corrected = corrected.replace("Ã«", "ë").replace("Ã¯", "ï").replace("Ã»", "û")
-            corrected = corrected.replace("Ã", "À").replace("Ã‰", "É").replace("Ã", "Ô")
-            corrected_text.append(corrected)
+        # Corriger l'encodage des caractères français (une passe par page).
+        # En-têtes, césures et marqueurs de page sont traités au chunking.
+        corrected_text = [normalize_page(text) for text in all_text]
         
-        with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
+        with open(output_path, "w", encoding="utf-8") as f:
             f.write("\n\n=== NOUVELLE PAGE ===\n\n".join(corrected_text))
         
-        print(f"Fichier sauvegardé avec encodage corrigé: {OUTPUT_PATH}")
+        print(f"Fichier sauvegardé avec encodage corrigé: {output_path}")
         
     except Exception as e:
         print(f"Erreur sauvegarde: {e}")
@@ -192,7 +191,7 @@ def main():
     print(f"Lots traités: {total_batches}")
     print(f"Temps total: {duration:.1f} secondes ({duration/60:.1f} minutes)")
     print(f"Vitesse: {pages_per_minute:.1f} pages/minute")
-    print(f"Fichier de sortie: {OUTPUT_PATH}")
+    print(f"Fichier de sortie: {output_path}")
     print(f"Taille estimée du fichier: ~{len(all_text) * 500 / 1024 / 1024:.1f} MB")
 
 # ===============================
@@ -201,4 +200,8 @@ def main():
 
 if __name__ == "__main__":
     # Protection pour Windows multiprocessing
-    main()
\ No newline at end of file
+    # Usage : python manuel_ocr.py [pdf] [sortie.txt] [dpi]  (appelé par pipeline.py)
+    import sys
+    if len(sys.argv) > 3:
+        DPI = int(sys.argv[3])
+    main(*sys.argv[1:3])
\ No newline at end of file
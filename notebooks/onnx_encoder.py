@@ -0,0 +1,230 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Encodeur utilisé par hybrid_search et embed_insert :
+#   "torch"     BGEM3EmbeddingFunction (PyTorch fp32, défaut)
+#   "onnx"      export ONNX fp32 exécuté par ONNX Runtime
+#   "onnx-int8" export ONNX avec quantification dynamique int8 des poids
+ENCODER_BACKEND = os.environ.get("CHATBOT_ENCODER", "torch")
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+MODEL_NAME = "BAAI/bge-m3"
+ONNX_DIR = Path("models") / "bge-m3-onnx"
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+MAX_LENGTH = 8192            # même troncature que BGEM3EmbeddingFunction
+BATCH_SIZE = 16
+
+# Seuils de parité avec la sortie PyTorch
+MIN_DENSE_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+MIN_SPARSE_OVERLAP = {"onnx": 0.99, "onnx-int8": 0.9}
+
+
+def load_encoder(backend=ENCODER_BACKEND, device="cpu"):
+    """Encodeur BGE-M3 du backend choisi ; même appel ef(textes) -> {"dense", "sparse"}"""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Backend inconnu: {backend} (attendu: {', '.join(ENCODER_BACKENDS)})")
+    if backend == "torch":
+        from pymilvus.model.hybrid import BGEM3EmbeddingFunction
+        return BGEM3EmbeddingFunction(use_fp16=False, device=device)
+    path = ONNX_DIR / ONNX_FILES[backend]
+    if not path.exists():
+        raise FileNotFoundError(f"{path} absent : lancer d'abord python onnx_encoder.py export")
+    from resources import current
+    return OnnxBGEM3Encoder(path, threads=current()["encoder_threads"])
+
+# ==============================
+# 2. Export ONNX (têtes dense et sparse)
+# ==============================
+def export_onnx(output_dir=ONNX_DIR, quantize=True):
+    import torch
+    from FlagEmbedding import BGEM3FlagModel
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    flag_model = BGEM3FlagModel(MODEL_NAME, use_fp16=False, device="cpu")
+    encoder = flag_model.model.model
+    sparse_linear = flag_model.model.sparse_linear
+
+    class BGEM3Heads(torch.nn.Module):
+        """Transformer + têtes BGE-M3 : CLS normalisé (dense) et poids par token (sparse)"""
+
+        def __init__(self):
+            super().__init__()
+            self.encoder = encoder
+            self.sparse_linear = sparse_linear
+
+        def forward(self, input_ids, attention_mask):
+            hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+            dense = torch.nn.functional.normalize(hidden[:, 0], dim=-1)
+            weights = torch.relu(self.sparse_linear(hidden)).squeeze(-1)
+            return dense, weights
+
+    model = BGEM3Heads().eval()
+    sample = flag_model.tokenizer(["Article L.1 du Code du travail"], return_tensors="pt")
+    path = output_dir / ONNX_FILES["onnx"]
+    start = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            str(path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["dense", "sparse_weights"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                          "attention_mask": {0: "batch", 1: "sequence"},
+                          "dense": {0: "batch"},
+                          "sparse_weights": {0: "batch", 1: "sequence"}},
+            opset_version=17,
+        )
+    flag_model.tokenizer.save_pretrained(output_dir)
+    print(f"Export ONNX: {path} ({path.stat().st_size / 2**20:.0f} Mo, {time.perf_counter() - start:.0f} s)")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = output_dir / ONNX_FILES["onnx-int8"]
+        quantize_dynamic(str(path), str(int8_path), weight_type=QuantType.QInt8)
+        print(f"Quantification int8: {int8_path} ({int8_path.stat().st_size / 2**20:.0f} Mo)")
+
+# ==============================
+# 3. Encodeur ONNX Runtime
+# ==============================
+class OnnxBGEM3Encoder:
+    """BGE-M3 exporté en ONNX, même interface que BGEM3EmbeddingFunction.
+
+    Les textes sont triés par longueur avant découpage en lots pour limiter le
+    padding ; les poids sparse sont agrégés par token (maximum), sans les
+    tokens spéciaux, comme dans FlagEmbedding.
+    """
+
+    def __init__(self, model_path, tokenizer_dir=None, threads=None, batch_size=BATCH_SIZE,
+                 max_length=MAX_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = Path(model_path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir or model_path.parent)
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.vocab_size = len(self.tokenizer)
+        self.special_ids = {self.tokenizer.cls_token_id, self.tokenizer.eos_token_id,
+                            self.tokenizer.pad_token_id, self.tokenizer.unk_token_id}
+
+    def _encode_batch(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                return_tensors="np")
+        dense, weights = self.session.run(None, {
+            "input_ids": tokens["input_ids"].astype(np.int64),
+            "attention_mask": tokens["attention_mask"].astype(np.int64),
+        })
+        sparse = []
+        for ids, mask, row in zip(tokens["input_ids"], tokens["attention_mask"], weights):
+            token_weights = {}
+            for token, keep, w in zip(ids.tolist(), mask.tolist(), row.tolist()):
+                if keep and w > 0 and token not in self.special_ids and w > token_weights.get(token, 0.0):
+                    token_weights[token] = w
+            sparse.append(token_weights)
+        return dense, sparse
+
+    def __call__(self, texts):
+        from scipy.sparse import csr_array
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        dense = [None] * len(texts)
+        sparse = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            batch_dense, batch_sparse = self._encode_batch([texts[i] for i in batch])
+            for i, d, s in zip(batch, batch_dense, batch_sparse):
+                dense[i], sparse[i] = d.astype(np.float32), s
+
+        rows, cols, data = [], [], []
+        for r, weights in enumerate(sparse):
+            rows.extend([r] * len(weights))
+            cols.extend(weights.keys())
+            data.extend(weights.values())
+        matrix = csr_array((np.array(data, dtype=np.float32), (rows, cols)), shape=(len(texts), self.vocab_size))
+        return {"dense": dense, "sparse": matrix}
+
+# ==============================
+# 4. Parité et benchmark
+# ==============================
+def _sparse_rows(matrix):
+    csr = matrix.tocsr()
+    return [dict(zip(csr.indices[csr.indptr[r]:csr.indptr[r + 1]].tolist(),
+                     csr.data[csr.indptr[r]:csr.indptr[r + 1]].tolist())) for r in range(csr.shape[0])]
+
+
+def sparse_overlap(reference, candidate):
+    """Part de la masse sparse de référence retrouvée (min des poids par token)"""
+    total = sum(reference.values())
+    if total == 0:
+        return 1.0
+    return sum(min(w, candidate.get(t, 0.0)) for t, w in reference.items()) / total
+
+
+def parity(reference_output, candidate_output):
+    ref_dense = np.stack(reference_output["dense"]).astype(np.float32)
+    cand_dense = np.stack(candidate_output["dense"]).astype(np.float32)
+    cosine = np.sum(ref_dense * cand_dense, axis=1) / (
+        np.linalg.norm(ref_dense, axis=1) * np.linalg.norm(cand_dense, axis=1))
+    overlaps = [sparse_overlap(r, c) for r, c in zip(_sparse_rows(reference_output["sparse"]),
+                                                      _sparse_rows(candidate_output["sparse"]))]
+    return cosine, np.array(overlaps)
+
+
+def benchmark(n_chunks=200, n_queries=50):
+    """Parité avec PyTorch puis débit d'encodage (chunks) et latence (questions)"""
+    from chunk_store import load_chunks
+    from faq_cache import questions_from_file
+
+    chunks = [c["text"] for c in load_chunks(Path("data") / "code_travail_chunks.json")][:n_chunks]
+    questions = (questions_from_file() * n_queries)[:n_queries]
+    backends = [b for b in ENCODER_BACKENDS if b == "torch" or (ONNX_DIR / ONNX_FILES[b]).exists()]
+
+    outputs, failed = {}, False
+    print(f"{'backend':<12}{'chunks/s':>10}{'question p50':>14}{'p95':>8}{'cos min':>10}{'cos moy':>10}{'sparse min':>12}")
+    for backend in backends:
+        encoder = load_encoder(backend)
+        encoder(questions[:2])  # chargement et premier appel hors mesure
+
+        start = time.perf_counter()
+        outputs[backend] = encoder(chunks)
+        throughput = len(chunks) / (time.perf_counter() - start)
+
+        latencies = []
+        for q in questions:
+            start = time.perf_counter()
+            encoder([q])
+            latencies.append(1000 * (time.perf_counter() - start))
+        p50, p95 = np.percentile(latencies, [50, 95])
+
+        line = f"{backend:<12}{throughput:>10.1f}{p50:>12.1f}ms{p95:>6.1f}ms"
+        if backend != "torch":
+            cosine, overlaps = parity(outputs["torch"], outputs[backend])
+            ok = cosine.min() >= MIN_DENSE_COSINE[backend] and overlaps.min() >= MIN_SPARSE_OVERLAP[backend]
+            failed |= not ok
+            line += f"{cosine.min():>10.4f}{cosine.mean():>10.4f}{overlaps.min():>12.3f}  {'OK' if ok else 'ÉCHEC'}"
+        print(line)
+    return not failed
+
+
+if __name__ == "__main__":
+    # Usage : python onnx_encoder.py export [--no-int8] | check [n_chunks]
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "export":
+        export_onnx(quantize="--no-int8" not in sys.argv)
+    else:
+        sys.exit(0 if benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 200) else 1)
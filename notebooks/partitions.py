@@ -0,0 +1,77 @@
+import json
+import re
+import sys
+from pathlib import Path
+
+# ==============================
+# 1. Corpus connus
+# ==============================
+# Une partition Milvus par source : une recherche limitée à un corpus ne
+# parcourt que sa partition, et un corpus peut être ajouté ou supprimé sans
+# reconstruire la collection.
+# Les corpus sont ceux de data/documents.json (source -> libellé affiché) :
+# ajouter ou retirer un document suffit, sans toucher au code.
+DOCUMENTS_PATH = Path("data") / "documents.json"
+
+
+def load_corpora(path=DOCUMENTS_PATH):
+    """{source: libellé} des documents déclarés ({} si le fichier manque)"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        documents = json.load(f)
+    return {doc["source"]: doc.get("label", doc["source"].replace("_", " ")) for doc in documents}
+
+
+def partition_name(source):
+    """Nom de partition Milvus pour une source (lettres, chiffres et _ uniquement)"""
+    return "src_" + re.sub(r"[^0-9A-Za-z_]", "_", source)
+
+
+def partition_names(sources):
+    if not sources:
+        return None
+    return [partition_name(s) for s in sources]
+
+
+def ensure_partition(collection, source):
+    name = partition_name(source)
+    if not collection.has_partition(name):
+        collection.create_partition(name, description=f"Corpus {source}")
+        print(f"Partition '{name}' créée")
+    return name
+
+
+def drop_corpus(collection, source):
+    """Supprimer un corpus entier (sa partition) sans toucher aux autres"""
+    name = partition_name(source)
+    if not collection.has_partition(name):
+        print(f"Aucune partition pour {source}")
+        return False
+    # Seule cette partition est libérée : les autres corpus restent chargés et
+    # interrogeables pendant la suppression
+    collection.partition(name).release()
+    collection.drop_partition(name)
+    print(f"Corpus {source} supprimé (partition '{name}')")
+    return True
+
+
+def list_corpora(collection):
+    return [(p.name, p.num_entities) for p in collection.partitions if p.name.startswith("src_")]
+
+
+if __name__ == "__main__":
+    # Usage : python partitions.py list | drop <source>
+    from pymilvus import connections, Collection
+    from versioning import resolve_collection_name
+
+    connections.connect("default", host="localhost", port="19530")
+    collection = Collection(resolve_collection_name())
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "drop" and len(sys.argv) > 2:
+        drop_corpus(collection, sys.argv[2])
+    else:
+        for name, count in list_corpora(collection):
+            print(f"{name}: {count} chunks")
@@ -0,0 +1,361 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Usage (depuis la racine du projet) :
+#   python notebooks/pipeline.py                  étapes périmées uniquement
+#   python notebooks/pipeline.py --dry-run        affiche ce qui serait recalculé
+#   python notebooks/pipeline.py --force chunk:Manuel_du_travailleur
+#   python notebooks/pipeline.py --no-embed       sans Milvus (OCR, chunking, corpus)
+#   CHATBOT_VECTOR_BACKEND=local python notebooks/pipeline.py   index local au lieu de Milvus
+#
+# Ajouter un document = ajouter une entrée dans data/documents.json : seules
+# ses étapes (OCR, chunking, encodage) et l'étape corpus globale sont rejouées.
+# L'encodage est par document (embed:<source>, vecteurs en cache dans
+# data/embeddings/) ; l'étape index ne fait qu'insérer les vecteurs en cache
+# de tous les corpus dans une nouvelle version de la collection, promue après
+# contrôle (versioning.py build).
+# Les fichiers dérivés des chunks (chunk_store*, dedup_map*, article_index.json)
+# ne sont pas versionnés : un premier lancement les produit (étape corpus).
+DOCUMENTS_PATH = Path("data") / "documents.json"
+STATE_PATH = Path("data") / "pipeline_state.json"
+CODE_DIR = Path(__file__).parent
+
+# Paramètres qui entrent dans les empreintes : les changer invalide les étapes
+OCR_DPI = 300
+OCR_LANG = "fra"
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 50
+EMBED_MODEL = "BAAI/bge-m3"
+
+# Étapes qui ne doivent pas tourner en même temps (mémoire du modèle, CPU)
+EXCLUSIVE_GROUPS = {"encoder": 1, "ocr": 1}
+
+CHUNK_FILES_KEY = "chunks"     # clé du fichier de chunks d'un document dans documents.json
+
+
+def load_documents(path=DOCUMENTS_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ==============================
+# 2. Empreintes
+# ==============================
+class Fingerprints:
+    """Empreintes de contenu des fichiers, recalculées seulement si taille ou date changent"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def file(self, path):
+        path = Path(path)
+        if not path.exists():
+            return None
+        stat = path.stat()
+        key = str(path)
+        with self._lock:
+            cached = self.cache.get(key)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+                return cached[2]
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with self._lock:
+            self.cache[key] = [stat.st_size, stat.st_mtime, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def stage(self, stage):
+        payload = {
+            "params": stage.params(),
+            "inputs": {str(p): self.file(p) for p in stage.inputs},
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+# ==============================
+# 3. Étapes
+# ==============================
+class Stage:
+    """Une étape : entrées (fichiers), sorties (fichiers), paramètres et dépendances"""
+
+    def __init__(self, name, run, inputs=(), outputs=(), params=None, deps=(), group=None, always=False):
+        self.name = name
+        self.run = run
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self._params = params or {}
+        self.deps = list(deps)
+        self.group = group
+        self.always = always      # pas de sortie fichier à vérifier : toujours rejouée (ex: contrôle Milvus)
+
+    def params(self):
+        return self._params() if callable(self._params) else self._params
+
+
+def _run_script(script, *args, env=None):
+    subprocess.run([sys.executable, str(CODE_DIR / script), *[str(a) for a in args]],
+                   env=dict(os.environ, **(env or {})), check=True)
+
+
+def _ocr(doc):
+    _run_script("manuel_ocr.py", doc["pdf"], doc["text"], OCR_DPI)
+
+
+def _chunk(doc):
+    from chunking import process_document
+
+    is_txt = bool(doc.get("ocr"))
+    process_document(doc["text"] if is_txt else doc["pdf"], doc["source"], doc[CHUNK_FILES_KEY],
+                     chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, is_txt=is_txt)
+
+
+def _corpus(documents):
+    from article_index import build_article_index_file
+    from chunk_store import build_chunk_store
+    from context_expansion import build_small_index
+    from dedup import build_dedup_map
+
+    files = [Path(d[CHUNK_FILES_KEY]) for d in documents]
+    build_chunk_store(files, Path("data") / "chunk_store.bin")
+    build_dedup_map(files, Path("data") / "dedup_map.json")
+    build_article_index_file(files, Path("data") / "article_index.json")
+    # Petits chunks du mode small-to-big (quelques secondes, construits dans tous les cas)
+    build_small_index(files)
+
+
+def _alias_subset(source=None):
+    """Alias à ne pas encoder pour une source (None = toutes) : seule cette partie de la carte de doublons compte"""
+    from context_expansion import INDEX_DEDUP_MAP_PATH
+    from dedup import SKIP_EMBED_THRESHOLD, load_alias_map, skipped_aliases
+
+    prefix = f"{source}_" if source else ""
+    alias_map = load_alias_map(INDEX_DEDUP_MAP_PATH, min_similarity=SKIP_EMBED_THRESHOLD)
+    return sorted(a for a in skipped_aliases(alias_map) if a.startswith(prefix))
+
+
+def _build_version():
+    # Nouvelle version construite à côté de la version servie, promue par
+    # versioning.py seulement si elle passe les contrôles (échec = étape en échec)
+    _run_script("versioning.py", "build")
+
+
+def _encode_params():
+    from context_expansion import SMALL_TO_BIG
+    from onnx_encoder import ENCODER_BACKEND
+
+    return {"model": EMBED_MODEL, "backend": ENCODER_BACKEND, "small_to_big": SMALL_TO_BIG}
+
+
+def _embed_params():
+    from compression import DENSE_MODE, SPARSE_MASS, SPARSE_TOP_N
+
+    return {**_encode_params(), "dense_mode": DENSE_MODE,
+            "sparse_top_n": SPARSE_TOP_N, "sparse_mass": SPARSE_MASS, "aliases": _alias_subset()}
+
+
+def _local_index_params():
+    from local_index import EF_CONSTRUCTION, HNSW_M
+
+    return {**_embed_params(), "m": HNSW_M, "ef_construction": EF_CONSTRUCTION}
+
+
+def build_stages(documents, embed=True):
+    from context_expansion import INDEX_CHUNK_FILES, SMALL_DEDUP_MAP_PATH, SMALL_STORE_PATH
+    from chunk_store import meta_path
+    from embedding_cache import cache_path
+    from local_index import LOCAL_INDEX_PATH, VECTOR_BACKEND
+
+    stages = {}
+
+    def add(stage):
+        stages[stage.name] = stage
+
+    for doc in documents:
+        source = doc["source"]
+        chunk_deps = []
+        if doc.get("ocr"):
+            add(Stage(f"ocr:{source}", lambda d=doc: _ocr(d),
+                      inputs=[doc["pdf"], CODE_DIR / "manuel_ocr.py", CODE_DIR / "text_normalization.py"],
+                      outputs=[doc["text"]], params={"dpi": OCR_DPI, "lang": OCR_LANG}, group="ocr"))
+            chunk_deps.append(f"ocr:{source}")
+        add(Stage(f"chunk:{source}", lambda d=doc: _chunk(d),
+                  inputs=[doc["text"] if doc.get("ocr") else doc["pdf"],
+                          CODE_DIR / "chunking.py", CODE_DIR / "text_normalization.py"],
+                  outputs=[doc[CHUNK_FILES_KEY]],
+                  params={"chunk_size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP}, deps=chunk_deps))
+
+    chunk_files = [d[CHUNK_FILES_KEY] for d in documents]
+    add(Stage("corpus", lambda: _corpus(documents),
+              inputs=chunk_files + [CODE_DIR / "chunk_store.py", CODE_DIR / "dedup.py", CODE_DIR / "article_index.py",
+                                    CODE_DIR / "context_expansion.py"],
+              outputs=[Path("data") / "chunk_store.bin", Path("data") / "chunk_store.json",
+                       Path("data") / "dedup_map.json", Path("data") / "article_index.json",
+                       SMALL_STORE_PATH, meta_path(SMALL_STORE_PATH), SMALL_DEDUP_MAP_PATH],
+              deps=[f"chunk:{d['source']}" for d in documents]))
+
+    if not embed:
+        return stages
+    # Encodage par document : seul le document dont les chunks ont changé est réencodé
+    caches = []
+    for doc in documents:
+        source = doc["source"]
+        caches.append(cache_path(source))
+        add(Stage(f"embed:{source}", lambda d=doc: _run_script("embedding_cache.py", d[CHUNK_FILES_KEY], d["source"]),
+                  inputs=[doc[CHUNK_FILES_KEY], CODE_DIR / "embedding_cache.py", CODE_DIR / "context_expansion.py"],
+                  outputs=[cache_path(source)], params=_encode_params, deps=[f"chunk:{source}"], group="encoder"))
+    embed_deps = ["corpus"] + [f"embed:{d['source']}" for d in documents]
+
+    if VECTOR_BACKEND == "local":
+        # Sans Milvus : index local construit depuis les vecteurs en cache (local_index.py)
+        add(Stage("local-index", lambda: _run_script("local_index.py", "build"),
+                  inputs=INDEX_CHUNK_FILES + caches + [CODE_DIR / "local_index.py"], outputs=[LOCAL_INDEX_PATH],
+                  params=_local_index_params, deps=embed_deps))
+        return stages
+    # Nouvelle version de collection remplie avec les vecteurs en cache (versioning.py) :
+    # la version servie n'est jamais modifiée en place, l'alias bascule après contrôle
+    add(Stage("index", _build_version,
+              inputs=INDEX_CHUNK_FILES + caches + [CODE_DIR / "embed_insert.py", CODE_DIR / "versioning.py"],
+              params=_embed_params, deps=embed_deps))
+    return stages
+
+# ==============================
+# 4. Exécution
+# ==============================
+class PipelineRunner:
+    """Exécute les étapes périmées dans l'ordre des dépendances.
+
+    Une étape est à jour si l'empreinte de ses entrées et paramètres est celle
+    de sa dernière exécution réussie et que ses sorties existent. Les étapes
+    indépendantes (documents différents) tournent en parallèle, sauf celles
+    d'un même groupe exclusif (OCR, encodeur).
+    """
+
+    def __init__(self, stages, state_path=STATE_PATH, max_workers=4, force=(), dry_run=False):
+        self.stages = stages
+        self.state_path = Path(state_path)
+        self.max_workers = max_workers
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.state = {"stages": {}, "files": {}}
+        if self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        self.fingerprints = Fingerprints(self.state["files"])
+        self.groups = {g: threading.Semaphore(n) for g, n in EXCLUSIVE_GROUPS.items()}
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def _save(self):
+        with self._lock:
+            tmp = self.state_path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=1)
+            tmp.replace(self.state_path)
+
+    def _up_to_date(self, stage, fingerprint):
+        previous = self.state["stages"].get(stage.name, {})
+        return (stage.name not in self.force and not stage.always
+                and previous.get("fingerprint") == fingerprint
+                and all(p.exists() for p in stage.outputs))
+
+    def _execute(self, stage):
+        # L'empreinte est calculée quand les dépendances sont terminées (leurs sorties sont nos entrées)
+        fingerprint = self.fingerprints.stage(stage)
+        upstream_changed = any(self.results[d][0] == "à refaire" and not self.stages[d].always
+                               for d in stage.deps)
+        if not upstream_changed and self._up_to_date(stage, fingerprint):
+            return "à jour", 0.0
+        if self.dry_run and upstream_changed:
+            return "à refaire", 0.0
+        missing = [str(p) for p in stage.inputs if not p.exists()]
+        if missing:
+            # Document source absent (ex: PDF scanné non fourni) mais sortie déjà produite : on la garde
+            if not stage.deps and stage.outputs and all(p.exists() for p in stage.outputs):
+                return "conservée", 0.0
+            raise FileNotFoundError(f"entrées absentes: {', '.join(missing)}")
+        if self.dry_run:
+            return "à refaire", 0.0
+
+        semaphore = self.groups.get(stage.group)
+        start = time.perf_counter()
+        if semaphore is not None:
+            with semaphore:
+                stage.run()
+        else:
+            stage.run()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.state["stages"][stage.name] = {"fingerprint": fingerprint,
+                                                "seconds": round(elapsed, 2), "finished_at": time.time()}
+        self._save()
+        return "exécutée", elapsed
+
+    def run(self):
+        pending = dict(self.stages)
+        running = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    states = [self.results.get(d, (None,))[0] for d in stage.deps]
+                    if any(s in ("échec", "bloquée") for s in states):
+                        self.results[name] = ("bloquée", 0.0, None)
+                        del pending[name]
+                    elif all(s is not None for s in states):
+                        running[pool.submit(self._execute, stage)] = name
+                        del pending[name]
+                if not running:
+                    if pending:
+                        raise ValueError(f"Dépendances introuvables ou circulaires: {sorted(pending)}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status, elapsed = future.result()
+                        self.results[name] = (status, elapsed, None)
+                    except Exception as e:
+                        self.results[name] = ("échec", 0.0, e)
+                    print(f"[{self.results[name][0]}] {name}")
+        self._save()
+        return time.perf_counter() - start
+
+    def summary(self, wall_time):
+        print(f"\n{'étape':<34}{'statut':<12}{'durée':>10}{'précédente':>12}")
+        for name in self.stages:
+            status, elapsed, error = self.results.get(name, ("?", 0.0, None))
+            previous = self.state["stages"].get(name, {}).get("seconds")
+            line = f"{name:<34}{status:<12}{elapsed:>9.1f}s"
+            line += f"{previous:>11.1f}s" if previous is not None and status == "à jour" else f"{'':>12}"
+            print(line + (f"  {error}" if error else ""))
+        ran = sum(1 for s, _, _ in self.results.values() if s == "exécutée")
+        print(f"\n{ran} étape(s) exécutée(s) sur {len(self.stages)} en {wall_time:.1f} s")
+        return all(s not in ("échec", "bloquée") for s, _, _ in self.results.values())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pipeline d'ingestion OCR → chunking → encodage → index")
+    parser.add_argument("--force", nargs="*", default=[], help="étapes à rejouer (ex: corpus, chunk:Code_du_travail)")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--no-embed", action="store_true", help="sans Milvus ni encodeur")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    stages = build_stages(load_documents(), embed=not args.no_embed)
+    unknown = set(args.force) - set(stages)
+    if unknown:
+        parser.error(f"étapes inconnues: {sorted(unknown)}")
+    runner = PipelineRunner(stages, max_workers=args.workers, force=args.force, dry_run=args.dry_run)
+    sys.exit(0 if runner.summary(runner.run()) else 1)
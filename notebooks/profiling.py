@@ -0,0 +1,232 @@
+import cProfile
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Tout est désactivé par défaut ; rien n'est instrumenté tant qu'une de ces
+# variables n'est pas positionnée (aucun coût sur le chemin des requêtes).
+#   CHATBOT_PROFILING=1        autorise le profil cProfile d'une requête
+#                              (?profile=1 dans l'URL de l'application)
+#   CHATBOT_SAMPLING=1         profileur par échantillonnage du processus servi
+#   CHATBOT_TRACEMALLOC=1      instantanés mémoire des scripts d'ingestion
+PROFILING = os.environ.get("CHATBOT_PROFILING") == "1"
+SAMPLING = os.environ.get("CHATBOT_SAMPLING") == "1"
+TRACEMALLOC = os.environ.get("CHATBOT_TRACEMALLOC") == "1"
+
+PROFILE_DIR = Path(os.environ.get("CHATBOT_PROFILE_DIR", str(Path("data") / "profiles")))
+
+# Échantillonnage : une pile par thread toutes les SAMPLING_INTERVAL secondes,
+# un fichier .folded écrit toutes les SAMPLING_PERIOD secondes
+SAMPLING_INTERVAL = float(os.environ.get("CHATBOT_SAMPLING_INTERVAL_MS", "10")) / 1000
+SAMPLING_PERIOD = float(os.environ.get("CHATBOT_SAMPLING_PERIOD", "60"))
+
+TRACEMALLOC_FRAMES = 25
+TOP_ALLOCATIONS = 10
+
+
+def _artifact(kind, label, suffix):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    safe = "".join(c if c.isalnum() else "-" for c in label)[:40].strip("-") or kind
+    return PROFILE_DIR / f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{safe}{suffix}"
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+# ==============================
+# 2. cProfile d'une requête
+# ==============================
+def profiled(func, label=None):
+    """Version de `func` exécutée sous cProfile ; le profil est écrit à chaque appel.
+
+    Le .prof (format pstats) se lit avec snakeviz, tuna ou flameprof
+    (flameprof profil.prof > flamegraph.svg). cProfile ne suit que le thread
+    appelant : envelopper la fonction soumise à la file, pas l'appel à submit().
+    """
+    label = label or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            path = _artifact("request", label, ".prof")
+            profile.dump_stats(path)
+            print(f"Profil ({time.perf_counter() - start:.2f} s) écrit dans {path}")
+    return wrapper
+
+
+def top_functions(prof_path, limit=20, sort="cumulative"):
+    import pstats
+
+    pstats.Stats(str(prof_path)).strip_dirs().sort_stats(sort).print_stats(limit)
+
+# ==============================
+# 3. Profileur par échantillonnage
+# ==============================
+class Sampler:
+    """Relève périodiquement la pile de chaque thread (sys._current_frames).
+
+    Aucun traçage des appels : le coût est un parcours de pile par thread à
+    chaque intervalle. Les piles sont écrites au format "folded" (une ligne
+    "f1;f2;f3 n" par pile) lu par flamegraph.pl, speedscope et inferno.
+    """
+
+    def __init__(self, interval=SAMPLING_INTERVAL, period=SAMPLING_PERIOD):
+        self.interval = interval
+        self.period = period
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+        print(f"Échantillonnage actif: {1000 * self.interval:.0f} ms, fichier toutes les {self.period:.0f} s "
+              f"dans {PROFILE_DIR}")
+        return self
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            with self._lock:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        last_dump = time.monotonic()
+        while not self._stop.wait(self.interval):
+            self._sample()
+            if time.monotonic() - last_dump >= self.period:
+                self.dump()
+                last_dump = time.monotonic()
+
+    def dump(self, label="serve"):
+        """Écrit les piles accumulées depuis le dernier fichier puis repart de zéro"""
+        with self._lock:
+            samples, self.samples = self.samples, Counter()
+        if not samples:
+            return None
+        path = _artifact("sampling", label, ".folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.dump()
+
+
+def start_sampling():
+    """Démarre l'échantillonnage si CHATBOT_SAMPLING=1, sinon None"""
+    return Sampler().start() if SAMPLING else None
+
+# ==============================
+# 4. Instantanés mémoire (ingestion)
+# ==============================
+def start_tracemalloc():
+    """À appeler en tête d'un script d'ingestion ; sans effet sans CHATBOT_TRACEMALLOC=1"""
+    if TRACEMALLOC and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        print(f"tracemalloc actif ({TRACEMALLOC_FRAMES} frames)")
+
+
+def memory_snapshot(label):
+    """Écrit un instantané (.snapshot + piles .folded en octets) et affiche les plus gros postes.
+
+    Le .snapshot se recharge avec tracemalloc.Snapshot.load() pour comparer
+    deux étapes ; le .folded donne un flame graph de la mémoire encore allouée.
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    current, peak = tracemalloc.get_traced_memory()
+    path = _artifact("memory", label, ".snapshot")
+    snapshot.dump(str(path))
+
+    stacks = Counter()
+    for stat in snapshot.statistics("traceback"):
+        frames = [f"{Path(f.filename).name}:{f.lineno}" for f in reversed(stat.traceback)]
+        stacks[";".join(frames)] += stat.size
+    with open(path.with_suffix(".folded"), "w", encoding="utf-8") as f:
+        for stack, size in stacks.most_common():
+            f.write(f"{stack} {size}\n")
+
+    print(f"Mémoire [{label}]: {current / 2**20:.1f} Mo alloués, pic {peak / 2**20:.1f} Mo → {path}")
+    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        print(f"  {stat.size / 2**20:8.2f} Mo  {stat.count:>8} blocs  {Path(frame.filename).name}:{frame.lineno}")
+    return path
+
+
+def compare_snapshots(before, after, limit=TOP_ALLOCATIONS):
+    """Différence entre deux instantanés écrits par memory_snapshot()"""
+    old = tracemalloc.Snapshot.load(str(before))
+    new = tracemalloc.Snapshot.load(str(after))
+    for stat in new.compare_to(old, "lineno")[:limit]:
+        print(f"  {stat.size_diff / 2**20:+8.2f} Mo  {stat.traceback[0]}")
+
+# ==============================
+# 5. Coût du profilage désactivé / actif
+# ==============================
+def overhead(n=100000):
+    """Coût de l'instrumentation sur une fonction courte : directe, cProfile, échantillonnée"""
+    def work():
+        return sum(i * i for i in range(200))
+
+    def timed(f):
+        start = time.perf_counter()
+        for _ in range(n):
+            f()
+        return 1e6 * (time.perf_counter() - start) / n
+
+    timed(work)  # mise en température
+    direct = timed(work)
+    profile = cProfile.Profile()
+    profiled_call = timed(lambda: profile.runcall(work))
+    sampler = Sampler(period=3600).start()
+    sampled = timed(work)
+    sampler._stop.set()
+    sampler._thread.join()
+    print(f"direct: {direct:.2f} µs/appel, cProfile: {profiled_call:.2f} µs (x{profiled_call / direct:.1f}), "
+          f"échantillonnage {1000 * sampler.interval:.0f} ms: {sampled:.2f} µs "
+          f"({100 * (sampled / direct - 1):+.1f} %), {sum(sampler.samples.values())} échantillons")
+
+
+if __name__ == "__main__":
+    # Usage : python profiling.py request "question" | top fichier.prof [n]
+    #                             | diff avant.snapshot après.snapshot | overhead
+    command = sys.argv[1] if len(sys.argv) > 1 else "overhead"
+    if command == "request":
+        from rag_generation import generate_answer_ollama
+        print(profiled(generate_answer_ollama, "cli")(sys.argv[2], log_query=False))
+    elif command == "top":
+        top_functions(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 20)
+    elif command == "diff":
+        compare_snapshots(sys.argv[2], sys.argv[3])
+    else:
+        overhead()
@@ -0,0 +1,238 @@
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from chunk_store import chunk_key
+from faq_cache import normalize_question
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Journal des questions (JSON Lines, ajout seul) : data/query_log/queries.jsonl,
+# renommé en queries.jsonl.1 ... .{BACKUPS} quand il dépasse MAX_BYTES.
+# Désactivé par défaut, activé avec CHATBOT_QUERY_LOG=1. Seule la forme
+# normalisée de la question est gardée (minuscules, sans accents ni
+# ponctuation, MAX_QUESTION_CHARS au plus), jamais le texte saisi.
+# Conservation : au plus (BACKUPS + 1) x MAX_BYTES, les fichiers les plus
+# anciens étant supprimés à la rotation ; supprimer data/query_log/ efface tout.
+ENABLED = os.environ.get("CHATBOT_QUERY_LOG", "0") == "1"
+LOG_DIR = Path("data") / "query_log"
+LOG_NAME = "queries.jsonl"
+MAX_BYTES = int(float(os.environ.get("CHATBOT_QUERY_LOG_MAX_MB", "10")) * 2**20)
+BACKUPS = 5
+
+# File d'attente du writer : au-delà, les entrées sont abandonnées (comptées)
+# plutôt que de ralentir une requête
+QUEUE_SIZE = 10000
+FLUSH_INTERVAL = 1.0
+
+# Préchauffage au démarrage : questions les plus fréquentes rejouées
+WARMUP_TOP_N = int(os.environ.get("CHATBOT_WARMUP_TOP_N", "20"))
+MAX_QUESTION_CHARS = 500
+
+# ==============================
+# 2. Écriture en arrière-plan
+# ==============================
+class QueryLog:
+    """Journal des requêtes écrit hors du chemin de la requête.
+
+    record() ne fait que construire l'entrée et la déposer dans une file ; un
+    thread unique (démarré au premier appel) écrit les entrées par lots,
+    vide le fichier toutes les FLUSH_INTERVAL secondes et fait la rotation.
+    """
+
+    def __init__(self, log_dir=LOG_DIR, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.log_dir = Path(log_dir)
+        self.path = self.log_dir / LOG_NAME
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, question, timings=None, passages=None, answer=None, sources=None, origin="app"):
+        entry = {
+            "ts": round(time.time(), 3),
+            "query": normalize_question(question)[:MAX_QUESTION_CHARS],
+            "origin": origin,
+            "sources": sources,
+            "timings": {k: round(v, 4) for k, v in (timings or {}).items()},
+            "chunks": [chunk_key(p["source"], p["chunk_index"]) for p in passages or []],
+            "answer_hash": hashlib.sha1(answer.encode("utf-8")).hexdigest()[:12] if answer else None,
+        }
+        self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self.log_dir.mkdir(parents=True, exist_ok=True)
+                    self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _run(self):
+        f = open(self.path, "a", encoding="utf-8")
+        last_flush = time.monotonic()
+        while True:
+            try:
+                entry = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                entry = None
+            if entry is not None:
+                batch = [entry]
+                while len(batch) < 1000:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = any(e is _STOP for e in batch)
+                for e in batch:
+                    if e is not _STOP:
+                        f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                    self._queue.task_done()
+                if stop:
+                    f.close()
+                    return
+            if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                f.flush()
+                last_flush = time.monotonic()
+                if f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, "a", encoding="utf-8")
+
+    def _rotate(self):
+        """queries.jsonl -> .1 -> .2 ... ; le plus ancien au-delà de BACKUPS est supprimé"""
+        oldest = self.path.with_name(f"{LOG_NAME}.{self.backups}")
+        if oldest.exists():
+            oldest.unlink()
+        for n in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{LOG_NAME}.{n}")
+            if older.exists():
+                older.replace(self.path.with_name(f"{LOG_NAME}.{n + 1}"))
+        self.path.replace(self.path.with_name(f"{LOG_NAME}.1"))
+
+    def close(self, timeout=5.0):
+        """Écrit les entrées en attente puis arrête le writer"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+_STOP = object()
+
+
+def open_query_log():
+    return QueryLog() if ENABLED else None
+
+# ==============================
+# 3. Lecture et analyse
+# ==============================
+def log_files(log_dir=LOG_DIR):
+    """Fichiers du journal, du plus ancien au plus récent"""
+    log_dir = Path(log_dir)
+    rotated = sorted(log_dir.glob(f"{LOG_NAME}.*"), key=lambda p: int(p.suffix[1:]), reverse=True)
+    return rotated + ([log_dir / LOG_NAME] if (log_dir / LOG_NAME).exists() else [])
+
+
+def iter_entries(log_dir=LOG_DIR):
+    for path in log_files(log_dir):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # dernière ligne tronquée (arrêt brutal)
+
+
+def top_questions(n=WARMUP_TOP_N, log_dir=LOG_DIR):
+    """Questions les plus fréquentes (forme normalisée) et leur nombre"""
+    counts = Counter(entry["query"] for entry in iter_entries(log_dir))
+    return [(query, count) for query, count in counts.most_common(n) if query]
+
+
+def stats(log_dir=LOG_DIR, top=10):
+    entries = list(iter_entries(log_dir))
+    if not entries:
+        print(f"Journal vide ({Path(log_dir) / LOG_NAME})")
+        return
+    span = (entries[-1]["ts"] - entries[0]["ts"]) / 3600
+    print(f"{len(entries)} requêtes sur {span:.1f} h ({len(log_files(log_dir))} fichier(s))")
+
+    print("\nDurée par étape (s):")
+    stages = sorted({k for e in entries for k in e["timings"]})
+    for stage in stages:
+        values = [e["timings"][stage] for e in entries if stage in e["timings"]]
+        p50, p95 = np.percentile(values, [50, 95])
+        print(f"  {stage:<12} n={len(values):<6} p50={p50:.3f}  p95={p95:.3f}")
+
+    print(f"\nQuestions les plus fréquentes:")
+    by_query = {}
+    for e in entries:
+        by_query.setdefault(e["query"], []).append(e)
+    ranked = sorted(by_query.items(), key=lambda kv: len(kv[1]), reverse=True)[:top]
+    for query, group in ranked:
+        answers = {e["answer_hash"] for e in group if e["answer_hash"]}
+        totals = [e["timings"]["total"] for e in group if "total" in e["timings"]]
+        mean = f"{sum(totals) / len(totals):.2f} s" if totals else "-"
+        print(f"  {len(group):>5}x  {mean:>7}  {len(answers)} réponse(s) distincte(s)  {query[:60]}")
+
+    chunks = Counter(c for e in entries for c in e["chunks"])
+    print("\nChunks les plus servis:")
+    for key, count in chunks.most_common(top):
+        print(f"  {count:>5}x  {key}")
+    print(f"\n{len(chunks)} chunks distincts servis")
+
+# ==============================
+# 4. Préchauffage au démarrage
+# ==============================
+def warm_up(retrieve, top_n=WARMUP_TOP_N, log_dir=LOG_DIR):
+    """Rejoue les questions fréquentes dans `retrieve` (encodeur + recherche).
+
+    Charge le modèle, la collection Milvus et les pages du chunk store avant
+    les premières requêtes. Retourne le nombre de questions rejouées.
+    """
+    questions = top_questions(top_n, log_dir)
+    if not questions:
+        return 0
+    start = time.perf_counter()
+    latencies = []
+    for question, _ in questions:
+        t = time.perf_counter()
+        try:
+            retrieve(question)
+        except Exception as e:
+            print(f"Préchauffage interrompu: {e}")
+            break
+        latencies.append(time.perf_counter() - t)
+    if latencies:
+        print(f"Préchauffage: {len(latencies)} questions fréquentes rejouées en "
+              f"{time.perf_counter() - start:.1f} s (première {latencies[0]:.2f} s, "
+              f"dernière {latencies[-1]:.2f} s)")
+    return len(latencies)
+
+
+if __name__ == "__main__":
+    # Usage : python query_log.py stats [top] | warmup [N]
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "warmup":
+        from rag_generation import retrieve_passages
+        warm_up(retrieve_passages, int(sys.argv[2]) if len(sys.argv) > 2 else WARMUP_TOP_N)
+    else:
+        stats(top=int(sys.argv[2]) if len(sys.argv) > 2 else 10)
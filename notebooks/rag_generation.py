@@ -1,24 +1,59 @@
 import requests
 import json
+import os
 import sys
 import queue
-import sounddevice as sd
-import vosk
+import time
+import hybrid_search as hs
 from hybrid_search import hybrid_search
+from speculative_retrieval import SpeculativeRetriever
+from article_index import INDEX_PATH, ArticleRouter
+from dedup import DEDUP_MAP_PATH, load_alias_map, collapse_duplicates
+from faq_cache import FaqTable, is_error_answer
+from resources import llm_threads
+from context_expansion import CONTEXT_CHARS, MIN_EXCERPT_CHARS, PROMPT_CHARS
+from query_log import open_query_log
+from conversation_memory import ConversationMemory
+from versioning import sidecar_path
 
 # ==============================
 # 1. Configuration Ollama
 # ==============================
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_HOST = os.environ.get("CHATBOT_OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_URL = f"{OLLAMA_HOST}/api/generate"
 # MODEL_NAME = "gemma2:2b"
 MODEL_NAME = "qwen2.5:3b"
 
+# Pré-routeur : les questions citant un article sont servies par l'index
+# (fichiers de la version servie, rouverts avec ceux de hybrid_search)
+ARTICLE_ROUTER = ALIAS_MAP = None
+ROUTER_DIR = False
+
+
+def refresh_router():
+    global ARTICLE_ROUTER, ALIAS_MAP, ROUTER_DIR
+    hs.refresh_sidecars()
+    if hs.SIDECAR_DIR == ROUTER_DIR:
+        return
+    ARTICLE_ROUTER = ArticleRouter(sidecar_path(INDEX_PATH, hs.SIDECAR_DIR))
+    ALIAS_MAP = load_alias_map(sidecar_path(DEDUP_MAP_PATH, hs.SIDECAR_DIR))
+    ROUTER_DIR = hs.SIDECAR_DIR
+
+
+refresh_router()
+
+# Réponses précalculées pour les questions fréquentes (faq_cache.py)
+FAQ_TABLE = FaqTable()
+
+# Journal des questions (query_log.py), écrit en arrière-plan ; None = désactivé
+QUERY_LOG = open_query_log()
+
 # ==============================
 # 2. Vérification Ollama
 # ==============================
 def check_ollama():
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        response = requests.get(f"{OLLAMA_HOST}/api/tags", timeout=5)
         if response.status_code == 200:
             models = response.json().get('models', [])
             model_names = [m['name'] for m in models]
@@ -41,15 +76,29 @@ def check_ollama():
 # ==============================
 # 3. Prompt juridique
 # ==============================
-def build_legal_prompt(question, passages):
+def build_legal_prompt(question, passages, history=None, context_chars=CONTEXT_CHARS):
+    # history : résumé borné des échanges précédents (ConversationMemory.summary)
+    # context_chars : budget total des extraits ; les passages sont dans l'ordre
+    # du classement, les derniers sont raccourcis (puis omis) en premier
     context = ""
+    remaining = context_chars
     for i, p in enumerate(passages, 1):
-        text_excerpt = p['text'][:500] + "..." if len(p['text']) > 500 else p['text']
+        # Fenêtre élargie (small-to-big) : déjà bornée, on en garde davantage
+        limit = min(PROMPT_CHARS if "chunk_range" in p else 500, remaining)
+        if limit < min(MIN_EXCERPT_CHARS, len(p['text'])):
+            break
+        text_excerpt = p['text'][:limit] + "..." if len(p['text']) > limit else p['text']
+        remaining -= min(limit, len(p['text']))
         context += f"[{i}] {text_excerpt}\n"
         context += f"    Source: {p['source']} - Section {p['chunk_index']}\n\n"
 
-    prompt = f"""Tu es un assistant juridique spécialisé dans le droit du travail sénégalais.
+    conversation = f"""
+ÉCHANGES PRÉCÉDENTS (résumé) :
+{history}
+""" if history else ""
 
+    prompt = f"""Tu es un assistant juridique spécialisé dans le droit du travail sénégalais.
+{conversation}
 CONTEXTE JURIDIQUE :
 {context}
 
@@ -68,15 +117,62 @@ RÉPONSE :"""
 # ==============================
 # 4. Génération avec Ollama
 # ==============================
-def generate_answer_ollama(question, max_tokens=400, temperature=0.0):
+def retrieve_passages(question, top_k=3, sources=None):
+    """Index des articles si la question en cite un, sinon recherche hybride"""
+    refresh_router()
+    passages = ARTICLE_ROUTER.route(question, top_k=top_k, sources=sources)
+    if passages is not None:
+        return collapse_duplicates(passages, ALIAS_MAP)
+    print("🔎 Recherche des passages pertinents...")
+    return hybrid_search(question, top_k=top_k, alpha=0.5, return_passages=True, sources=sources)
+
+def generate_answer_ollama(question, max_tokens=400, temperature=0.0, passages=None, sources=None,
+                           use_faq=True, timings=None, log_query=True, memory=None):
+    # timings : dict optionnel rempli avec la durée de chaque étape en secondes
+    # ("faq", "retrieval", "generation", "total") -> utilisé par loadtest.py
+    # log_query : False pour les appels qui ne sont pas des questions d'utilisateurs (précalcul FAQ)
+    # memory : ConversationMemory de la session (questions de suivi), None = question isolée
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    # Question de suivi ("et en cas de faute grave ?") -> requête autonome pour la recherche
+    query = memory.rewrite(question) if memory is not None else question
+    answer, passages = _generate_answer(question, query, max_tokens, temperature, passages, sources, use_faq,
+                                        timings, memory)
+    timings["total"] = time.perf_counter() - start
+    if memory is not None and not is_error_answer(answer):
+        memory.add_turn(question, query, answer, passages)
+    if log_query and QUERY_LOG is not None:
+        QUERY_LOG.record(query, timings, passages, answer, sources=sources)
+    return answer
+
+def _generate_answer(question, query, max_tokens, temperature, passages, sources, use_faq, timings, memory):
+    """Réponse et passages utilisés (None si la réponse vient de la FAQ)"""
     try:
-        print("🔎 Recherche des passages pertinents...")
-        passages = hybrid_search(question, top_k=3, alpha=0.5, return_passages=True)
+        # Question fréquente déjà répondue sur le corpus courant (corpus complet,
+        # question autonome uniquement)
+        if use_faq and passages is None and sources is None and query == question:
+            start = time.perf_counter()
+            cached = FAQ_TABLE.lookup(question)
+            timings["faq"] = time.perf_counter() - start
+            if cached is not None:
+                return cached, None
+
+        # passages déjà calculés (ex: recherche spéculative pendant la parole)
+        if passages is None:
+            start = time.perf_counter()
+            if memory is not None:
+                # Passages des tours précédents réutilisés s'ils couvrent encore la requête
+                passages = memory.passages_for(
+                    query, lambda q: retrieve_passages(q, top_k=3, sources=sources), top_k=3, sources=sources,
+                    follow_up=query != question, question=question)
+            else:
+                passages = retrieve_passages(query, top_k=3, sources=sources)
+            timings["retrieval"] = time.perf_counter() - start
 
         if not passages:
-            return "Aucune information pertinente trouvée dans la base de données juridique."
+            return "Aucune information pertinente trouvée dans la base de données juridique.", None
 
-        prompt = build_legal_prompt(question, passages)
+        prompt = build_legal_prompt(question, passages, history=memory.summary() if memory is not None else None)
 
         payload = {
             "model": MODEL_NAME,
@@ -89,27 +185,37 @@ def generate_answer_ollama(question, max_tokens=400, temperature=0.0):
                 "repeat_penalty": 1.1
             }
         }
+        # Threads CPU réservés au LLM par le profil de ressources (serve), si configuré
+        threads = llm_threads()
+        if threads:
+            payload["options"]["num_thread"] = threads
 
+        start = time.perf_counter()
         response = requests.post(OLLAMA_URL, json=payload, timeout=120)
+        timings["generation"] = time.perf_counter() - start
 
         if response.status_code == 200:
             result = response.json()
-            return result.get('response', '').strip()
+            return result.get('response', '').strip(), passages
         else:
-            return f"Erreur API Ollama: {response.status_code} - {response.text}"
+            return f"Erreur API Ollama: {response.status_code} - {response.text}", passages
 
     except Exception as e:
-        return f"Erreur inattendue: {e}"
+        return f"Erreur inattendue: {e}", passages
+
+def answer_with_passages(question):
+    """Réponse et passages utilisés, sans passer par la table FAQ (précalcul)"""
+    passages = retrieve_passages(question, top_k=3)
+    answer = generate_answer_ollama(question, passages=passages, use_faq=False, log_query=False)
+    return answer, passages
 
 # ==============================
 # 5. STT avec Vosk
 # ==============================
+# Modèle Vosk partagé avec audio_transcription, chargé au premier usage du
+# micro : le mode clavier et les scripts qui importent ce module (faq_cache,
+# loadtest) n'en ont pas besoin
 MODEL_PATH = "models\\fr\\vosk-model-small-fr-0.22"
-try:
-    vosk_model = vosk.Model(MODEL_PATH)
-except Exception as e:
-    print(f"Erreur chargement modèle Vosk: {e}")
-    sys.exit(1)
 
 q = queue.Queue()
 def callback(indata, frames, time, status):
@@ -117,10 +223,18 @@ def callback(indata, frames, time, status):
         print(status, file=sys.stderr)
     q.put(bytes(indata))
 
-def listen_and_transcribe():
+def listen_and_transcribe(speculator=None):
+    import sounddevice as sd
+    import vosk
+    from audio_transcription import get_vosk_model
+
     samplerate = 16000
     device = None
-    rec = vosk.KaldiRecognizer(vosk_model, samplerate)
+    try:
+        rec = vosk.KaldiRecognizer(get_vosk_model(MODEL_PATH), samplerate)
+    except Exception as e:
+        print(f"Erreur chargement modèle Vosk: {e}")
+        return ""
 
     print("Parlez maintenant (Ctrl+C pour arrêter)...")
 
@@ -136,6 +250,9 @@ def listen_and_transcribe():
                     if res.get("text"):
                         text = res["text"]
                         break
+                elif speculator is not None:
+                    # Lancer la recherche dès que la transcription partielle se stabilise
+                    speculator.update_partial(json.loads(rec.PartialResult()).get("partial", ""))
         except KeyboardInterrupt:
             print("\nArrêt manuel")
         return text
@@ -147,21 +264,41 @@ def interactive_chat():
     print("=" * 70)
     print("CHATBOT JURIDIQUE SÉNÉGALAIS")
     print("=" * 70)
-    print("Commandes: 'quit' pour quitter, 'help' pour l'aide")
+    print("Commandes: 'quit' pour quitter, 'help' pour l'aide, 'new' pour une nouvelle conversation")
     print("Modes: clavier (k) ou micro (m)")
     print()
 
     if not check_ollama():
         return
 
+    # Même chemin que les questions tapées : routeur d'articles puis recherche hybride, doublons fusionnés
+    speculator = SpeculativeRetriever(
+        lambda q, top_k=3, sources=None, **kwargs: retrieve_passages(q, top_k=top_k, sources=sources),
+        top_k=3, alpha=0.5)
+    # Questions de suivi reformulées, résumé borné des échanges précédents
+    memory = ConversationMemory()
+
+    # Réponses FAQ calculées sur un ancien corpus : pas de recalcul concurrent
+    # des questions posées ici (pas de JobQueue en ligne de commande)
+    stale = FAQ_TABLE.stale_questions()
+    if stale:
+        print(f"FAQ: {len(stale)} réponses périmées, recalcul avec `python faq_cache.py --stale`")
+
     while True:
         try:
 
             mode = input("\nUtiliser clavier ou micro ? (k/m): ").strip().lower()
+            passages = None
 
             if mode == "m":
-                question = listen_and_transcribe()
+                question = listen_and_transcribe(speculator)
                 print(f"\nVous avez dit: {question}")
+                passages = speculator.resolve(question)
+                print(speculator.report())
+                # Recherche spéculative faite sur la question brute : pour une question
+                # de suivi, la requête reformulée passe par la mémoire
+                if memory.is_follow_up(question):
+                    passages = None
             else:
                 question = input("\nVotre question juridique: ").strip()
 
@@ -172,6 +309,11 @@ def interactive_chat():
                 print("Merci d'avoir utilisé le chatbot !")
                 break
 
+            if question.lower() == 'new':
+                memory.reset()
+                print("Nouvelle conversation")
+                continue
+
             if question.lower() == 'help':
                 print("""
     Exemples de questions:
@@ -182,7 +324,7 @@ def interactive_chat():
                 continue
 
             print("Génération de la réponse...")
-            answer = generate_answer_ollama(question)
+            answer = generate_answer_ollama(question, passages=passages, memory=memory)
 
             print("\nRéponse:\n" + "-"*50)
             print(answer)
@@ -0,0 +1,94 @@
+import threading
+import queue
+
+IDLE = "idle"
+RECORDING = "recording"
+STOPPING = "stopping"
+
+
+class RecordingController:
+    """Coordination en mémoire entre l'interface et le thread d'enregistrement.
+
+    Une instance par session Streamlit : le signal d'arrêt est un
+    threading.Event, les transcriptions partielles sont conservées dans un
+    état protégé par un verrou et le résultat final passe par une queue.
+    Aucun fichier n'est écrit sur le disque.
+    """
+
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._partial = ""
+        self._partial_version = 0
+        self._results = queue.Queue()
+        self._thread = None
+        self._status = IDLE
+
+    # ---------- Côté interface ----------
+    def start(self, target):
+        """Lancer target(controller) dans un thread si aucun enregistrement n'est actif"""
+        with self._lock:
+            if self._status != IDLE:
+                return False
+            self._status = RECORDING
+            self._partial = ""
+            self._partial_version += 1
+        self.stop_event.clear()
+
+        def run():
+            try:
+                result = target(self)
+                self._results.put(result if result else "Aucune transcription")
+            except Exception as e:
+                print(f"Erreur dans thread: {e}")
+                self._results.put(f"Erreur: {str(e)[:50]}")
+            finally:
+                with self._lock:
+                    self._status = IDLE
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        """Envoyer le signal d'arrêt et attendre (optionnellement) la fin du thread"""
+        with self._lock:
+            if self._status == RECORDING:
+                self._status = STOPPING
+        self.stop_event.set()
+        if timeout is not None and self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_recording(self):
+        with self._lock:
+            return self._status != IDLE
+
+    def get_partial(self):
+        """Transcription partielle courante et son numéro de version"""
+        with self._lock:
+            return self._partial, self._partial_version
+
+    def pop_result(self):
+        """Résultat final s'il est disponible, sinon None"""
+        try:
+            return self._results.get_nowait()
+        except queue.Empty:
+            return None
+
+    def reset(self):
+        """Arrêter un éventuel enregistrement et vider les résultats en attente"""
+        self.stop(timeout=1.0)
+        while self.pop_result() is not None:
+            pass
+        with self._lock:
+            self._partial = ""
+
+    # ---------- Côté thread d'enregistrement ----------
+    def should_stop(self):
+        return self.stop_event.is_set()
+
+    def set_partial(self, text):
+        with self._lock:
+            if text != self._partial:
+                self._partial = text
+                self._partial_version += 1
@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Profil par défaut : "serve" (application : encodage des questions + LLM)
+# ou "ingest" (OCR puis encodage des chunks, sans LLM)
+PROFILE = os.environ.get("CHATBOT_PROFILE", "serve")
+PROFILES = ("ingest", "serve")
+
+# Cœurs laissés au système / à Streamlit en mode serve
+SERVE_RESERVED = 1
+
+# num_thread n'est envoyé à Ollama que si la machine est décrite explicitement
+# (CHATBOT_CPUS ou CHATBOT_PROFILE) : sinon le plan compte des cœurs logiques,
+# alors qu'Ollama choisit seul les cœurs physiques
+EXPLICIT = bool(os.environ.get("CHATBOT_CPUS") or os.environ.get("CHATBOT_PROFILE"))
+
+_applied = None
+
+
+def detect_cores():
+    """Cœurs utilisables par le processus (affinité CPU, ou CHATBOT_CPUS)"""
+    if os.environ.get("CHATBOT_CPUS"):
+        return max(1, int(os.environ["CHATBOT_CPUS"]))
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+# ==============================
+# 2. Budgets par étape
+# ==============================
+def plan(profile=PROFILE, cores=None):
+    """Threads et processus attribués à chaque étape pour un profil.
+
+    ingest : OCR puis encodage s'exécutent l'un après l'autre ; chacun prend
+    toute la machine. Tesseract est limité à 1 thread OpenMP par processus
+    (sinon N processus x N threads OpenMP).
+    serve : Ollama et l'encodage des questions tournent en même temps ; le
+    LLM reçoit la plus grosse part, l'encodeur un quart des cœurs.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Profil inconnu: {profile} (attendu: {', '.join(PROFILES)})")
+    cores = cores or detect_cores()
+    if profile == "ingest":
+        return {
+            "profile": profile,
+            "cores": cores,
+            "ocr_processes": cores,
+            "tesseract_threads": 1,
+            "encoder_threads": cores,
+            "encoder_interop": 1,
+            "llm_threads": None,
+        }
+    encoder = max(1, cores // 4)
+    return {
+        "profile": profile,
+        "cores": cores,
+        "ocr_processes": 1,
+        "tesseract_threads": 1,
+        "encoder_threads": encoder,
+        "encoder_interop": 1,
+        "llm_threads": max(1, cores - encoder - SERVE_RESERVED),
+    }
+
+
+def apply(profile=PROFILE, cores=None):
+    """Applique un profil au processus courant (une seule fois) et le retourne.
+
+    À appeler avant le premier calcul torch : le nombre de threads inter-op ne
+    peut plus changer ensuite. Les variables OpenMP sont héritées par les
+    processus enfants. OMP_THREAD_LIMIT n'est pas posé ici : libgomp le lit
+    au chargement et brider tout le processus à tesseract_threads limiterait
+    aussi l'encodeur ; il n'est fixé que dans les processus du pool OCR
+    (limit_tesseract_threads).
+    """
+    global _applied
+    if _applied is not None:
+        return _applied
+    budget = plan(profile, cores)
+    threads = str(budget["encoder_threads"])
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = threads
+    # torch lit OMP_NUM_THREADS à son import ; s'il est déjà importé, on le règle directement
+    if "torch" in sys.modules:
+        import torch
+        torch.set_num_threads(budget["encoder_threads"])
+        try:
+            torch.set_num_interop_threads(budget["encoder_interop"])
+        except RuntimeError:
+            pass  # torch déjà utilisé : inter-op figé
+    _applied = budget
+    print(f"Ressources ({budget['profile']}, {budget['cores']} cœurs): " + describe(budget))
+    return budget
+
+
+def limit_tesseract_threads(threads):
+    """Initializer d'un Pool OCR : tesseract (OpenMP) lancé par ce processus hérite de la limite"""
+    os.environ["OMP_THREAD_LIMIT"] = str(threads)
+
+
+def current():
+    """Profil appliqué, ou celui par défaut sans l'appliquer"""
+    return _applied or plan()
+
+
+def llm_threads():
+    """Threads à imposer au LLM (option num_thread d'Ollama), None = réglage d'Ollama"""
+    return current()["llm_threads"] if EXPLICIT else None
+
+
+def describe(budget):
+    parts = [f"encodeur {budget['encoder_threads']} threads"]
+    if budget["profile"] == "ingest":
+        parts.append(f"OCR {budget['ocr_processes']} processus x {budget['tesseract_threads']} thread")
+    if budget["llm_threads"]:
+        parts.append(f"LLM {budget['llm_threads']} threads")
+    return ", ".join(parts)
+
+# ==============================
+# 3. Mesure du débit
+# ==============================
+def _bench_encoder(threads_list, n_chunks=64):
+    from chunk_store import load_chunks
+    from onnx_encoder import load_encoder
+    import torch
+
+    texts = [c["text"] for c in load_chunks("data/code_travail_chunks.json")][:n_chunks]
+    encoder = load_encoder()
+    encoder(texts[:2])
+    for label, threads in threads_list:
+        torch.set_num_threads(threads)
+        start = time.perf_counter()
+        encoder(texts)
+        print(f"  encodeur {label:<22} {threads:>3} threads: {len(texts) / (time.perf_counter() - start):6.1f} chunks/s")
+
+
+def _ocr_worker(args):
+    page, omp_limit = args
+    import pytesseract
+    if omp_limit:
+        os.environ["OMP_THREAD_LIMIT"] = str(omp_limit)
+    else:
+        os.environ.pop("OMP_THREAD_LIMIT", None)
+    return len(pytesseract.image_to_string(page, lang="fra"))
+
+
+def _bench_ocr(configs, pdf_path="data/LE_MANUEL_DU_TRAVAILLEUR.pdf", n_pages=12):
+    from multiprocessing import Pool
+    from pdf2image import convert_from_path
+
+    pages = convert_from_path(pdf_path, dpi=300, first_page=1, last_page=n_pages)
+    for label, processes, omp_limit in configs:
+        start = time.perf_counter()
+        with Pool(processes=processes) as pool:
+            pool.map(_ocr_worker, [(p, omp_limit) for p in pages])
+        elapsed = time.perf_counter() - start
+        omp = omp_limit if omp_limit else "défaut"
+        print(f"  OCR {label:<27} {processes:>2} processus x OMP {omp}: {60 * len(pages) / elapsed:6.1f} pages/min")
+
+
+def benchmark(profile):
+    budget = plan(profile)
+    cores = budget["cores"]
+    print(f"Profil {profile} sur {cores} cœurs: {describe(budget)}")
+    try:
+        threads = [("profil", budget["encoder_threads"]), ("ancien réglage", 6), ("tous les cœurs", cores)]
+        _bench_encoder(threads)
+    except ImportError as e:
+        print(f"  encodeur: mesure impossible ({e})")
+    if profile == "ingest":
+        try:
+            # OMP 0 = réglage par défaut de tesseract (tous les cœurs par processus)
+            _bench_ocr([("profil", budget["ocr_processes"], budget["tesseract_threads"]),
+                        ("ancien réglage", 6, 0)])
+        except (ImportError, OSError) as e:
+            print(f"  OCR: mesure impossible ({e})")
+
+
+if __name__ == "__main__":
+    # Usage : python resources.py [ingest|serve] [--bench]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    for name in (args or list(PROFILES)):
+        if "--bench" in sys.argv:
+            benchmark(name)
+        else:
+            budget = plan(name)
+            print(f"{name:<7} ({budget['cores']} cœurs): {describe(budget)}")
@@ -0,0 +1,185 @@
+import difflib
+import sys
+import threading
+import time
+from pathlib import Path
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Durée (s) pendant laquelle la transcription partielle doit rester identique
+# avant de lancer la recherche spéculative
+STABLE_INTERVAL = 0.8
+
+# Similarité minimale entre texte spéculé et transcription finale pour réutiliser
+# les passages (ratio difflib sur le texte normalisé)
+SIMILARITY_THRESHOLD = 0.9
+
+# Attente maximale (s) d'une recherche spéculative encore en cours à la fin de la parole
+MAX_WAIT = 5.0
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+class SpeculativeRetriever:
+    """Lance la recherche hybride pendant que l'utilisateur parle encore.
+
+    update_partial() est appelé à chaque transcription partielle Vosk ; quand
+    le texte est stable depuis STABLE_INTERVAL, la recherche démarre dans un
+    thread. resolve() compare la transcription finale au texte spéculé et
+    retourne les passages si elle est assez proche, sinon None.
+
+    Chaque lancement reçoit un numéro de génération : un thread abandonné
+    (attente MAX_WAIT dépassée, ou nouvel énoncé) ne peut plus écrire son
+    résultat, et reste compté comme recherche en cours tant qu'il tourne.
+    """
+
+    def __init__(self, search_fn, top_k=3, alpha=0.5, sources=None,
+                 stable_interval=STABLE_INTERVAL, similarity_threshold=SIMILARITY_THRESHOLD,
+                 clock=time.monotonic):
+        self.search_fn = search_fn
+        self.top_k = top_k
+        self.alpha = alpha
+        self.sources = sources
+        self.stable_interval = stable_interval
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        self.stats = {"utterances": 0, "launched": 0, "hits": 0, "misses": 0,
+                      "saved_seconds": 0.0, "abandoned": 0}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._orphans = []
+        self._spec_thread = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # Le résultat d'une recherche lancée avant reset() sera ignoré
+            self._generation += 1
+            if self._spec_thread is not None and self._spec_thread.is_alive():
+                self._orphans.append(self._spec_thread)
+                self.stats["abandoned"] += 1
+        self._text = ""
+        self._since = self.clock()
+        self._spec_text = None
+        self._spec_thread = None
+        self._spec_result = None
+        self._spec_duration = None
+
+    def update_partial(self, text):
+        text = normalize(text)
+        now = self.clock()
+        if text != self._text:
+            self._text = text
+            self._since = now
+            return
+        if not text or text == self._spec_text:
+            return
+        if now - self._since >= self.stable_interval and not self._search_running():
+            self._launch(text)
+
+    def _search_running(self):
+        # Threads abandonnés encore actifs : ils occupent toujours Milvus et l'encodeur
+        self._orphans = [t for t in self._orphans if t.is_alive()]
+        if self._orphans:
+            return True
+        return self._spec_thread is not None and self._spec_thread.is_alive()
+
+    def _launch(self, text):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self._spec_text = text
+        self._spec_result = None
+        self._spec_duration = None
+        self.stats["launched"] += 1
+
+        def run():
+            start = time.perf_counter()
+            try:
+                result = self.search_fn(text, top_k=self.top_k, alpha=self.alpha,
+                                        return_passages=True, sources=self.sources)
+            except Exception as e:
+                print(f"Erreur recherche spéculative: {e}")
+                result = None
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._spec_duration = time.perf_counter() - start
+                self._spec_result = result
+
+        self._spec_thread = threading.Thread(target=run, daemon=True)
+        self._spec_thread.start()
+
+    def resolve(self, final_text):
+        """Retourne les passages spéculés si la transcription finale correspond"""
+        self.stats["utterances"] += 1
+        final = normalize(final_text)
+        spec_text = self._spec_text
+        if spec_text is None or not final:
+            self.stats["misses"] += 1
+            self.reset()
+            return None
+
+        similarity = difflib.SequenceMatcher(None, spec_text, final).ratio()
+        if similarity < self.similarity_threshold:
+            self.stats["misses"] += 1
+            self.reset()
+            return None
+
+        wait_start = time.perf_counter()
+        if self._spec_thread is not None:
+            self._spec_thread.join(MAX_WAIT)
+        waited = time.perf_counter() - wait_start
+        with self._lock:
+            result, duration = self._spec_result, self._spec_duration
+        self.reset()
+
+        if not result:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.stats["saved_seconds"] += max(0.0, (duration or 0.0) - waited)
+        return result
+
+    def report(self):
+        n = max(self.stats["utterances"], 1)
+        return (f"Spéculation: {self.stats['hits']}/{self.stats['utterances']} réutilisées "
+                f"({100 * self.stats['hits'] / n:.0f} %), {self.stats['launched']} recherches lancées "
+                f"({self.stats['abandoned']} abandonnées), "
+                f"{self.stats['saved_seconds']:.2f} s de latence économisées")
+
+
+# ==============================
+# 2. Évaluation sur des enregistrements
+# ==============================
+def evaluate(fixtures_dir):
+    """Rejoue les .wav au rythme réel de la parole et mesure le taux de réutilisation"""
+    from audio_transcription import BLOCK_FRAMES, SAMPLE_RATE, StreamingTranscriber, decode_audio
+    from hybrid_search import hybrid_search
+
+    files = sorted(Path(fixtures_dir).glob("*.wav"))
+    if not files:
+        print(f"Aucun fichier .wav dans {fixtures_dir}")
+        return
+
+    speculator = SpeculativeRetriever(hybrid_search)
+    step = BLOCK_FRAMES * 2
+    for path in files:
+        pcm = decode_audio(path.read_bytes())
+        transcriber = StreamingTranscriber()
+        for i in range(0, len(pcm), step):
+            partial = transcriber.feed(pcm[i:i + step])
+            speculator.update_partial(partial)
+            time.sleep(BLOCK_FRAMES / SAMPLE_RATE)
+        final = transcriber.finish()
+        hit = speculator.resolve(final) is not None
+        print(f"{path.name}: {'réutilisé' if hit else 'recalculé'} → {final[:60]}")
+
+    print("\n" + speculator.report())
+
+
+if __name__ == "__main__":
+    evaluate(sys.argv[1] if len(sys.argv) > 1 else "data/audio_fixtures")
@@ -0,0 +1,251 @@
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from partitions import partition_name
+
+# ==============================
+# 1. Configuration des bouchons
+# ==============================
+# Valeurs par défaut proches d'une machine CPU avec qwen2.5:3b et BGE-M3
+TOKENS_PER_SECOND = 12.0     # débit de génération simulé
+PREFILL_PER_SECOND = 400.0   # mots du prompt traités par seconde avant le 1er token
+OLLAMA_PARALLEL = 1          # générations simultanées (OLLAMA_NUM_PARALLEL)
+ENCODE_LATENCY = 0.06        # s par appel de l'encodeur simulé
+SEARCH_LATENCY = 0.005       # s par recherche dans le store simulé
+
+DENSE_DIM = 256
+SPARSE_VOCAB = 250002        # taille du vocabulaire sparse de BGE-M3
+
+# ==============================
+# 2. Encodeur simulé (interface BGEM3EmbeddingFunction)
+# ==============================
+class _SparseRow:
+    """Ligne sparse minimale : tocoo().col / .data comme une matrice scipy"""
+
+    def __init__(self, col, data):
+        self.col = col
+        self.data = data
+
+    def tocoo(self):
+        return self
+
+
+class HashingEncoder:
+    """Vecteurs dense et sparse par hachage des mots, sans modèle.
+
+    Même format de sortie que BGEM3EmbeddingFunction ; les scores n'ont pas la
+    qualité de BGE-M3 mais les mots partagés rapprochent bien question et
+    passage, ce qui suffit à exercer la recherche et la fusion.
+    """
+
+    def __init__(self, dim=DENSE_DIM, latency=ENCODE_LATENCY):
+        self.dim = dim
+        self.latency = latency
+
+    def _terms(self, text):
+        counts = {}
+        for word in re.findall(r"\w+", text.lower()):
+            if len(word) > 2:
+                h = zlib.crc32(word.encode("utf-8"))
+                counts[h] = counts.get(h, 0) + 1
+        return counts
+
+    def encode_one(self, text):
+        counts = self._terms(text)
+        dense = np.zeros(self.dim, dtype=np.float32)
+        sparse = {}
+        for h, n in counts.items():
+            weight = 1.0 + np.log(n)
+            dense[h % self.dim] += weight if (h >> 16) & 1 else -weight
+            term = h % SPARSE_VOCAB
+            sparse[term] = sparse.get(term, 0.0) + weight
+        norm = np.linalg.norm(dense)
+        if norm > 0:
+            dense /= norm
+        total = np.sqrt(sum(w * w for w in sparse.values())) or 1.0
+        cols = np.fromiter(sparse.keys(), dtype=np.int64, count=len(sparse))
+        data = np.fromiter((w / total for w in sparse.values()), dtype=np.float32, count=len(sparse))
+        return dense, _SparseRow(cols, data)
+
+    def __call__(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        encoded = [self.encode_one(t) for t in texts]
+        return {"dense": [d for d, _ in encoded], "sparse": [s for _, s in encoded]}
+
+# ==============================
+# 3. Store vectoriel en mémoire (interface Collection de pymilvus)
+# ==============================
+class Hit:
+    __slots__ = ("id", "distance", "entity")
+
+    def __init__(self, id, distance, entity):
+        self.id = id
+        self.distance = distance
+        self.entity = entity
+
+
+class InMemoryCollection:
+    """Recherche exacte dense (produit scalaire) et sparse (index inversé).
+
+    Seuls les arguments utilisés par hybrid_search sont pris en charge ;
+    `expr` n'est pas interprété.
+    """
+
+    def __init__(self, chunks, encoder, latency=SEARCH_LATENCY):
+        self.latency = latency
+        self.rows = [{"source": c["source"], "chunk_index": c["chunk_index"], "text": c["text"]}
+                     for c in chunks]
+        self.partitions = np.array([partition_name(c["source"]) for c in chunks])
+        dense, self.postings = [], {}
+        for row, chunk in enumerate(chunks):
+            vec, sparse = encoder.encode_one(chunk["text"])
+            dense.append(vec)
+            for term, weight in zip(sparse.col.tolist(), sparse.data.tolist()):
+                self.postings.setdefault(term, []).append((row, weight))
+        self.dense = np.stack(dense) if dense else np.zeros((0, encoder.dim), dtype=np.float32)
+
+    def load(self):
+        pass
+
+    def _scores(self, vector, anns_field):
+        if anns_field == "dense":
+            return self.dense @ np.asarray(vector, dtype=np.float32)
+        scores = np.zeros(len(self.rows), dtype=np.float32)
+        for term, q_weight in vector.items():
+            for row, weight in self.postings.get(term, ()):
+                scores[row] += q_weight * weight
+        return scores
+
+    def search(self, data, anns_field, param, limit, expr=None, partition_names=None,
+               output_fields=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        fields = output_fields or []
+        results = []
+        for vector in data:
+            scores = self._scores(vector, anns_field)
+            if partition_names:
+                scores = np.where(np.isin(self.partitions, partition_names), scores, -np.inf)
+            if anns_field == "sparse":
+                scores = np.where(scores > 0, scores, -np.inf)
+            k = min(limit, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+            top = top[np.argsort(-scores[top])]
+            results.append([Hit(int(i), float(scores[i]), {f: self.rows[i][f] for f in fields})
+                            for i in top if np.isfinite(scores[i])])
+        return results
+
+# ==============================
+# 4. Serveur Ollama simulé
+# ==============================
+class FakeOllamaServer:
+    """Serveur HTTP local qui imite /api/tags et /api/generate.
+
+    Le temps de réponse suit celui d'un modèle sur CPU : lecture du prompt à
+    PREFILL_PER_SECOND mots/s puis tokens émis à TOKENS_PER_SECOND ; au plus
+    `parallel` générations en même temps, les autres attendent comme avec
+    Ollama. `error_rate` renvoie des erreurs 500 au hasard.
+    """
+
+    def __init__(self, model_name, tokens_per_second=TOKENS_PER_SECOND,
+                 prefill_per_second=PREFILL_PER_SECOND, parallel=OLLAMA_PARALLEL,
+                 error_rate=0.0, seed=0, port=0):
+        self.model_name = model_name
+        self.tokens_per_second = tokens_per_second
+        self.prefill_per_second = prefill_per_second
+        self.error_rate = error_rate
+        self._slots = threading.Semaphore(parallel)
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "tokens": 0}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _fail(self):
+        with self._random_lock:
+            return self._random.random() < self.error_rate
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": server.model_name}]})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    self._json(404, {"error": "not found"})
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                server.stats["requests"] += 1
+                if server._fail():
+                    server.stats["errors"] += 1
+                    self._json(500, {"error": "simulated failure"})
+                    return
+
+                n_tokens = int(request.get("options", {}).get("num_predict", 128))
+                prompt_words = len(request.get("prompt", "").split())
+                with server._slots:
+                    time.sleep(prompt_words / server.prefill_per_second)
+                    if request.get("stream", True):
+                        self._stream(n_tokens)
+                    else:
+                        time.sleep(n_tokens / server.tokens_per_second)
+                        self._json(200, {"model": server.model_name, "response": _fake_answer(n_tokens),
+                                         "done": True, "eval_count": n_tokens})
+                server.stats["tokens"] += n_tokens
+
+            def _stream(self, n_tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for i in range(n_tokens):
+                    time.sleep(1.0 / server.tokens_per_second)
+                    line = {"model": server.model_name, "response": "mot ", "done": False}
+                    self.wfile.write((json.dumps(line) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write((json.dumps({"model": server.model_name, "response": "",
+                                              "done": True, "eval_count": n_tokens}) + "\n").encode("utf-8"))
+
+        return Handler
+
+
+def _fake_answer(n_tokens):
+    return "Selon les extraits fournis [1], " + " ".join(["mot"] * max(0, n_tokens - 5))
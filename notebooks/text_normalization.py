@@ -0,0 +1,196 @@
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# ==============================
+# 1. Tables de correction
+# ==============================
+# Séquences UTF-8 relues en latin-1/cp1252 (mojibake) -> caractère d'origine.
+# Appliquées en une seule passe, correspondance la plus longue d'abord : "Ã€"
+# n'est plus écrasé par une règle plus courte comme dans l'ancienne chaîne
+# de .replace().
+MOJIBAKE = {
+    "Ã©": "é", "Ã¨": "è", "Ã\xa0": "à", "Ã ": "à", "Ã´": "ô", "Ã®": "î",
+    "Ã¢": "â", "Ã§": "ç", "Ã¹": "ù", "Ãª": "ê", "Ã«": "ë", "Ã¯": "ï",
+    "Ã»": "û", "Ã€": "À", "Ã\x80": "À", "Ã‰": "É", "Ã\x89": "É", "Ã”": "Ô",
+    "Ã\x94": "Ô", "Ã‡": "Ç", "Ãˆ": "È", "ÃŠ": "Ê", "ÃŽ": "Î", "Ã›": "Û",
+    "Å“": "œ", "Å’": "Œ", "â€™": "’", "â€˜": "‘", "â€œ": "“", "â€\x9d": "”",
+    "â€“": "–", "â€”": "—", "â€¦": "…", "Â«": "«", "Â»": "»", "Â°": "°",
+    "Â\xa0": "\xa0",
+}
+
+# Corrections caractère par caractère (une passe, classe de caractères compilée)
+CHAR_MAP = {
+    "\xad": "",      # césure conditionnelle
+    "\xa0": " ",
+    " ": " ",
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "’": "'",
+    "‘": "'",
+}
+CHAR_PATTERN = re.compile("[" + "".join(CHAR_MAP) + "]")
+
+PAGE_SEPARATOR = "\n\n=== NOUVELLE PAGE ===\n\n"
+PAGE_MARKER = re.compile(r"\s*=== NOUVELLE PAGE ===\s*")
+
+# Un en-tête / pied de page doit revenir sur au moins cette part des pages
+HEADER_MIN_FRACTION = 0.05
+# Lignes examinées en haut et en bas de chaque page
+HEADER_ZONE = 3
+
+# ==============================
+# 2. Réparation du mojibake par trie
+# ==============================
+class Trie:
+    """Trie de chaînes compilé en une expression régulière.
+
+    Chaque nœud devient un groupe d'alternatives ; un nœud terminal rend la
+    suite optionnelle, ce qui donne toujours la correspondance la plus longue.
+    """
+
+    def __init__(self, words=()):
+        self.root = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def _pattern(self, node):
+        terminal = "" in node
+        branches = [re.escape(char) + self._pattern(child)
+                    for char, child in sorted(node.items()) if char != ""]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            body = "(?:" + body + ")?"
+        return body
+
+    def compile(self):
+        return re.compile(self._pattern(self.root))
+
+
+MOJIBAKE_PATTERN = Trie(MOJIBAKE).compile()
+MOJIBAKE_LEADS = frozenset(key[0] for key in MOJIBAKE)
+
+
+def repair_mojibake(text):
+    """Corrige toutes les séquences mal encodées en une passe"""
+    # Cas courant : aucun caractère de tête de mojibake, rien à faire
+    if not any(lead in text for lead in MOJIBAKE_LEADS):
+        return text
+    return MOJIBAKE_PATTERN.sub(lambda m: MOJIBAKE[m.group(0)], text)
+
+# ==============================
+# 3. En-têtes, pieds de page, césures
+# ==============================
+def _line_signature(line):
+    return re.sub(r"\d+", "#", line.strip().lower())
+
+
+def find_running_lines(pages, min_fraction=HEADER_MIN_FRACTION, zone=HEADER_ZONE):
+    """Signatures des lignes répétées en haut/bas de page (numéros remplacés par #)"""
+    counts = Counter()
+    for page in pages:
+        lines = [l for l in page.split("\n") if l.strip()]
+        counts.update({_line_signature(l) for l in lines[:zone] + lines[-zone:]})
+    threshold = max(2, int(len(pages) * min_fraction))
+    return {sig for sig, n in counts.items() if n >= threshold}
+
+
+def strip_running_lines(page, running, zone=HEADER_ZONE):
+    """Retire en-têtes, pieds de page et numéros de page isolés d'une page"""
+    lines = page.split("\n")
+    content = [i for i, l in enumerate(lines) if l.strip()]
+    edge = set(content[:zone] + content[-zone:])
+    kept = []
+    for i, line in enumerate(lines):
+        if i in edge:
+            sig = _line_signature(line)
+            if sig in running or sig == "#":
+                continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+HYPHEN_BREAK = re.compile(r"(\w+)-\n\s*(\w+)")
+
+
+def rejoin_hyphenated(text):
+    """Recolle les mots coupés en fin de ligne.
+
+    "tra-\\nvailleur" -> "travailleur" si la forme collée existe ailleurs dans
+    le document ; sinon le trait d'union est gardé ("soixante-\\ntreize" ->
+    "soixante-treize").
+    """
+    vocabulary = set(re.findall(r"\w+", text.lower()))
+
+    def join(m):
+        left, right = m.group(1), m.group(2)
+        if (left + right).lower() in vocabulary:
+            return left + right
+        return f"{left}-{right}"
+
+    return HYPHEN_BREAK.sub(join, text)
+
+# ==============================
+# 4. Pipeline complet
+# ==============================
+def normalize_page(text):
+    """Corrections d'une page OCR isolée (encodage et caractères)"""
+    return CHAR_PATTERN.sub(lambda m: CHAR_MAP[m.group(0)], repair_mojibake(text))
+
+
+def normalize_document(raw_text):
+    """Normalise un texte OCR complet (pages séparées par === NOUVELLE PAGE ===)"""
+    pages = [normalize_page(p) for p in PAGE_MARKER.split(raw_text)]
+    running = find_running_lines(pages)
+    pages = [strip_running_lines(p, running) for p in pages]
+    return rejoin_hyphenated("\n\n".join(p.strip() for p in pages if p.strip()))
+
+# ==============================
+# 5. Benchmark et rapport de chunking
+# ==============================
+def _legacy_cleanup(text):
+    """Ancienne chaîne de .replace() de manuel_ocr.py (référence de débit)"""
+    corrected = text.replace("Ã©", "é").replace("Ã¨", "è").replace("Ã ", "à")
+    corrected = corrected.replace("Ã´", "ô").replace("Ã®", "î").replace("Ã¢", "â")
+    corrected = corrected.replace("Ã§", "ç").replace("Ã¹", "ù").replace("Ãª", "ê")
+    corrected = corrected.replace("Ã«", "ë").replace("Ã¯", "ï").replace("Ã»", "û")
+    corrected = corrected.replace("Ã", "À").replace("Ã‰", "É").replace("Ã", "Ô")
+    return corrected
+
+
+def benchmark(path, repeat=5):
+    from chunking import clean_text, split_into_chunks
+
+    raw = Path(path).read_text(encoding="utf-8")
+    size_mb = len(raw.encode("utf-8")) / 2**20
+    pages = raw.split(PAGE_SEPARATOR)
+
+    for label, func in [("chaîne .replace() (par page)", lambda: [_legacy_cleanup(p) for p in pages]),
+                        ("normalize_page (par page)", lambda: [normalize_page(p) for p in pages]),
+                        ("normalize_document (complet)", lambda: normalize_document(raw))]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{label:<32} {size_mb / elapsed:8.1f} Mo/s")
+
+    normalized = normalize_document(raw)
+    before = split_into_chunks(clean_text(raw))
+    after = split_into_chunks(clean_text(normalized))
+    print(f"\nChunks avant: {len(before)}, après: {len(after)} "
+          f"({len(raw.split())} → {len(normalized.split())} mots)")
+    print(f"Marqueurs de page restants: {normalized.count('NOUVELLE PAGE')}")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "data/manuel_ocr.txt")
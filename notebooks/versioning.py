@@ -0,0 +1,359 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from context_expansion import INDEX_CHUNK_FILES, INDEX_DEDUP_MAP_PATH
+
+# ==============================
+# 1. Configuration
+# ==============================
+# Chaque réindexation complète crée une nouvelle collection
+# chatbot_chunks_hybrid_v{n} ; l'application interroge l'alias ALIAS, basculé
+# d'une version à l'autre en une opération atomique une fois la nouvelle
+# version vérifiée.
+BASE_NAME = "chatbot_chunks_hybrid"
+LEGACY_NAME = BASE_NAME                 # collection unique d'avant le versionnement
+ALIAS = "chatbot_chunks_live"
+VERSION_PATTERN = re.compile(rf"^{BASE_NAME}_v(\d+)$")
+
+# Une version remplacée reste chargée (retour arrière immédiat) pendant ce
+# délai, puis est supprimée par gc()
+GRACE_PERIOD = float(os.environ.get("CHATBOT_INDEX_GRACE", str(24 * 3600)))
+STATE_PATH = Path("data") / "collection_versions.json"
+
+# Contrôles avant promotion
+MIN_ENTITY_RATIO = 0.98      # chunks indexés / chunks attendus
+MAX_RECALL_DROP = 0.05       # baisse de hit@5 tolérée par rapport à la version servie
+MIN_HIT_RATE = 0.5           # hit@5 minimal s'il n'y a pas de version servie
+CHECK_QUESTIONS = 40
+
+# Chunks du mode d'index (petits chunks si CHATBOT_SMALL_TO_BIG=1)
+CHUNK_FILES = INDEX_CHUNK_FILES
+
+# Fichiers locaux lus au moment de la requête, figés avec chaque version dans
+# data/versions/<collection>/ : la version servie et ses fichiers changent
+# ensemble (promotion et retour arrière), sans redémarrage. Les fichiers de
+# data/ sont ceux de la prochaine version, réécrits par le pipeline.
+SIDECAR_ROOT = Path("data") / "versions"
+SIDECAR_FILES = [Path("data") / name for name in (
+    "chunk_store.bin", "chunk_store.json", "chunk_store_small.bin", "chunk_store_small.json",
+    "dedup_map.json", "dedup_map_small.json", "article_index.json",
+    "code_travail_chunks.json", "manuel_chunks.json", "dense_fp32.npy", "dense_fp32.json")]
+
+# ==============================
+# 2. Versions et alias
+# ==============================
+def version_name(n):
+    return f"{BASE_NAME}_v{n}"
+
+
+def list_versions():
+    from pymilvus import utility
+
+    versions = []
+    for name in utility.list_collections():
+        m = VERSION_PATTERN.match(name)
+        if m:
+            versions.append((int(m.group(1)), name))
+    return [name for _, name in sorted(versions)]
+
+
+def next_version_name():
+    numbers = [int(VERSION_PATTERN.match(n).group(1)) for n in list_versions()]
+    return version_name(max(numbers, default=0) + 1)
+
+
+def live_collection_name():
+    """Collection actuellement derrière l'alias, ou None"""
+    from pymilvus import utility
+
+    for name in list_versions() + [LEGACY_NAME]:
+        if utility.has_collection(name) and ALIAS in utility.list_aliases(name):
+            return name
+    return None
+
+
+def resolve_collection_name():
+    """Nom à ouvrir pour servir : l'alias s'il existe, sinon l'ancienne collection unique"""
+    return ALIAS if live_collection_name() is not None else LEGACY_NAME
+
+
+def sidecar_dir(name):
+    """Dossier des fichiers figés d'une version, None s'il n'existe pas (versions d'avant)"""
+    directory = SIDECAR_ROOT / name
+    return directory if directory.is_dir() else None
+
+
+def sidecar_path(path, directory):
+    """Chemin d'un fichier local dans le dossier d'une version (data/ si None)"""
+    return Path(directory) / Path(path).name if directory is not None else Path(path)
+
+
+def snapshot_sidecars(name, files=SIDECAR_FILES):
+    """Copie les fichiers locaux de data/ dans data/versions/<name>/ (dossier renommé à la fin)"""
+    target = SIDECAR_ROOT / name
+    tmp = SIDECAR_ROOT / f"{name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for path in files:
+        if path.exists():
+            shutil.copy2(path, tmp / path.name)
+    # L'index des articles désigne ses fichiers de chunks : ceux de la version
+    article_index = tmp / "article_index.json"
+    if article_index.exists():
+        with open(article_index, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        payload["chunk_files"] = [str(target / Path(p).name) for p in payload["chunk_files"]]
+        with open(article_index, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+    shutil.rmtree(target, ignore_errors=True)
+    tmp.rename(target)
+    return target
+
+
+def served_version():
+    """Version servie d'après data/collection_versions.json (sans appel à Milvus), ou None"""
+    state = _load_state()
+    return state.get("live") or (state["history"][-1]["name"] if state["history"] else None)
+
+
+class SidecarWatcher:
+    """Détecte une promotion (ou un retour arrière) faite par un autre processus.
+
+    poll() ne coûte qu'un stat() du fichier d'état ; il rend le dossier des
+    fichiers de la nouvelle version servie quand elle change, sinon False.
+    """
+
+    def __init__(self):
+        self._mtime = None
+        self.version = None
+
+    def poll(self):
+        try:
+            mtime = STATE_PATH.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        version = served_version() if mtime is not None else None
+        if version == self.version:
+            return False
+        self.version = version
+        return sidecar_dir(version) if version else None
+
+
+def _load_state():
+    if STATE_PATH.exists():
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"retired": {}, "history": [], "live": None}
+
+
+def _save_state(state):
+    tmp = STATE_PATH.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    tmp.replace(STATE_PATH)
+
+# ==============================
+# 3. Contrôle avant promotion
+# ==============================
+def expected_chunk_count(files=CHUNK_FILES):
+    """Chunks qu'embed_insert doit indexer (alias de doublons exclus)"""
+    from chunk_store import load_chunks
+    from dedup import SKIP_EMBED_THRESHOLD, drop_aliases, load_alias_map
+
+    chunks = [c for path in files for c in load_chunks(path)]
+    return len(drop_aliases(chunks, load_alias_map(INDEX_DEDUP_MAP_PATH, min_similarity=SKIP_EMBED_THRESHOLD)))
+
+
+def hit_rate(collection, questions, top_k=5):
+    """hit@k de hybrid_search sur une collection donnée (questions étiquetées)"""
+    import hybrid_search as hs
+
+    served = hs.collection, hs.sidecars()
+    hs.collection = collection
+    hs.open_sidecars(sidecar_dir(collection.name))
+    try:
+        hits = 0
+        for q in questions:
+            passages = hs.hybrid_search(q["question"], top_k=top_k, adaptive=False, refresh=False)
+            hits += hs.label_hit(q["expected"], [hs.chunk_key(p["source"], p["chunk_index"]) for p in passages])
+        return hits / len(questions)
+    finally:
+        hs.collection = served[0]
+        hs.restore_sidecars(served[1])
+
+
+def check_version(name, n_questions=CHECK_QUESTIONS):
+    """Vérifie une version candidate -> (ok, liste des problèmes)"""
+    from pymilvus import Collection, utility
+    import hybrid_search as hs
+    from partitions import list_corpora, load_corpora, partition_name
+
+    candidate = Collection(name)
+    candidate.load()
+    problems = []
+
+    count, expected = candidate.num_entities, expected_chunk_count()
+    print(f"{name}: {count} chunks indexés / {expected} attendus")
+    if count < MIN_ENTITY_RATIO * expected:
+        problems.append(f"{count} chunks indexés pour {expected} attendus")
+    counts = dict(list_corpora(candidate))
+    # Corpus déclarés aujourd'hui : un document retiré de data/documents.json
+    # n'est plus attendu dans la version candidate
+    for source in load_corpora():
+        partition = partition_name(source)
+        if counts.get(partition, 0) == 0:
+            problems.append(f"partition {partition} vide")
+
+    questions = hs.labeled_questions(n_questions)
+    candidate_hits = hit_rate(candidate, questions)
+    live = live_collection_name() or (LEGACY_NAME if utility.has_collection(LEGACY_NAME) else None)
+    if live is not None and live != name:
+        live_hits = hit_rate(Collection(live), questions)
+        print(f"hit@5: {candidate_hits:.2f} (candidate) / {live_hits:.2f} ({live})")
+        if candidate_hits < live_hits - MAX_RECALL_DROP:
+            problems.append(f"hit@5 {candidate_hits:.2f} < {live_hits:.2f} - {MAX_RECALL_DROP}")
+    else:
+        print(f"hit@5: {candidate_hits:.2f} (aucune version servie)")
+        if candidate_hits < MIN_HIT_RATE:
+            problems.append(f"hit@5 {candidate_hits:.2f} < {MIN_HIT_RATE}")
+
+    for problem in problems:
+        print(f"  ÉCHEC: {problem}")
+    return not problems, problems
+
+# ==============================
+# 4. Promotion, retour arrière, nettoyage
+# ==============================
+def promote(name, force=False):
+    """Bascule l'alias sur `name` après contrôle ; l'ancienne version est mise en sursis"""
+    from pymilvus import Collection, utility
+
+    # Sans ses fichiers locaux, la version servirait ceux de data/, construits
+    # pour une autre collection (même avec --force)
+    if sidecar_dir(name) is None:
+        print(f"Promotion de {name} refusée : {SIDECAR_ROOT / name} absent "
+              f"(versions construites avec `python versioning.py build` uniquement)")
+        return False
+    if not force:
+        ok, _ = check_version(name)
+        if not ok:
+            print(f"Promotion de {name} refusée")
+            return False
+    Collection(name).load()
+
+    previous = live_collection_name()
+    if previous == name:
+        print(f"{name} est déjà servie")
+        return True
+    if previous is None:
+        utility.create_alias(name, ALIAS)
+    else:
+        utility.alter_alias(name, ALIAS)
+
+    state = _load_state()
+    state["retired"].pop(name, None)
+    state["live"] = name
+    # Avant le premier alias, l'application servait directement l'ancienne collection
+    retired = previous or (LEGACY_NAME if utility.has_collection(LEGACY_NAME) else None)
+    if retired is not None:
+        state["retired"][retired] = time.time()
+    state["history"].append({"name": name, "promoted_at": time.time()})
+    _save_state(state)
+    print(f"Alias '{ALIAS}' → {name}" + (f" (remplace {retired}, supprimée après {GRACE_PERIOD / 3600:.0f} h)"
+                                         if retired else ""))
+    if previous is None and retired == LEGACY_NAME:
+        print(f"Redémarrer l'application pour qu'elle passe de '{LEGACY_NAME}' à l'alias")
+    gc()
+    return True
+
+
+def rollback():
+    """Revient à la version remplacée la plus récente encore présente"""
+    from pymilvus import utility
+
+    state = _load_state()
+    candidates = sorted(((t, n) for n, t in state["retired"].items() if utility.has_collection(n)), reverse=True)
+    if not candidates:
+        print("Aucune version précédente disponible")
+        return False
+    return promote(candidates[0][1], force=True)
+
+
+def gc(grace=GRACE_PERIOD):
+    """Supprime les versions remplacées depuis plus de `grace` secondes"""
+    from pymilvus import utility
+
+    state = _load_state()
+    live = live_collection_name()
+    now = time.time()
+    for name, retired_at in list(state["retired"].items()):
+        if name == live:
+            state["retired"].pop(name)
+        elif now - retired_at >= grace:
+            if utility.has_collection(name):
+                utility.drop_collection(name)
+                print(f"Version {name} supprimée (remplacée il y a {(now - retired_at) / 3600:.1f} h)")
+            shutil.rmtree(SIDECAR_ROOT / name, ignore_errors=True)
+            state["retired"].pop(name)
+    _save_state(state)
+
+
+def build(files=None):
+    """Réindexation complète dans une nouvelle version, puis promotion si elle passe les contrôles"""
+    from create_collection import create_hybrid_collection
+
+    name = next_version_name()
+    start = time.time()
+    create_hybrid_collection(name)
+    env = dict(os.environ, CHATBOT_INGEST_COLLECTION=name)
+    script = Path(__file__).with_name("embed_insert.py")
+    subprocess.run([sys.executable, str(script), *[str(f) for f in (files or CHUNK_FILES)]], env=env, check=True)
+    snapshot_sidecars(name)
+    print(f"{name} construite en {(time.time() - start) / 60:.1f} min, la version servie n'a pas été touchée")
+    return promote(name)
+
+
+def status():
+    from pymilvus import Collection
+
+    live = live_collection_name()
+    state = _load_state()
+    print(f"Alias '{ALIAS}' → {live or 'aucune (ancienne collection ' + LEGACY_NAME + ')'}")
+    for name in list_versions():
+        tag = "servie" if name == live else (
+            f"remplacée il y a {(time.time() - state['retired'][name]) / 3600:.1f} h"
+            if name in state["retired"] else "non promue")
+        print(f"  {name}: {Collection(name).num_entities} chunks, {tag}")
+
+
+if __name__ == "__main__":
+    # Usage : python versioning.py status | build | check <nom> | promote <nom> [--force]
+    #                              | rollback | gc [délai_s]
+    from pymilvus import connections
+
+    connections.connect("default", host="localhost", port="19530")
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "build":
+        ok = build()
+    elif command == "check":
+        ok = check_version(sys.argv[2])[0]
+    elif command == "promote":
+        ok = promote(sys.argv[2], force="--force" in sys.argv)
+    elif command == "rollback":
+        ok = rollback()
+    elif command == "gc":
+        gc(float(sys.argv[2]) if len(sys.argv) > 2 else GRACE_PERIOD)
+        ok = True
+    else:
+        status()
+        ok = True
+    sys.exit(0 if ok else 1)